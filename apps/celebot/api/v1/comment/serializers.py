@@ -0,0 +1,90 @@
+from django.apps import apps
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+
+from rest_framework import serializers
+
+from apps.person.api.v1.profile.serializers import RetrieveProfileSerializer
+from ....comments import create_comment, with_parent
+
+Comment = apps.get_registered_model('celebot', 'Comment')
+Translate = apps.get_registered_model('celebot', 'Translate')
+
+
+class BaseCommentSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Comment
+        fields = '__all__'
+
+
+class ListCommentSerializer(BaseCommentSerializer):
+    user = serializers.UUIDField(source='user.uuid')
+    profile = RetrieveProfileSerializer(source='user.profile')
+    translate = serializers.UUIDField(source='translate.uuid')
+
+    # set by apps.celebot.comments
+    parent = serializers.UUIDField(source='parent_uuid', read_only=True)
+    replies = serializers.SerializerMethodField(read_only=True)
+
+    class Meta(BaseCommentSerializer.Meta):
+        fields = ('uuid', 'user', 'profile', 'translate', 'parent',
+                  'depth', 'content', 'reply_count', 'create_at',
+                  'replies',)
+
+    def get_replies(self, instance):
+        serializer = ListCommentSerializer(
+            getattr(instance, 'thread_replies', []),
+            context=self.context,
+            many=True
+        )
+        return serializer.data
+
+
+class CreateCommentSerializer(BaseCommentSerializer):
+    user = serializers.HiddenField(default=serializers.CurrentUserDefault())
+    parent = serializers.SlugRelatedField(
+        slug_field='uuid',
+        queryset=Comment.objects.all(),
+        required=False,
+        allow_null=True
+    )
+    translate = serializers.SlugRelatedField(
+        slug_field='uuid',
+        queryset=Translate.objects.all(),
+        required=False
+    )
+
+    class Meta(BaseCommentSerializer.Meta):
+        fields = ('user', 'parent', 'translate', 'content',)
+
+    def validate(self, attrs):
+        pain = self.context['pain']
+        parent = attrs.get('parent')
+        translate = attrs.get('translate')
+
+        if parent is not None and parent.pain_id != pain.id:
+            raise serializers.ValidationError({
+                'parent': _("Comment not found in this pain.")
+            })
+
+        if translate is not None and translate.pain_id != pain.id:
+            raise serializers.ValidationError({
+                'translate': _("Translate not found in this pain.")
+            })
+
+        # reply on the translate of the parent, else the first one
+        if translate is None:
+            if parent is not None:
+                attrs['translate'] = parent.translate
+            else:
+                attrs['translate'] = pain.translates.order_by('id').first()
+        return attrs
+
+    def to_representation(self, instance):
+        instance = with_parent(Comment.objects.filter(id=instance.id)).get()
+        serializer = ListCommentSerializer(instance, context=self.context)
+        return serializer.data
+
+    @transaction.atomic
+    def create(self, validated_data):
+        return create_comment(pain=self.context['pain'], **validated_data)
@@ -0,0 +1,154 @@
+from django.apps import apps
+from django.core.exceptions import ObjectDoesNotExist, ValidationError as DjangoValidationError
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+
+from rest_framework import viewsets, status as response_status
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.throttling import UserRateThrottle
+
+from ....comments import attach_replies, delete_comment, get_thread, with_parent
+from ....conf import settings
+from ....helpers import KeysetPagination, build_result_pagination
+from .serializers import CreateCommentSerializer, ListCommentSerializer
+
+Pain = apps.get_registered_model('celebot', 'Pain')
+Comment = apps.get_registered_model('celebot', 'Comment')
+
+# Define to avoid used ...().paginate__
+_KEYSET_PAGINATOR = KeysetPagination(ordering=('create_at', 'id'))
+
+
+class BaseViewSet(viewsets.ViewSet):
+    def __init__(self, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.context = dict()
+
+    def initialize_request(self, request, *args, **kwargs):
+        self.context.update({'request': request})
+        return super().initialize_request(request, *args, **kwargs)
+
+
+class CommentViewSet(BaseViewSet):
+    """
+    GET
+    -----
+        ../pains/<uuid64>/comments/?cursor=<string>&limit=<int>&replies=<int>
+            top-level comments, oldest first, with their first
+            direct replies inlined
+        ../pains/<uuid64>/comments/<uuid64>/?depth=<int>
+            the comment and its replies nested, every level
+            without ?depth=
+
+
+    POST
+    -----
+        {
+            "content": "string",
+            "parent": "uuid64",
+            "translate": "uuid64"
+        }
+        parent and translate optional
+
+
+    DELETE
+    -----
+        ../pains/<uuid64>/comments/<uuid64>/
+            the comment and all its replies
+    """
+    lookup_field = 'uuid'
+    permission_classes = (IsAuthenticated,)
+    throttle_classes = (UserRateThrottle,)
+
+    def get_pain(self):
+        try:
+            return Pain.objects.get(uuid=self.kwargs['pain_uuid'])
+        except (ObjectDoesNotExist, DjangoValidationError):
+            raise NotFound()
+
+    def queryset(self):
+        return Comment.objects.filter(pain__uuid=self.kwargs['pain_uuid'])
+
+    def queryset_instance(self, uuid, for_update=False):
+        try:
+            if for_update:
+                return self.queryset().select_for_update() \
+                    .get(uuid=uuid, user_id=self.request.user.id)
+            return with_parent(self.queryset()).get(uuid=uuid)
+        except (ObjectDoesNotExist, DjangoValidationError):
+            raise NotFound()
+
+    def get_int_param(self, name, default, maximum):
+        value = self.request.query_params.get(name, None)
+        if value is None:
+            return default
+
+        try:
+            value = int(value)
+        except ValueError:
+            raise ValidationError(detail={name: _("Must be an integer.")})
+        return max(0, min(value, maximum))
+
+    @transaction.atomic
+    def create(self, request, pain_uuid=None, format=None):
+        self.context.update({'pain': self.get_pain()})
+        serializer = CreateCommentSerializer(
+            data=request.data,
+            context=self.context
+        )
+
+        if serializer.is_valid(raise_exception=True):
+            try:
+                serializer.save()
+            except DjangoValidationError as e:
+                raise ValidationError(detail=str(e))
+            return Response(serializer.data, status=response_status.HTTP_201_CREATED)
+        return Response(serializer.errors, status=response_status.HTTP_406_NOT_ACCEPTABLE)
+
+    def list(self, request, pain_uuid=None, format=None):
+        pain = self.get_pain()
+        replies = self.get_int_param(
+            'replies',
+            settings.CELEBOT_COMMENT_INLINE_REPLIES,
+            settings.CELEBOT_COMMENT_INLINE_REPLIES_MAX
+        )
+
+        queryset = with_parent(Comment.objects.filter(pain=pain, depth=0))
+        paginator = _KEYSET_PAGINATOR.paginate_queryset(queryset, request)
+
+        serializer = ListCommentSerializer(
+            attach_replies(paginator, replies),
+            context=self.context,
+            many=True
+        )
+
+        results = build_result_pagination(self, _KEYSET_PAGINATOR, serializer)
+        return Response(results, status=response_status.HTTP_200_OK)
+
+    def retrieve(self, request, pain_uuid=None, uuid=None, format=None):
+        instance = self.queryset_instance(uuid)
+        depth = None
+        if 'depth' in request.query_params:
+            depth = self.get_int_param('depth', None, 2 ** 15)
+
+        serializer = ListCommentSerializer(
+            get_thread(instance, depth=depth),
+            context=self.context
+        )
+        return Response(serializer.data, status=response_status.HTTP_200_OK)
+
+    @transaction.atomic
+    def destroy(self, request, pain_uuid=None, uuid=None, format=None):
+        instance = self.queryset_instance(uuid, for_update=True)
+
+        # serialize for response before the subtree is gone
+        serializer = ListCommentSerializer(
+            with_parent(Comment.objects.filter(id=instance.id)).get(),
+            context=self.context
+        )
+        data = serializer.data
+
+        delete_comment(instance)
+        return Response(data, status=response_status.HTTP_200_OK)
@@ -1,15 +1,50 @@
 from django.apps import apps
 from django.db import transaction
-from django.db.models import Count, Q
 from django.db.models.expressions import Exists, Subquery
+from django.utils.translation import gettext_lazy as _
 
 from rest_framework import serializers
+from rest_framework.settings import api_settings
 
 from apps.person.api.v1.profile.serializers import RetrieveProfileSerializer
+from .... import buffer, live, stats, trending
+from ....caches import bump_pains
+from ....conf import settings
 
 Pain = apps.get_registered_model('celebot', 'Pain')
 Translate = apps.get_registered_model('celebot', 'Translate')
 Reaction = apps.get_registered_model('celebot', 'Reaction')
+PainReactionStats = apps.get_registered_model('celebot', 'PainReactionStats')
+
+
+def save_reactions(rows, user):
+    """
+    Write through the buffer when enabled, otherwise upsert now and
+    move the counters. Same :rows and return as `Reaction.objects.upsert()`
+    """
+    pains = Pain.objects \
+        .filter(id__in={x['pain_id'] for x in rows}) \
+        .values_list('id', 'uuid')
+    pains = list(pains)
+
+    if buffer.is_enabled():
+        changes = buffer.record(rows)
+    else:
+        changes = Reaction.objects.upsert(rows, user=user)
+
+        PainReactionStats.objects.apply_changes([
+            (x.pain_id, x.identifier, previous) for x, previous in changes
+        ])
+
+        trending.record_many([
+            (x.pain_id, x.identifier) for x, previous in changes if previous is None
+        ])
+
+        # the upsert skip the signals
+        bump_pains([x[1] for x in pains])
+
+    live.publish_stats(pains)
+    return changes
 
 
 class BaseReactionSerializer(serializers.ModelSerializer):
@@ -20,7 +55,6 @@ class BaseReactionSerializer(serializers.ModelSerializer):
 
 class ListReactionSerializer(BaseReactionSerializer):
     user = serializers.CharField(source='user.uuid')
-    pain = serializers.UUIDField(source='pain.uuid')
     profile = RetrieveProfileSerializer(source='user.profile')
 
     class Meta(BaseReactionSerializer.Meta):
@@ -28,6 +62,7 @@ class ListReactionSerializer(BaseReactionSerializer):
 
 
 class RetrieveReactionSerializer(ListReactionSerializer):
+    pain = serializers.UUIDField(source='pain.uuid')
     stat = serializers.SerializerMethodField()
 
     class Meta(ListReactionSerializer.Meta):
@@ -35,20 +70,12 @@ class RetrieveReactionSerializer(ListReactionSerializer):
                   'pain', 'identifier', 'create_at', 'stat',)
 
     def get_stat(self, instance):
-        model = instance._meta.model
-        counts = {
-            x.value: Count(
-                'id',
-                filter=Q(identifier=x.value)
-            ) for x in model.Identifiers
-        }
-
-        ret = model.objects \
-            .filter(pain_id=instance.pain.id) \
-            .aggregate(total=Count('identifier'), **counts)
+        # read again when the request just wrote the counters
+        refresh = self.context.get('refresh_stat', False)
+        stat = stats.get_stat(instance.pain_id, refresh=refresh)
 
-        sorted_ret = sorted(ret.items(), key=lambda x: x[1], reverse=True)
-        return {x[0]: x[1] for x in sorted_ret}
+        deltas = buffer.get_deltas([instance.pain_id])
+        return buffer.merge_stat(stat, deltas.get(instance.pain_id))
 
 
 class CreateReactionSerializer(BaseReactionSerializer):
@@ -66,19 +93,23 @@ class CreateReactionSerializer(BaseReactionSerializer):
         fields = ('user', 'pain', 'identifier', 'translate',)
 
     def to_representation(self, instance):
-        serializer = RetrieveReactionSerializer(instance, context=self.context)
+        context = dict(self.context, refresh_stat=not buffer.is_enabled())
+        serializer = RetrieveReactionSerializer(instance, context=context)
         return serializer.data
 
     @transaction.atomic
     def create(self, validated_data):
-        identifier = validated_data.pop('identifier', None)
-        defaults = {'identifier': identifier}
-
-        instance, _created = Reaction.objects.update_or_create(
-            defaults=defaults,
-            **validated_data
-        )
-
+        user = validated_data['user']
+        (instance, _previous), = save_reactions([{
+            'user_id': user.id,
+            'pain_id': validated_data['pain'].id,
+            'translate_id': validated_data['translate'].id,
+            'identifier': validated_data['identifier'],
+        }], user=user)
+
+        instance.user = user
+        instance.pain = validated_data['pain']
+        instance.translate = validated_data['translate']
         return instance
 
 
@@ -87,17 +118,116 @@ class UpdateReactionSerializer(BaseReactionSerializer):
         fields = ('identifier',)
 
     def to_representation(self, instance):
-        serializer = RetrieveReactionSerializer(instance, context=self.context)
+        context = dict(self.context, refresh_stat=not buffer.is_enabled())
+        serializer = RetrieveReactionSerializer(instance, context=context)
         return serializer.data
 
     @transaction.atomic
     def update(self, instance, validated_data):
-        identifier = validated_data.pop('identifier', None)
-        defaults = {'identifier': identifier}
+        identifier = validated_data.get('identifier', instance.identifier)
+        save_reactions([{
+            'user_id': instance.user_id,
+            'pain_id': instance.pain_id,
+            'translate_id': instance.translate_id,
+            'identifier': identifier,
+        }], user=instance.user)
+
+        instance.identifier = identifier
+        return instance
 
-        instance, _created = Reaction.objects.update_or_create(
-            defaults=defaults,
-            **validated_data
-        )
 
-        return instance
+class BatchCreateReactionSerializer(serializers.ListSerializer):
+    """
+    React to many pains at once, one reaction per pain for the user.
+    Uuids resolved with two queries, writes applied in bulk
+    """
+
+    def to_internal_value(self, data):
+        max_size = settings.CELEBOT_REACTION_BATCH_MAX_SIZE
+        if isinstance(data, list) and len(data) > max_size:
+            raise serializers.ValidationError({
+                api_settings.NON_FIELD_ERRORS_KEY: [
+                    _("Ensure this batch has no more than %(max)s items.")
+                    % {'max': max_size}
+                ]
+            })
+
+        ret = super().to_internal_value(data)
+
+        pains = Pain.objects \
+            .filter(uuid__in={x['pain'] for x in ret}) \
+            .values_list('uuid', 'id')
+        pains = dict(pains)
+
+        translates = Translate.objects \
+            .filter(uuid__in={x['translate'] for x in ret}) \
+            .values_list('uuid', 'id', 'pain_id')
+        translates = {x[0]: x[1:] for x in translates}
+
+        errors = list()
+        for item in ret:
+            error = dict()
+            pain_id = pains.get(item['pain'])
+            translate = translates.get(item['translate'])
+
+            if pain_id is None:
+                error['pain'] = [_("Pain not found.")]
+            if translate is None or translate[1] != pain_id:
+                error['translate'] = [_("Translate not found.")]
+
+            if not error:
+                item['pain_id'] = pain_id
+                item['translate_id'] = translate[0]
+            errors.append(error)
+
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return ret
+
+    def to_representation(self, data):
+        stats = PainReactionStats.objects \
+            .filter(pain_id__in={x.pain_id for x in data})
+        stats = {x.pain_id: x.to_stat() for x in stats}
+        deltas = buffer.get_deltas({x.pain_id for x in data})
+
+        ret = list()
+        for instance in data:
+            stat = stats.get(instance.pain_id)
+            if stat is None:
+                stat = PainReactionStats(pain_id=instance.pain_id).to_stat()
+
+            ret.append({
+                'uuid': instance.uuid,
+                'pain': instance.pain_uuid,
+                'translate': instance.translate_uuid,
+                'identifier': instance.identifier,
+                'stat': buffer.merge_stat(stat, deltas.get(instance.pain_id)),
+            })
+        return ret
+
+    @transaction.atomic
+    def create(self, validated_data):
+        user = self.context['request'].user
+        changes = save_reactions([
+            {
+                'user_id': user.id,
+                'pain_id': x['pain_id'],
+                'translate_id': x['translate_id'],
+                'identifier': x['identifier'],
+            } for x in validated_data
+        ], user=user)
+
+        uuids = {x['pain_id']: x for x in validated_data}
+        for instance, _previous in changes:
+            instance.pain_uuid = uuids[instance.pain_id]['pain']
+            instance.translate_uuid = uuids[instance.pain_id]['translate']
+        return [x[0] for x in changes]
+
+
+class CreateBatchReactionSerializer(serializers.Serializer):
+    pain = serializers.UUIDField()
+    translate = serializers.UUIDField()
+    identifier = serializers.ChoiceField(choices=Reaction.Identifiers.choices)
+
+    class Meta:
+        list_serializer_class = BatchCreateReactionSerializer
@@ -4,19 +4,30 @@ from django.db import transaction
 from django.utils.translation import gettext_lazy as _
 
 from rest_framework import viewsets, status as response_status
+from rest_framework.decorators import action
 from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.pagination import LimitOffsetPagination
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.throttling import UserRateThrottle
 
-from ....helpers import build_result_pagination
-from .serializers import CreateReactionSerializer, ListReactionSerializer, UpdateReactionSerializer
+from .... import buffer, rollups
+from ....helpers import KeysetPagination, build_result_pagination, get_timeline_window
+from .serializers import (
+    CreateBatchReactionSerializer,
+    CreateReactionSerializer,
+    ListReactionSerializer,
+    UpdateReactionSerializer
+)
 
+Pain = apps.get_registered_model('celebot', 'Pain')
 Reaction = apps.get_registered_model('celebot', 'Reaction')
+ReactionRollup = apps.get_registered_model('celebot', 'ReactionRollup')
+TagReactionRollup = apps.get_registered_model('celebot', 'TagReactionRollup')
 
 # Define to avoid used ...().paginate__
 _PAGINATOR = LimitOffsetPagination()
+_KEYSET_PAGINATOR = KeysetPagination()
 
 
 class BaseViewSet(viewsets.ViewSet):
@@ -35,6 +46,11 @@ class ReactionViewSet(BaseViewSet):
     -----
 
         /reactions/?pain=<uuid64>&identifier=<string>
+        /reactions/?pain=<uuid64>&cursor=<string>&limit=<int>
+        /reactions/timeline/?granularity=hour|day&since=<datetime>&until=<datetime>
+        /reactions/timeline/?tag=<slug>
+            reactions given per bucket, read from the rollups
+            by tag only the total
 
 
     POST
@@ -46,6 +62,10 @@ class ReactionViewSet(BaseViewSet):
             "identifier": "string"
         }
 
+        /reactions/batch/
+            [{"pain": "uuid64", "translate": "uuid64", "identifier": "string"}]
+            one reaction per pain, return the stat of every pain
+
 
     PATCH
     -----
@@ -53,6 +73,9 @@ class ReactionViewSet(BaseViewSet):
         {
             "identifier": "string"
         }
+
+    With the reaction buffer enabled, list and PATCH flush the
+    buffered reactions of the pain first and read the database
     """
     lookup_field = 'uuid'
     permission_classes = (IsAuthenticated,)
@@ -88,14 +111,12 @@ class ReactionViewSet(BaseViewSet):
             return Response(serializer.data, status=response_status.HTTP_201_CREATED)
         return Response(serializer.errors, status=response_status.HTTP_406_NOT_ACCEPTABLE)
 
-    @transaction.atomic
-    def partial_update(self, request, uuid=None, format=None):
-        instance = self.queryset_instance(uuid, for_update=True)
-        serializer = UpdateReactionSerializer(
-            instance,
+    @action(detail=False, methods=['post'], url_path='batch', url_name='batch')
+    def batch(self, request, format=None):
+        serializer = CreateBatchReactionSerializer(
             data=request.data,
             context=self.context,
-            partial=True
+            many=True
         )
 
         if serializer.is_valid(raise_exception=True):
@@ -106,6 +127,56 @@ class ReactionViewSet(BaseViewSet):
             return Response(serializer.data, status=response_status.HTTP_200_OK)
         return Response(serializer.errors, status=response_status.HTTP_406_NOT_ACCEPTABLE)
 
+    @action(detail=False, methods=['get'], url_path='timeline', url_name='timeline')
+    def timeline(self, request, format=None):
+        granularity, since, until = get_timeline_window(request)
+        tag = request.query_params.get('tag', None)
+
+        if tag:
+            queryset = TagReactionRollup.objects.filter(tag__slug=tag)
+            results = rollups.timeline(queryset, granularity, since, until, by_identifier=False)
+        else:
+            queryset = ReactionRollup.objects.all()
+            results = rollups.timeline(queryset, granularity, since, until)
+
+        results = {
+            'granularity': granularity,
+            'since': since,
+            'until': until,
+            'results': results,
+        }
+        return Response(results, status=response_status.HTTP_200_OK)
+
+    def partial_update(self, request, uuid=None, format=None):
+        if buffer.is_enabled():
+            try:
+                pain_id = buffer.get_pain_id(uuid) or Reaction.objects \
+                    .filter(uuid=uuid) \
+                    .values_list('pain_id', flat=True) \
+                    .first()
+            except DjangoValidationError:
+                raise NotFound()
+
+            if pain_id:
+                buffer.flush_now(pain_id)
+
+        with transaction.atomic():
+            instance = self.queryset_instance(uuid, for_update=True)
+            serializer = UpdateReactionSerializer(
+                instance,
+                data=request.data,
+                context=self.context,
+                partial=True
+            )
+
+            if serializer.is_valid(raise_exception=True):
+                try:
+                    serializer.save()
+                except DjangoValidationError as e:
+                    raise ValidationError(detail=str(e))
+                return Response(serializer.data, status=response_status.HTTP_200_OK)
+            return Response(serializer.errors, status=response_status.HTTP_406_NOT_ACCEPTABLE)
+
     def list(self, request, format=None):
         identifier = request.query_params.get('identifier', None)
         pain = request.query_params.get('pain', None)
@@ -117,18 +188,32 @@ class ReactionViewSet(BaseViewSet):
 
         try:
             queryset = self.queryset().filter(pain__uuid=pain)
+            pain_id = None
+            if buffer.is_enabled():
+                pain_id = Pain.objects \
+                    .filter(uuid=pain) \
+                    .values_list('id', flat=True) \
+                    .first()
         except Exception as e:
             raise ValidationError(detail={'pain': str(e)})
 
+        if pain_id:
+            buffer.flush_now(pain_id)
+
         if identifier:
             queryset = queryset.filter(identifier=identifier)
 
-        paginator = _PAGINATOR.paginate_queryset(queryset, request)
+        # ?cursor= switch to keyset pagination
+        pagination = _PAGINATOR
+        if _KEYSET_PAGINATOR.is_requested(request):
+            pagination = _KEYSET_PAGINATOR
+
+        paginator = pagination.paginate_queryset(queryset, request)
         serializer = ListReactionSerializer(
             paginator,
             context=self.context,
             many=True
         )
 
-        results = build_result_pagination(self, _PAGINATOR, serializer)
+        results = build_result_pagination(self, pagination, serializer)
         return Response(results, status=response_status.HTTP_200_OK)
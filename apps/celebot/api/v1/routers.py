@@ -3,10 +3,16 @@ from rest_framework.routers import DefaultRouter
 
 from .trouble.views import PainViewSet
 from .reaction.views import ReactionViewSet
+from .comment.views import CommentViewSet
+from .upload.views import UploadViewSet
+from .tags.views import TagViewSet
 
 router = DefaultRouter(trailing_slash=True)
 router.register('pains', PainViewSet, basename='pain')
 router.register('reactions', ReactionViewSet, basename='reaction')
+router.register('tags', TagViewSet, basename='tag')
+router.register('uploads', UploadViewSet, basename='upload')
+router.register(r'pains/(?P<pain_uuid>[^/.]+)/comments', CommentViewSet, basename='comment')
 
 urlpatterns = [
     path('', include(router.urls)),
@@ -0,0 +1,124 @@
+import re
+
+from django.apps import apps
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import Q
+from django.db.models.expressions import Exists, OuterRef
+from django.db.models.functions import Lower
+from django.utils.translation import gettext_lazy as _
+
+from rest_framework.exceptions import ValidationError
+
+Tag = apps.get_model('celebot', 'Tag')
+TagItem = apps.get_model('celebot', 'TagItem')
+Translate = apps.get_model('celebot', 'Translate')
+
+# unencoded + in the query string arrive as space
+AND_RE = re.compile(r'[+\s]+')
+
+
+def parse_tag_query(value):
+    """
+    Parse tags expression to (clauses, excluded)
+        ,       OR between clauses
+        +       AND inside a clause (or space, decoded from +)
+        -name   exclude the tag from every result
+
+    ie python+django,-flask -> ([['python', 'django']], ['flask'])
+    Raise ValidationError for an empty clause or term
+    """
+    clauses = list()
+    excluded = list()
+
+    for clause in value.split(','):
+        clause = AND_RE.sub('+', clause).strip('+')
+        if not clause:
+            raise ValidationError(detail={'tags': _("Empty tag clause.")})
+
+        terms = list()
+        for term in clause.split('+'):
+            term = term.lower()
+            if term.startswith('-'):
+                term = term[1:]
+                if not term:
+                    raise ValidationError(detail={'tags': _("Empty excluded tag.")})
+                excluded.append(term)
+            else:
+                terms.append(term)
+
+        if terms:
+            clauses.append(terms)
+    return clauses, excluded
+
+
+def resolve_tag_ids(names):
+    """Case insensitive name -> tag id, one query"""
+    if not names:
+        return {}
+
+    tags = Tag.objects \
+        .annotate(name_lower=Lower('name')) \
+        .filter(name_lower__in=set(names)) \
+        .values_list('name_lower', 'id')
+
+    ret = dict()
+    for name, tag_id in tags:
+        ret.setdefault(name, set()).add(tag_id)
+    return ret
+
+
+def tagged_exists(tag_ids, outer='pk'):
+    """
+    Semi-join on TagItem, true when one of the pain translates
+    has any of :tag_ids
+    """
+    content_type = ContentType.objects.get_for_model(Translate)
+    translates = Translate.objects \
+        .filter(pain_id=OuterRef(OuterRef(outer))) \
+        .values('id')
+
+    return Exists(
+        TagItem.objects.filter(
+            content_type_id=content_type.id,
+            tag_id__in=tag_ids,
+            object_id__in=translates
+        )
+    )
+
+
+def filter_by_tags(queryset, value):
+    """
+    Filter pains by tags expression, each pain appear once because
+    every term is an Exists instead of a join
+    """
+    clauses, excluded = parse_tag_query(value)
+    if not clauses and not excluded:
+        return queryset
+
+    resolved = resolve_tag_ids(
+        [x for clause in clauses for x in clause] + excluded
+    )
+
+    if clauses:
+        matches = Q()
+        for clause in clauses:
+            # unknown tag, clause can't match
+            if any(x not in resolved for x in clause):
+                continue
+
+            clause_match = Q()
+            for term in clause:
+                clause_match &= Q(tagged_exists(resolved[term]))
+            matches |= clause_match
+
+        if not matches:
+            return queryset.none()
+        queryset = queryset.filter(matches)
+
+    excluded_ids = set()
+    for term in excluded:
+        excluded_ids.update(resolved.get(term, ()))
+
+    if excluded_ids:
+        queryset = queryset.filter(~tagged_exists(excluded_ids))
+    return queryset
@@ -3,9 +3,15 @@ import json
 
 # Third party
 import six
+from django.apps import apps
 from django.utils.translation import ugettext_lazy as _
 from rest_framework import serializers
 
+from ....tagging import set_tags
+
+Tag = apps.get_model('celebot', 'Tag')
+TagItem = apps.get_model('celebot', 'TagItem')
+
 
 class TagList(list):
     def __init__(self, *args, **kwargs):
@@ -103,9 +109,20 @@ class TaggitSerializer(serializers.Serializer):
         return self._save_tags(tag_object, to_be_tagged)
 
     def _save_tags(self, tag_object, tags):
+        request = self.context.get('request')
+        user = getattr(request, 'user', None)
+        if user is not None and not user.is_authenticated:
+            user = None
+
         for key in tags.keys():
             tag_values = tags.get(key)
-            getattr(tag_object, key).set(*tag_values)
+            manager = getattr(tag_object, key)
+
+            # resolved in bulk when tagged through our TagItem
+            if manager.through is TagItem:
+                set_tags(tag_object, tag_values, user=user)
+            else:
+                manager.set(tag_values)
 
         return tag_object
 
@@ -119,3 +136,9 @@ class TaggitSerializer(serializers.Serializer):
                     to_be_tagged[key] = validated_data.pop(key)
 
         return (to_be_tagged, validated_data)
+
+
+class ListTagSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Tag
+        fields = ('name', 'slug', 'locale', 'usage_count',)
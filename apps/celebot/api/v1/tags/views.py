@@ -0,0 +1,110 @@
+from django.apps import apps
+from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import Q
+
+from rest_framework import viewsets, status as response_status
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.throttling import UserRateThrottle
+
+from ....conf import settings
+from ....cooccurrence import get_related
+from ....helpers import build_result_pagination
+from ....tagindex import index
+from .serializers import ListTagSerializer
+
+Tag = apps.get_registered_model('celebot', 'Tag')
+
+# Define to avoid used ...().paginate__
+_PAGINATOR = LimitOffsetPagination()
+
+
+class BaseViewSet(viewsets.ViewSet):
+    def __init__(self, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.context = dict()
+
+    def initialize_request(self, request, *args, **kwargs):
+        self.context.update({'request': request})
+        return super().initialize_request(request, *args, **kwargs)
+
+
+class TagViewSet(BaseViewSet):
+    """
+    GET
+    -----
+        /tags/autocomplete/?prefix=<string>&locale=id_ID&limit=<int>
+            most used first, served from the per process index
+            see apps.celebot.tagindex
+        /tags/popular/?locale=id_ID&limit=<int>&offset=<int>
+            ordered by usage_count
+        /tags/<slug>/related/?limit=<int>
+            tags most often used together with the tag
+            see apps.celebot.cooccurrence
+    """
+    lookup_field = 'slug'
+    permission_classes = (IsAuthenticated,)
+    throttle_classes = (UserRateThrottle,)
+
+    def get_limit(self, request, default):
+        try:
+            limit = int(request.query_params.get('limit', default))
+        except ValueError:
+            limit = default
+        return max(1, min(limit, settings.CELEBOT_TAG_AUTOCOMPLETE_MAX_LIMIT))
+
+    def get_language(self, request):
+        # id_ID -> id, tags keep the language only
+        locale = request.query_params.get('locale', None)
+        if locale:
+            return locale.replace('-', '_').partition('_')[0]
+        return None
+
+    @action(detail=False, methods=['get'], url_path='autocomplete', url_name='autocomplete')
+    def autocomplete(self, request, format=None):
+        prefix = request.query_params.get('prefix', '')
+        locale = self.get_language(request)
+        limit = self.get_limit(request, settings.CELEBOT_TAG_AUTOCOMPLETE_LIMIT)
+
+        results = [
+            {'name': x[0], 'slug': x[1], 'locale': x[2], 'usage_count': x[3]}
+            for x in index.search(prefix, locale=locale, limit=limit)
+        ]
+        return Response(results, status=response_status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get'], url_path='popular', url_name='popular')
+    def popular(self, request, format=None):
+        queryset = Tag.objects.order_by('-usage_count', 'id')
+
+        locale = self.get_language(request)
+        if locale:
+            queryset = queryset.filter(
+                Q(locale__iexact=locale) | Q(locale__isnull=True) | Q(locale='')
+            )
+
+        paginator = _PAGINATOR.paginate_queryset(queryset, request)
+        serializer = ListTagSerializer(
+            paginator,
+            context=self.context,
+            many=True
+        )
+
+        results = build_result_pagination(self, _PAGINATOR, serializer)
+        return Response(results, status=response_status.HTTP_200_OK)
+
+    @action(detail=True, methods=['get'], url_path='related', url_name='related')
+    def related(self, request, slug=None, format=None):
+        try:
+            tag_id = Tag.objects.values_list('id', flat=True).get(slug=slug)
+        except ObjectDoesNotExist:
+            raise NotFound()
+
+        limit = self.get_limit(request, settings.CELEBOT_TAG_RELATED_LIMIT)
+        results = [
+            {**ListTagSerializer(x.related, context=self.context).data, 'count': x.count}
+            for x in get_related(tag_id, limit=limit)
+        ]
+        return Response(results, status=response_status.HTTP_200_OK)
@@ -1,14 +1,23 @@
 from django.apps import apps
+from django.core.exceptions import ObjectDoesNotExist
 from django.db import transaction
+from django.utils.translation import gettext_lazy as _
 
 from rest_framework import serializers
+from rest_framework.settings import api_settings
 
 from ..tags.serializers import TaggitSerializer
+from .... import buffer, live
+from ....conf import settings
+from ....search import index_translate, index_translates
+from ....tagging import add_tags, bulk_add_tags, normalize_tags, resolve_tags, set_tags
+from ....utils import bulk_create_with_history
 from apps.person.api.v1.profile.serializers import RetrieveProfileSerializer
 
 Pain = apps.get_model('celebot', 'Pain')
 Reaction = apps.get_model('celebot', 'Reaction')
 Translate = apps.get_model('celebot', 'Translate')
+PainReactionStats = apps.get_model('celebot', 'PainReactionStats')
 
 
 class BasePainSerializer(serializers.ModelSerializer):
@@ -52,16 +61,18 @@ class RetrievePainSerializer(BasePainSerializer):
     class Meta(BasePainSerializer.Meta):
         fields = ('uuid', 'user', 'user_hexid', 'profile', 'translates',
                   'reaction_stat', 'reaction_given', 'is_creator',
-                  'create_at',)
+                  'comment_count', 'create_at',)
 
     def get_reaction_stat(self, instance):
-        ret = {'total': getattr(instance, 'reaction_total', 0)}
-
-        for r in Reaction.Identifiers:
-            ret.update({r.value: getattr(instance, '%s_count' % r.value, 0)})
+        try:
+            stats = instance.reaction_stats
+        except ObjectDoesNotExist:
+            # no reaction given yet
+            stats = PainReactionStats(pain=instance)
 
-        sorted_ret = sorted(ret.items(), key=lambda x: x[1], reverse=True)
-        return {x[0]: x[1] for x in sorted_ret}
+        # set by PainViewSet.overlay_viewer()
+        delta = getattr(instance, 'reaction_delta', None)
+        return buffer.merge_stat(stats.to_stat(), delta)
 
 
 class ListPainSerializer(RetrievePainSerializer):
@@ -70,29 +81,90 @@ class ListPainSerializer(RetrievePainSerializer):
         lookup_field='uuid'
     )
 
+    # set by PainViewSet.attach_translate()
+    default_translate = RetrieveTranslateSerializer(
+        source='locale_translate',
+        read_only=True
+    )
+    locales = serializers.ListField(
+        child=serializers.CharField(),
+        read_only=True
+    )
+
     class Meta(RetrievePainSerializer.Meta):
-        fields = ('profile', 'permalink',) + \
-            RetrievePainSerializer.Meta.fields
+        fields = ('profile', 'permalink', 'uuid', 'user', 'user_hexid',
+                  'default_translate', 'locales', 'reaction_stat',
+                  'reaction_given', 'is_creator', 'comment_count',
+                  'create_at',)
 
-    def to_representation(self, instance):
-        ret = super().to_representation(instance)
-        default_translate = [
-            x for x in ret.get('translates') if x.get('locale') == 'en_US'
-        ]
 
-        if len(default_translate) > 0:
-            ret.update({
-                'default_translate': default_translate[0]
+class CreateTranslateSerializer(BaseTranslateSerializer):
+    tags = serializers.ListField(
+        child=serializers.CharField(max_length=100),
+        allow_empty=True
+    )
+
+    class Meta(BaseTranslateSerializer.Meta):
+        fields = ('locale', 'label', 'problem', 'solution', 'tags',)
+
+
+class BatchCreatePainSerializer(serializers.ListSerializer):
+    """
+    Create many pains in one transaction, all or nothing. Errors are
+    returned per item in the same order as the payload
+    """
+
+    def to_internal_value(self, data):
+        # don't validate an oversized payload item by item
+        max_size = settings.CELEBOT_PAIN_BATCH_MAX_SIZE
+        if isinstance(data, list) and len(data) > max_size:
+            raise serializers.ValidationError({
+                api_settings.NON_FIELD_ERRORS_KEY: [
+                    _("Ensure this batch has no more than %(max)s items.")
+                    % {'max': max_size}
+                ]
             })
+        return super().to_internal_value(data)
+
+    def to_representation(self, data):
+        return [
+            {
+                'index': index,
+                'uuid': instance.uuid,
+                'translate': instance.batch_translate.uuid
+            } for index, instance in enumerate(data)
+        ]
 
-        return ret
+    @transaction.atomic
+    def create(self, validated_data):
+        user = self.context['request'].user
+        translates = [x.pop('translate') for x in validated_data]
+        tags = [x.pop('tags', None) or [] for x in translates]
 
+        # every tag of the batch resolved at once
+        resolved = resolve_tags([y for x in tags for y in x], user=user)
 
-class CreateTranslateSerializer(BaseTranslateSerializer):
-    tags = serializers.ListField(allow_empty=True)
+        instances = bulk_create_with_history(
+            [self.child.Meta.model(**x) for x in validated_data],
+            user=user
+        )
+        translate_instances = bulk_create_with_history(
+            [Translate(pain=x, **y) for x, y in zip(instances, translates)],
+            user=user
+        )
 
-    class Meta(BaseTranslateSerializer.Meta):
-        fields = ('locale', 'label', 'problem', 'solution', 'tags',)
+        bulk_add_tags([
+            (x, [resolved[name] for name in normalize_tags(y)])
+            for x, y in zip(translate_instances, tags)
+        ], user=user)
+
+        index_translates(translate_instances)
+
+        for instance, translate_instance in zip(instances, translate_instances):
+            instance.batch_translate = translate_instance
+
+        live.publish_pains(instances)
+        return instances
 
 
 class CreatePainSerializer(BasePainSerializer):
@@ -101,6 +173,7 @@ class CreatePainSerializer(BasePainSerializer):
 
     class Meta(BasePainSerializer.Meta):
         fields = ('user', 'translate',)
+        list_serializer_class = BatchCreatePainSerializer
 
     def to_representation(self, instance):
         request = self.context.get('request')
@@ -127,7 +200,10 @@ class CreatePainSerializer(BasePainSerializer):
 
             # add tags
             if tags:
-                translate_instance.tags.add(*tags)
+                add_tags(translate_instance, tags, user=instance.user)
+
+            index_translate(translate_instance)
+            live.publish_pains([instance])
         return instance
 
 
@@ -157,7 +233,13 @@ class UpdatePainSerializer(BasePainSerializer):
 
             # set or remove tags
             if tags:
-                translate_instance.tags.set(*tags)
+                set_tags(
+                    translate_instance,
+                    tags,
+                    user=self.context['request'].user
+                )
+
+            index_translate(translate_instance)
 
         instance.refresh_from_db()
         return instance
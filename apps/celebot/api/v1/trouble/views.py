@@ -1,28 +1,40 @@
 from copy import copy
 
 from django.apps import apps
+from django.core.cache import cache
 from django.core.exceptions import ObjectDoesNotExist
 from django.db import transaction
-from django.db.models import Count, Q
 from django.core.exceptions import ObjectDoesNotExist, ValidationError as DjangoValidationError
-from django.db.models.expressions import Exists, OuterRef, Subquery, Value
+from django.db.models import Prefetch, prefetch_related_objects
+from django.db.models.expressions import Value
 from django.db.models.fields import CharField
 
 from rest_framework import viewsets, status as response_status
+from rest_framework.decorators import action
 from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.throttling import UserRateThrottle
 from rest_framework.response import Response
-from rest_framework.pagination import LimitOffsetPagination
 
-from ....helpers import build_result_pagination
+from .... import buffer
+from ....caches import bump_version, get_version, make_key, pain_version_name, profile_version_name
+from ....conf import settings
+from ....helpers import CountedPagination, KeysetPagination, build_result_pagination, get_locale_chain, get_timeline_window
+from ....rollups import timeline
+from ....search import search_pains
+from ....trending import get_score_field
+from ..tags.query import filter_by_tags
 from .serializers import CreatePainSerializer, ListPainSerializer, RetrievePainSerializer, UpdatePainSerializer
 
 Pain = apps.get_registered_model('celebot', 'Pain')
 Reaction = apps.get_registered_model('celebot', 'Reaction')
+Translate = apps.get_registered_model('celebot', 'Translate')
+PainTrend = apps.get_registered_model('celebot', 'PainTrend')
+PainReactionRollup = apps.get_registered_model('celebot', 'PainReactionRollup')
 
 # Define to avoid used ...().paginate__
-_PAGINATOR = LimitOffsetPagination()
+_PAGINATOR = CountedPagination(count_cache_name='pain_count')
+_KEYSET_PAGINATOR = KeysetPagination()
 
 
 class BaseViewSet(viewsets.ViewSet):
@@ -40,6 +52,16 @@ class PainViewSet(BaseViewSet):
     GET
     -----
         ../troubles/?user_hexid=<string>&tags=my,hero,tags
+        ../troubles/?tags=python+django,-flask
+            , is OR, + is AND, -tag exclude
+        ../troubles/?cursor=<string>&limit=<int>
+        ../troubles/?count=false
+        ../troubles/?q=<string>
+        ../troubles/?locale=id_ID
+            fallback to Accept-Language then CELEBOT_DEFAULT_LOCALE
+        ../troubles/trending/?limit=<int>&offset=<int>
+        ../troubles/<uuid64>/reactions/timeline/?granularity=hour|day&since=<datetime>&until=<datetime>
+            reactions given per bucket, read from the rollups
 
 
     POST
@@ -53,51 +75,105 @@ class PainViewSet(BaseViewSet):
                 "tags": ["abc", "def", "ghi"]
             }
         }
+
+        ../troubles/batch/
+            [{"translate": {...}}, {"translate": {...}}]
+            all or nothing, errors listed in the same order
     """
     lookup_field = 'uuid'
     permission_classes = (IsAuthenticated,)
     throttle_classes = (UserRateThrottle,)
 
-    def queryset(self):
-        pain_subquery = Pain.objects \
-            .filter(id=OuterRef('id'), user__id=self.request.user.id)
-
-        reaction_subquery = Reaction.objects \
-            .filter(pain__id=OuterRef('id'), user__id=self.request.user.id)
-
-        reaction_stat = {'%s_count' % x.value: Count(
-            'reactions',
-            filter=Q(reactions__identifier=x.value),
-            distinct=True
-        ) for x in Reaction.Identifiers}
+    def queryset(self, translates=True):
+        # viewer independent, per-user fields come from overlay_viewer()
+        queryset = Pain.objects \
+            .prefetch_related('user', 'user__profile') \
+            .select_related('user', 'user__profile', 'reaction_stats') \
+            .order_by('-create_at')
 
-        return Pain.objects \
-            .prefetch_related(
-                'user',
-                'user__profile',
+        # list only need one translate, see attach_translate()
+        if translates:
+            queryset = queryset.prefetch_related(
                 'translates',
-                'translates__tags',
-                'reactions'
-            ) \
-            .select_related('user', 'user__profile') \
-            .annotate(
-                is_creator=Exists(pain_subquery),
-                reaction_total=Count('reactions', distinct=True),
-                reaction_given=Subquery(
-                    reaction_subquery.values('identifier')[:1]
-                ),
-                **reaction_stat,
-            ) \
-            .order_by('-create_at')
+                'translates__tags'
+            )
+        return queryset
 
     def queryset_instance(self, uuid, for_update=False):
         try:
             if for_update:
-                return self.queryset().select_for_update() \
+                instance = self.queryset().select_for_update() \
                     .get(uuid=uuid, user_id=self.request.user.id)
-            return self.queryset().get(uuid=uuid)
-        except ObjectDoesNotExist:
+            else:
+                instance = self.queryset().get(uuid=uuid)
+        except (ObjectDoesNotExist, DjangoValidationError):
             raise NotFound()
+        return self.overlay_viewer([instance])[0]
+
+    def overlay_viewer(self, instances):
+        """
+        Merge :reaction_given and :is_creator of the requesting user
+        into a page of pains with one query for the whole page
+        """
+        instances = list(instances)
+        user_id = self.request.user.id
+
+        reactions = Reaction.objects \
+            .filter(pain_id__in=[x.id for x in instances], user_id=user_id) \
+            .values_list('pain_id', 'identifier')
+        reactions = dict(reactions)
+
+        # not flushed from the reaction buffer yet
+        pending = buffer.get_pending([(user_id, x.id) for x in instances])
+        deltas = buffer.get_deltas([x.id for x in instances])
+
+        for instance in instances:
+            entry = pending.get((user_id, instance.id))
+            instance.reaction_given = entry['i'] if entry else reactions.get(instance.id)
+            instance.reaction_delta = deltas.get(instance.id)
+            instance.is_creator = instance.user_id == user_id
+        return instances
+
+    def attach_translate(self, instances):
+        """
+        Set :locale_translate, the best translate by the locale chain
+        and :locales available for a page of pains. Only the chosen
+        translates are fetched
+        """
+        instances = list(instances)
+        chain = get_locale_chain(self.request)
+        rank = {x: i for i, x in enumerate(chain)}
+
+        rows = Translate.objects \
+            .filter(pain_id__in=[x.id for x in instances]) \
+            .order_by('id') \
+            .values_list('pain_id', 'id', 'locale')
+
+        locales = dict()
+        chosen = dict()
+
+        for pain_id, translate_id, locale in rows:
+            locales.setdefault(pain_id, []).append(locale)
+
+            # not in chain, fallback to the first translate
+            current = chosen.get(pain_id)
+            position = rank.get(locale, len(chain))
+            if current is None or position < current[0]:
+                chosen[pain_id] = (position, translate_id)
+
+        prefetch_related_objects(instances, Prefetch(
+            'translates',
+            queryset=Translate.objects
+            .filter(id__in=[x[1] for x in chosen.values()])
+            .prefetch_related('tags'),
+            to_attr='chosen_translates'
+        ))
+
+        for instance in instances:
+            translates = getattr(instance, 'chosen_translates', [])
+            instance.locale_translate = translates[0] if translates else None
+            instance.locales = locales.get(instance.id, [])
+        return instances
 
     @transaction.atomic
     def create(self, request, format=None):
@@ -114,6 +190,26 @@ class PainViewSet(BaseViewSet):
             return Response(serializer.data, status=response_status.HTTP_201_CREATED)
         return Response(serializer.errors, status=response_status.HTTP_406_NOT_ACCEPTABLE)
 
+    @action(detail=False, methods=['post'], url_path='batch', url_name='batch')
+    def batch(self, request, format=None):
+        serializer = CreatePainSerializer(
+            data=request.data,
+            context=self.context,
+            many=True
+        )
+
+        if serializer.is_valid(raise_exception=True):
+            try:
+                with transaction.atomic():
+                    serializer.save()
+            except DjangoValidationError as e:
+                raise ValidationError(detail=str(e))
+
+            # bulk_create skip the signals
+            bump_version('pain_count')
+            return Response(serializer.data, status=response_status.HTTP_201_CREATED)
+        return Response(serializer.errors, status=response_status.HTTP_406_NOT_ACCEPTABLE)
+
     @transaction.atomic
     def partial_update(self, request, uuid=None, format=None):
         instance = self.queryset_instance(uuid, for_update=True)
@@ -133,21 +229,85 @@ class PainViewSet(BaseViewSet):
         return Response(serializer.errors, status=response_status.HTTP_406_NOT_ACCEPTABLE)
 
     def list(self, request, format=None):
-        queryset = self.queryset()
+        queryset = self.queryset(translates=False)
 
         user_hexid = request.query_params.get('user_hexid', None)
         tags = request.query_params.get('tags', None)
+        q = request.query_params.get('q', None)
 
         if user_hexid:
             queryset = queryset.filter(user__hexid=user_hexid)
 
         if tags:
-            tags_list = tags.split(',')
-            queryset = queryset.filter(translates__tags__name__in=tags_list)
+            queryset = filter_by_tags(queryset, tags)
+
+        # ?q= ranked by relevance
+        if q:
+            return self.search(request, queryset, q)
+
+        # ?cursor= switch to keyset pagination
+        if _KEYSET_PAGINATOR.is_requested(request):
+            pagination = _KEYSET_PAGINATOR
+            paginator = pagination.paginate_queryset(queryset, request)
+        else:
+            pagination = _PAGINATOR
+            paginator = pagination.paginate_queryset(
+                queryset,
+                request,
+                signature={'user_hexid': user_hexid, 'tags': tags}
+            )
 
-        paginator = _PAGINATOR.paginate_queryset(queryset, request)
         serializer = ListPainSerializer(
-            paginator,
+            self.attach_translate(self.overlay_viewer(paginator)),
+            context=self.context,
+            many=True
+        )
+
+        results = build_result_pagination(self, pagination, serializer)
+        return Response(results, status=response_status.HTTP_200_OK)
+
+    def search(self, request, queryset, q):
+        ranked = [x[0] for x in search_pains(q)]
+
+        # apply the other filters on the ranked pains
+        if ranked and queryset.query.has_filters():
+            allowed = set(
+                queryset.filter(id__in=ranked).order_by()
+                .values_list('id', flat=True)
+            )
+            ranked = [x for x in ranked if x in allowed]
+
+        page = _PAGINATOR.paginate_queryset(ranked, request)
+        instances = queryset.in_bulk(page)
+        instances = [instances[x] for x in page if x in instances]
+
+        serializer = ListPainSerializer(
+            self.attach_translate(self.overlay_viewer(instances)),
+            context=self.context,
+            many=True
+        )
+
+        results = build_result_pagination(self, _PAGINATOR, serializer)
+        return Response(results, status=response_status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get'], url_path='trending', url_name='trending')
+    def trending(self, request, format=None):
+        """
+        Range read on the precomputed scores then hydrate the page,
+        see apps.celebot.trending
+        """
+        field = get_score_field()
+        ranked = PainTrend.objects \
+            .filter(**{'%s__gt' % field: 0}) \
+            .order_by('-%s' % field, '-pain_id') \
+            .values_list('pain_id', flat=True)
+
+        page = _PAGINATOR.paginate_queryset(ranked, request)
+        instances = self.queryset(translates=False).in_bulk(page)
+        instances = [instances[x] for x in page if x in instances]
+
+        serializer = ListPainSerializer(
+            self.attach_translate(self.overlay_viewer(instances)),
             context=self.context,
             many=True
         )
@@ -155,14 +315,34 @@ class PainViewSet(BaseViewSet):
         results = build_result_pagination(self, _PAGINATOR, serializer)
         return Response(results, status=response_status.HTTP_200_OK)
 
+    @action(detail=True, methods=['get'], url_path='reactions/timeline', url_name='reactions-timeline')
+    def reactions_timeline(self, request, uuid=None, format=None):
+        try:
+            pain_id = Pain.objects.values_list('id', flat=True).get(uuid=uuid)
+        except (ObjectDoesNotExist, DjangoValidationError):
+            raise NotFound()
+
+        granularity, since, until = get_timeline_window(request)
+        queryset = PainReactionRollup.objects.filter(pain_id=pain_id)
+
+        results = {
+            'granularity': granularity,
+            'since': since,
+            'until': until,
+            'results': timeline(queryset, granularity, since, until),
+        }
+        return Response(results, status=response_status.HTTP_200_OK)
+
     @transaction.atomic()
     def delete(self, request, uuid=None):
         try:
             instance = self.queryset() \
                 .get(uuid=uuid, user_id=request.user.id)
-        except ObjectDoesNotExist:
+        except (ObjectDoesNotExist, DjangoValidationError):
             raise NotFound()
 
+        self.overlay_viewer([instance])
+
         # copy for response
         instance_copy = copy(instance)
 
@@ -177,6 +357,62 @@ class PainViewSet(BaseViewSet):
         return Response(serializer.data, status=response_status.HTTP_200_OK)
 
     def retrieve(self, request, uuid=None, format=None):
-        instance = self.queryset_instance(uuid)
-        serializer = RetrievePainSerializer(instance, context=self.context)
-        return Response(serializer.data, status=response_status.HTTP_200_OK)
+        """
+        Viewer independent body cached by pain uuid and version, the
+        per-user fields layered afterwards
+        """
+        key = make_key(pain_version_name(uuid), 'detail', request.get_host())
+        cached = cache.get(key)
+
+        if cached is not None:
+            profile_version = get_version(
+                profile_version_name(cached['user_id'])
+            )
+            if cached['profile_version'] != profile_version:
+                cached = None
+
+        if cached is None:
+            try:
+                instance = self.queryset().get(uuid=uuid)
+            except (ObjectDoesNotExist, DjangoValidationError):
+                raise NotFound()
+
+            serializer = RetrievePainSerializer(instance, context=self.context)
+            cached = {
+                'pain_id': instance.id,
+                'user_id': instance.user_id,
+                'profile_version': get_version(
+                    profile_version_name(instance.user_id)
+                ),
+                'data': serializer.data,
+            }
+            cache.set(key, cached, settings.CELEBOT_PAIN_DETAIL_CACHE_TIMEOUT)
+
+        data = self.overlay_viewer_data(cached)
+        return Response(data, status=response_status.HTTP_200_OK)
+
+    def overlay_viewer_data(self, cached):
+        user_id = self.request.user.id
+        pain_id = cached['pain_id']
+        pending = buffer.get_pending([(user_id, pain_id)]).get((user_id, pain_id))
+
+        if pending:
+            reaction_given = pending['i']
+        else:
+            reaction_given = Reaction.objects \
+                .filter(pain_id=pain_id, user_id=user_id) \
+                .values_list('identifier', flat=True) \
+                .first()
+
+        data = dict(cached['data'])
+        data.update({
+            'reaction_stat': buffer.merge_stat(
+                data['reaction_stat'],
+                buffer.get_deltas([pain_id]).get(pain_id)
+            ),
+            'reaction_given': reaction_given,
+            'is_creator': cached['user_id'] == user_id,
+        })
+
+        fields = RetrievePainSerializer.Meta.fields
+        return {x: data[x] for x in fields if x in data}
@@ -0,0 +1,107 @@
+from django.apps import apps
+from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import ObjectDoesNotExist, ValidationError as DjangoValidationError
+from django.utils.translation import gettext_lazy as _
+
+from rest_framework import serializers
+
+from apps.person.thumbnails import get_urls
+
+from ....conf import settings
+from ....uploads import TARGETS, UploadError, create_session
+
+Pain = apps.get_registered_model('celebot', 'Pain')
+Translate = apps.get_registered_model('celebot', 'Translate')
+Comment = apps.get_registered_model('celebot', 'Comment')
+Attachment = apps.get_registered_model('celebot', 'Attachment')
+UploadSession = apps.get_registered_model('celebot', 'UploadSession')
+
+# objects accepting attachments, the user must own them
+ATTACHABLES = {
+    'pain': (Pain, 'user_id'),
+    'translate': (Translate, 'pain__user_id'),
+    'comment': (Comment, 'user_id'),
+}
+
+
+class BaseUploadSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UploadSession
+        fields = '__all__'
+
+
+class RetrieveUploadSerializer(BaseUploadSerializer):
+    class Meta(BaseUploadSerializer.Meta):
+        fields = ('uuid', 'target', 'filename', 'filemime', 'length',
+                  'offset', 'create_at',)
+
+
+class CreateUploadSerializer(BaseUploadSerializer):
+    user = serializers.HiddenField(default=serializers.CurrentUserDefault())
+    length = serializers.IntegerField(min_value=1)
+    attach_to = serializers.ChoiceField(
+        choices=list(ATTACHABLES),
+        required=False,
+        write_only=True
+    )
+    object = serializers.UUIDField(required=False, write_only=True)
+
+    class Meta(BaseUploadSerializer.Meta):
+        fields = ('user', 'target', 'filename', 'length', 'attach_to',
+                  'object', 'label', 'caption',)
+
+    def validate(self, attrs):
+        attach_to = attrs.pop('attach_to', None)
+        uuid = attrs.pop('object', None)
+
+        if attrs['target'] != TARGETS.ATTACHMENT:
+            return attrs
+
+        if not attach_to or not uuid:
+            raise serializers.ValidationError({
+                'object': _("Attachment need attach_to and object.")
+            })
+
+        model, owner = ATTACHABLES[attach_to]
+        try:
+            instance = model.objects.get(uuid=uuid, **{owner: attrs['user'].id})
+        except (ObjectDoesNotExist, DjangoValidationError):
+            raise serializers.ValidationError({
+                'object': _("Object not found.")
+            })
+
+        attrs['content_type'] = ContentType.objects.get_for_model(model)
+        attrs['object_id'] = str(instance.pk)
+        return attrs
+
+    def to_representation(self, instance):
+        serializer = RetrieveUploadSerializer(instance, context=self.context)
+        return serializer.data
+
+    def create(self, validated_data):
+        try:
+            return create_session(**validated_data)
+        except UploadError as e:
+            raise serializers.ValidationError({e.code: str(e)})
+
+
+class RetrieveAttachmentSerializer(serializers.ModelSerializer):
+    # {size: {format: url}}, the file until they are made
+    thumbnails = serializers.SerializerMethodField(read_only=True)
+
+    class Meta:
+        model = Attachment
+        fields = ('uuid', 'file', 'filename', 'filesize', 'filemime',
+                  'filehash', 'thumbnails', 'label', 'caption',
+                  'create_at',)
+
+    def get_thumbnails(self, instance):
+        if not instance.filemime.startswith('image/'):
+            return None
+
+        return get_urls(
+            instance.thumbnails,
+            instance.file,
+            settings.CELEBOT_ATTACHMENT_THUMBNAILS,
+            request=self.context.get('request')
+        )
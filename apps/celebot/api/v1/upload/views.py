@@ -0,0 +1,163 @@
+import io
+
+from django.apps import apps
+from django.core.exceptions import ObjectDoesNotExist, ValidationError as DjangoValidationError
+from django.db import transaction
+
+from rest_framework import viewsets, status as response_status
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.throttling import UserRateThrottle
+
+from apps.person.api.v1.profile.serializers import RetrieveProfileSerializer
+from ....uploads import UploadError, abort, append
+from .serializers import CreateUploadSerializer, RetrieveAttachmentSerializer, RetrieveUploadSerializer
+
+UploadSession = apps.get_registered_model('celebot', 'UploadSession')
+
+CHUNK_CONTENT_TYPE = 'application/offset+octet-stream'
+ERROR_STATUS = {
+    'offset': response_status.HTTP_409_CONFLICT,
+    'length': response_status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+    'mime': response_status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+    'locked': response_status.HTTP_423_LOCKED,
+}
+
+
+class BaseViewSet(viewsets.ViewSet):
+    def __init__(self, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.context = dict()
+
+    def initialize_request(self, request, *args, **kwargs):
+        self.context.update({'request': request})
+        return super().initialize_request(request, *args, **kwargs)
+
+
+class UploadViewSet(BaseViewSet):
+    """
+    POST
+    -----
+        {
+            "target": "attachment|picture",
+            "filename": "screenshot.png",
+            "length": 1048576,
+            "attach_to": "pain|translate|comment",
+            "object": "uuid64",
+            "label": "string",
+            "caption": "string"
+        }
+        attach_to, object, label and caption for attachment only
+
+
+    HEAD, GET
+    -----
+        ../uploads/<uuid64>/
+            Upload-Offset header tell where to resume
+
+
+    PATCH
+    -----
+        ../uploads/<uuid64>/
+            Content-Type: application/offset+octet-stream
+            Upload-Offset: <int>
+            raw bytes, the last chunk return the attachment
+            or the profile
+
+
+    DELETE
+    -----
+        ../uploads/<uuid64>/
+            abort the upload
+    """
+    lookup_field = 'uuid'
+    permission_classes = (IsAuthenticated,)
+    throttle_classes = (UserRateThrottle,)
+
+    def queryset(self):
+        return UploadSession.objects.filter(user_id=self.request.user.id)
+
+    def queryset_instance(self, uuid, for_update=False):
+        try:
+            if for_update:
+                return self.queryset().select_for_update().get(uuid=uuid)
+            return self.queryset().get(uuid=uuid)
+        except (ObjectDoesNotExist, DjangoValidationError):
+            raise NotFound()
+
+    def get_offset_headers(self, instance):
+        return {
+            'Upload-Offset': str(instance.offset),
+            'Upload-Length': str(instance.length),
+            'Cache-Control': 'no-store',
+        }
+
+    @transaction.atomic
+    def create(self, request, format=None):
+        serializer = CreateUploadSerializer(
+            data=request.data,
+            context=self.context
+        )
+
+        if serializer.is_valid(raise_exception=True):
+            try:
+                serializer.save()
+            except DjangoValidationError as e:
+                raise ValidationError(detail=str(e))
+            return Response(
+                serializer.data,
+                status=response_status.HTTP_201_CREATED,
+                headers=self.get_offset_headers(serializer.instance)
+            )
+        return Response(serializer.errors, status=response_status.HTTP_406_NOT_ACCEPTABLE)
+
+    def retrieve(self, request, uuid=None, format=None):
+        instance = self.queryset_instance(uuid)
+        serializer = RetrieveUploadSerializer(instance, context=self.context)
+        return Response(
+            serializer.data,
+            status=response_status.HTTP_200_OK,
+            headers=self.get_offset_headers(instance)
+        )
+
+    def partial_update(self, request, uuid=None, format=None):
+        # body read as a stream, never through the parsers
+        if request.content_type.split(';')[0].strip() != CHUNK_CONTENT_TYPE:
+            return Response(
+                {'detail': "Content-Type must be %s" % CHUNK_CONTENT_TYPE},
+                status=response_status.HTTP_415_UNSUPPORTED_MEDIA_TYPE
+            )
+
+        try:
+            offset = int(request.META.get('HTTP_UPLOAD_OFFSET', ''))
+        except ValueError:
+            raise ValidationError(detail={'offset': "Upload-Offset header required"})
+
+        # streamed without transaction, see apps.celebot.uploads
+        instance = self.queryset_instance(uuid)
+        try:
+            created = append(instance, request.stream or io.BytesIO(), offset)
+        except UploadError as e:
+            return Response({e.code: str(e)}, status=ERROR_STATUS[e.code])
+
+        if created is None:
+            serializer = RetrieveUploadSerializer(instance, context=self.context)
+        elif instance.target == UploadSession.Targets.PICTURE:
+            serializer = RetrieveProfileSerializer(created, context=self.context)
+        else:
+            serializer = RetrieveAttachmentSerializer(created, context=self.context)
+
+        return Response(
+            serializer.data,
+            status=response_status.HTTP_200_OK,
+            headers=self.get_offset_headers(instance)
+        )
+
+    def destroy(self, request, uuid=None, format=None):
+        instance = self.queryset_instance(uuid)
+        try:
+            abort(instance)
+        except UploadError as e:
+            return Response({e.code: str(e)}, status=ERROR_STATUS[e.code])
+        return Response(status=response_status.HTTP_204_NO_CONTENT)
@@ -1,7 +1,81 @@
-from django.apps import AppConfig
+from django.apps import AppConfig, apps
+from django.db.models.signals import post_delete, post_save, pre_delete
 
 
 class CelebotConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.celebot'
     label = 'celebot'
+
+    def ready(self):
+        from django.conf import settings
+        from .utils import post_bulk_delete
+        from .signals import (
+            reaction_delete_handler,
+            pain_count_invalidate_handler,
+            translate_delete_handler,
+            pain_detail_invalidate_handler,
+            profile_invalidate_handler,
+            tag_index_invalidate_handler,
+            tag_usage_delete_handler,
+            tag_usage_save_handler,
+            tag_items_bulk_delete_handler,
+            attachment_thumbnails_save_handler
+        )
+
+        Pain = self.get_model('Pain')
+        Translate = self.get_model('Translate')
+        Reaction = self.get_model('Reaction')
+        Tag = self.get_model('Tag')
+        TagItem = self.get_model('TagItem')
+        Attachment = self.get_model('Attachment')
+        Profile = apps.get_model('person', 'Profile')
+        User = apps.get_model(settings.AUTH_USER_MODEL)
+
+        # Reaction
+        post_delete.connect(reaction_delete_handler, sender=Reaction,
+                            dispatch_uid='reaction_delete_signal')
+
+        # Translate search index
+        pre_delete.connect(translate_delete_handler, sender=Translate,
+                           dispatch_uid='translate_delete_signal')
+
+        # Pain list totals
+        for model in (Pain, Translate, TagItem):
+            post_save.connect(pain_count_invalidate_handler, sender=model,
+                              dispatch_uid='%s_count_save_signal' % model._meta.model_name)
+            post_delete.connect(pain_count_invalidate_handler, sender=model,
+                                dispatch_uid='%s_count_delete_signal' % model._meta.model_name)
+
+        # Pain detail cache
+        for model in (Pain, Translate, TagItem, Reaction):
+            post_save.connect(pain_detail_invalidate_handler, sender=model,
+                              dispatch_uid='%s_detail_save_signal' % model._meta.model_name)
+            post_delete.connect(pain_detail_invalidate_handler, sender=model,
+                                dispatch_uid='%s_detail_delete_signal' % model._meta.model_name)
+
+        # Tag usage count
+        post_save.connect(tag_usage_save_handler, sender=TagItem,
+                          dispatch_uid='tagitem_usage_save_signal')
+        post_delete.connect(tag_usage_delete_handler, sender=TagItem,
+                            dispatch_uid='tagitem_usage_delete_signal')
+
+        # Side effects above for TagItem deleted in bulk
+        post_bulk_delete.connect(tag_items_bulk_delete_handler, sender=TagItem,
+                                 dispatch_uid='tagitem_bulk_delete_signal')
+
+        # Tag autocomplete
+        for model in (Tag, TagItem):
+            post_save.connect(tag_index_invalidate_handler, sender=model,
+                              dispatch_uid='%s_tag_index_save_signal' % model._meta.model_name)
+            post_delete.connect(tag_index_invalidate_handler, sender=model,
+                                dispatch_uid='%s_tag_index_delete_signal' % model._meta.model_name)
+
+        # Author embedded in pain detail
+        for model in (Profile, User):
+            post_save.connect(profile_invalidate_handler, sender=model,
+                              dispatch_uid='%s_profile_save_signal' % model._meta.model_name)
+
+        # Image attachment thumbnails
+        post_save.connect(attachment_thumbnails_save_handler, sender=Attachment,
+                          dispatch_uid='attachment_thumbnails_save_signal')
@@ -0,0 +1,377 @@
+"""
+Write-behind buffer of reactions, enabled by CELEBOT_REACTION_BUFFER_URL
+
+Writes land in redis, per pain:
+    pending     hash of user_id -> {identifier, translate_id, uuid}
+    delta       hash of counter -> delta not in PainReactionStats yet
+and the pain is marked dirty. `flush()` renames both hashes to their
+flushing keys and applies them with `ReactionQuerySet.upsert()`.
+Readers merge pending, flushing and the database, in this order
+
+The flushing keys are deleted once the flush committed, the flush
+token kept on PainReactionStats in the same transaction tells the
+readers to skip them until then
+"""
+import json
+import logging
+import uuid
+
+import redis
+
+from django.apps import apps
+from django.db import transaction
+
+from . import stats, trending
+from .caches import bump_pains
+from .conf import settings
+
+Pain = apps.get_model('celebot', 'Pain')
+Translate = apps.get_model('celebot', 'Translate')
+Reaction = apps.get_model('celebot', 'Reaction')
+PainReactionStats = apps.get_model('celebot', 'PainReactionStats')
+
+PENDING_KEY = 'celebot:reactions:pending:%s'
+DELTA_KEY = 'celebot:reactions:delta:%s'
+FLUSHING_KEY = 'celebot:reactions:flushing:%s'
+FLUSHING_DELTA_KEY = 'celebot:reactions:flushing-delta:%s'
+FLUSHING_TOKEN_KEY = 'celebot:reactions:flushing-token:%s'
+DIRTY_KEY = 'celebot:reactions:dirty'
+UUID_KEY = 'celebot:reactions:uuid'
+LOCK_KEY = 'celebot:reactions:lock:%s'
+
+_client = None
+
+
+def is_enabled():
+    return bool(settings.CELEBOT_REACTION_BUFFER_URL)
+
+
+def get_client():
+    global _client
+    if _client is None:
+        _client = redis.Redis.from_url(
+            settings.CELEBOT_REACTION_BUFFER_URL,
+            decode_responses=True
+        )
+    return _client
+
+
+def get_committed(tokens):
+    """
+    Pains whose flushing keys are in the database already
+    :tokens is dict of pain_id -> flush token
+    """
+    tokens = {k: v for k, v in tokens.items() if v}
+    if not tokens:
+        return set()
+
+    stored = PainReactionStats.objects \
+        .filter(pain_id__in=list(tokens)) \
+        .values_list('pain_id', 'flush_token')
+    return {x[0] for x in stored if x[1] == tokens[x[0]]}
+
+
+def get_pending(keys):
+    """
+    Buffered reactions not in the database yet
+    :keys is list of (user_id, pain_id), return dict of key -> entry
+    """
+    if not keys or not is_enabled():
+        return {}
+
+    keys = list(keys)
+    pain_ids = list({x[1] for x in keys})
+    with get_client().pipeline(transaction=False) as pipe:
+        for user_id, pain_id in keys:
+            pipe.hget(PENDING_KEY % pain_id, user_id)
+            pipe.hget(FLUSHING_KEY % pain_id, user_id)
+        for pain_id in pain_ids:
+            pipe.get(FLUSHING_TOKEN_KEY % pain_id)
+        values = pipe.execute()
+
+    committed = get_committed(dict(zip(pain_ids, values[len(keys) * 2:])))
+
+    ret = dict()
+    for i, key in enumerate(keys):
+        # pending is newer than flushing
+        value = values[i * 2]
+        if not value and key[1] not in committed:
+            value = values[i * 2 + 1]
+        if value:
+            ret[key] = json.loads(value)
+    return ret
+
+
+def get_deltas(pain_ids):
+    """Buffered counter deltas, dict of pain_id -> {counter: delta}"""
+    if not pain_ids or not is_enabled():
+        return {}
+
+    pain_ids = list(pain_ids)
+    with get_client().pipeline(transaction=False) as pipe:
+        for pain_id in pain_ids:
+            pipe.hgetall(DELTA_KEY % pain_id)
+            pipe.hgetall(FLUSHING_DELTA_KEY % pain_id)
+            pipe.get(FLUSHING_TOKEN_KEY % pain_id)
+        values = pipe.execute()
+
+    committed = get_committed({
+        pain_id: values[i * 3 + 2] for i, pain_id in enumerate(pain_ids)
+    })
+
+    ret = dict()
+    for i, pain_id in enumerate(pain_ids):
+        counters = dict()
+        buffered = values[i * 3:i * 3 + 1]
+        if pain_id not in committed:
+            buffered = values[i * 3:i * 3 + 2]
+
+        for value in buffered:
+            for field, delta in value.items():
+                counters[field] = counters.get(field, 0) + int(delta)
+
+        if any(counters.values()):
+            ret[pain_id] = counters
+    return ret
+
+
+def get_pain_id(reaction_uuid):
+    """Pain of a reaction buffered and not flushed yet, or None"""
+    if not is_enabled():
+        return None
+
+    pain_id = get_client().hget(UUID_KEY, str(reaction_uuid))
+    return int(pain_id) if pain_id else None
+
+
+def merge_stat(stat, counters):
+    """Add buffered :counters to a `to_stat()` dict, sorted again"""
+    if not counters:
+        return stat
+
+    ret = {k: max(v + counters.get(k, 0), 0) for k, v in stat.items()}
+    sorted_ret = sorted(ret.items(), key=lambda x: x[1], reverse=True)
+    return {x[0]: x[1] for x in sorted_ret}
+
+
+def record(rows):
+    """
+    Buffer reactions instead of writing them, same :rows and return
+    value as `ReactionQuerySet.upsert()` but the instances are unsaved
+    """
+    rows = list({(x['user_id'], x['pain_id']): x for x in rows}.values())
+    if not rows:
+        return []
+
+    keys = [(x['user_id'], x['pain_id']) for x in rows]
+    pending = get_pending(keys)
+
+    # reactions not buffered yet
+    stored = Reaction.objects \
+        .filter(
+            user_id__in={x[0] for x in keys if x not in pending},
+            pain_id__in={x[1] for x in keys if x not in pending}
+        ) \
+        .values_list('user_id', 'pain_id', 'identifier', 'uuid')
+    stored = {x[:2]: {'i': x[2], 'u': str(x[3])} for x in stored}
+
+    ret = list()
+    with get_client().pipeline() as pipe:
+        for key, row in zip(keys, rows):
+            user_id, pain_id = key
+            old = pending.get(key) or stored.get(key) or {}
+            previous = old.get('i')
+            reaction_uuid = old.get('u') or str(uuid.uuid4())
+
+            pipe.hset(PENDING_KEY % pain_id, user_id, json.dumps({
+                'i': row['identifier'],
+                't': row['translate_id'],
+                'u': reaction_uuid,
+            }))
+
+            if previous != row['identifier']:
+                delta = DELTA_KEY % pain_id
+                pipe.hincrby(delta, row['identifier'], 1)
+                if previous:
+                    pipe.hincrby(delta, previous, -1)
+                else:
+                    pipe.hincrby(delta, 'total', 1)
+
+            # new reaction, found by uuid until flushed
+            if not old.get('u'):
+                pipe.hset(UUID_KEY, reaction_uuid, pain_id)
+
+            pipe.sadd(DIRTY_KEY, pain_id)
+            ret.append((Reaction(uuid=reaction_uuid, **row), previous))
+        pipe.execute()
+    return ret
+
+
+def flush(batch_size=100):
+    """
+    Write every dirty pain to the database, return pains flushed
+    A pain failing or held by another worker stays dirty
+    """
+    client = get_client()
+    flushed = 0
+    retry = set()
+    pain_ids = list()
+
+    try:
+        while True:
+            pain_ids = list(client.spop(DIRTY_KEY, batch_size) or ())
+            if not pain_ids:
+                break
+
+            while pain_ids:
+                pain_id = pain_ids[-1]
+                try:
+                    written = flush_pain(int(pain_id))
+                except Exception:
+                    logging.exception('Reaction buffer flush of pain %s failed' % pain_id)
+                    written = None
+
+                pain_ids.pop()
+                if written is None:
+                    retry.add(pain_id)
+                elif written:
+                    flushed += 1
+    finally:
+        # dirty again once the set is drained, with the ones
+        # popped and never reached
+        retry.update(pain_ids)
+        if retry:
+            client.sadd(DIRTY_KEY, *retry)
+    return flushed
+
+
+def flush_now(pain_id):
+    """
+    Flush :pain_id when it has buffered reactions, before a read
+    served by the database alone. Return True when written
+    """
+    if not is_enabled():
+        return False
+
+    client = get_client()
+    if not client.exists(PENDING_KEY % pain_id, FLUSHING_KEY % pain_id):
+        return False
+    return bool(flush_pain(pain_id))
+
+
+def flush_pain(pain_id):
+    """
+    Write the buffered reactions of :pain_id. Return True when
+    written, False with nothing buffered and None when another
+    worker holds the pain
+    """
+    client = get_client()
+    lock = LOCK_KEY % pain_id
+
+    if not client.set(lock, 1, nx=True, ex=60):
+        return None
+
+    flushing = FLUSHING_KEY % pain_id
+    token_key = FLUSHING_TOKEN_KEY % pain_id
+
+    try:
+        # a leftover of a failed flush is written before newer writes
+        if not client.exists(flushing):
+            if not client.exists(PENDING_KEY % pain_id):
+                return False
+
+            pending = PENDING_KEY % pain_id
+            delta = DELTA_KEY % pain_id
+
+            # both are watched, a record() in between retries the
+            # renames and the delta can't be left behind or moved alone
+            def rename(pipe):
+                has_delta = pipe.exists(delta)
+                pipe.multi()
+                pipe.rename(pending, flushing)
+                if has_delta:
+                    pipe.rename(delta, FLUSHING_DELTA_KEY % pain_id)
+                pipe.set(token_key, uuid.uuid4().hex)
+
+            client.transaction(rename, pending, delta)
+
+        token = client.get(token_key) or uuid.uuid4().hex
+        entries = {
+            int(k): json.loads(v)
+            for k, v in client.hgetall(flushing).items()
+        }
+
+        # committed, the keys outlived it
+        if pain_id in get_committed({pain_id: token}):
+            clear(pain_id, entries)
+        else:
+            write(pain_id, entries, token)
+    finally:
+        client.delete(lock)
+    return True
+
+
+def clear(pain_id, entries):
+    """Delete the flushing keys of :pain_id once written"""
+    uuids = [x['u'] for x in entries.values()]
+
+    with get_client().pipeline() as pipe:
+        pipe.delete(
+            FLUSHING_KEY % pain_id,
+            FLUSHING_DELTA_KEY % pain_id,
+            FLUSHING_TOKEN_KEY % pain_id
+        )
+        if uuids:
+            pipe.hdel(UUID_KEY, *uuids)
+        pipe.execute()
+
+
+@transaction.atomic
+def write(pain_id, entries, token):
+    """
+    :entries is dict of user_id -> buffered reaction
+    :token is kept with the counters, the readers skip the flushing
+    keys from the commit until they are deleted
+    """
+    def on_commit():
+        # cached before the flush, the deltas are gone after
+        stats.get_stat(pain_id, refresh=True)
+        clear(pain_id, entries)
+
+    transaction.on_commit(on_commit)
+
+    pain_uuid = Pain.objects \
+        .filter(id=pain_id) \
+        .values_list('uuid', flat=True) \
+        .first()
+
+    # deleted meanwhile, the reactions went with it
+    if pain_uuid is None:
+        return
+
+    translate_ids = set(
+        Translate.objects
+        .filter(id__in={x['t'] for x in entries.values()})
+        .values_list('id', flat=True)
+    )
+
+    changes = Reaction.objects.upsert([
+        {
+            'user_id': user_id,
+            'pain_id': pain_id,
+            'translate_id': x['t'],
+            'identifier': x['i'],
+            'uuid': x['u'],
+        } for user_id, x in entries.items() if x['t'] in translate_ids
+    ])
+
+    PainReactionStats.objects.apply_changes([
+        (x.pain_id, x.identifier, previous) for x, previous in changes
+    ])
+    PainReactionStats.objects.mark_flushed(pain_id, token)
+
+    trending.record_many([
+        (x.pain_id, x.identifier) for x, previous in changes if previous is None
+    ])
+
+    bump_pains([pain_uuid])
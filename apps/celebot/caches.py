@@ -0,0 +1,61 @@
+import hashlib
+import json
+import time
+
+from django.core.cache import cache
+
+VERSION_KEY = 'celebot:version:%s'
+
+
+def get_version(name):
+    """
+    Current version of a cache namespace. A missing (evicted) version
+    starts from the clock so old entries are never served again
+    """
+    key = VERSION_KEY % name
+    version = cache.get(key)
+
+    if version is None:
+        cache.add(key, int(time.time() * 1000), None)
+        version = cache.get(key, 1)
+    return version
+
+
+def bump_version(name):
+    """Invalidate every entry in the namespace"""
+    key = VERSION_KEY % name
+
+    try:
+        return cache.incr(key)
+    except ValueError:
+        version = int(time.time() * 1000)
+        cache.set(key, version, None)
+        return version
+
+
+def make_key(name, *parts, signature=None):
+    """
+    Versioned cache key, :signature is a dict of filters
+    hashed so it fits memcached key limits
+    """
+    key = ['celebot', name, str(get_version(name))]
+    key.extend(str(x) for x in parts)
+
+    if signature is not None:
+        data = json.dumps(signature, sort_keys=True, default=str)
+        key.append(hashlib.md5(data.encode('utf-8')).hexdigest())
+    return ':'.join(key)
+
+
+def pain_version_name(uuid):
+    """Namespace of one pain, bumped by writes touching its detail"""
+    return 'pain:%s' % uuid
+
+
+def profile_version_name(user_id):
+    return 'profile:%s' % user_id
+
+
+def bump_pains(uuids):
+    for uuid in set(uuids):
+        bump_version(pain_version_name(uuid))
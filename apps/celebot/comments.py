@@ -0,0 +1,228 @@
+"""
+Comment trees read through CommentClosure
+
+Every read returns comments with the author and profile joined and
+:parent_uuid annotated, replies are nested under `thread_replies`
+
+Pain.comment_count and Comment.reply_count move with the writes here,
+reconcile() repairs what other deletes (cascades, admin) left behind
+"""
+from django.apps import apps
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.expressions import Window
+from django.db.models.functions import Greatest, RowNumber
+from django.utils import timezone
+
+from . import trending
+from .caches import bump_pains
+
+Pain = apps.get_model('celebot', 'Pain')
+Comment = apps.get_model('celebot', 'Comment')
+CommentClosure = apps.get_model('celebot', 'CommentClosure')
+ParentChildComment = apps.get_model('celebot', 'ParentChildComment')
+
+CHECKED_KEY = 'celebot:comment:checked'
+
+
+def with_parent(queryset):
+    parent = CommentClosure.objects \
+        .filter(descendant=OuterRef('pk'), depth=1) \
+        .values('ancestor__uuid')[:1]
+
+    return queryset \
+        .select_related('user', 'user__profile', 'translate') \
+        .annotate(parent_uuid=Subquery(parent))
+
+
+@transaction.atomic
+def create_comment(parent=None, **fields):
+    """Comment with its adjacency and closure rows"""
+    if parent is not None:
+        fields['depth'] = parent.depth + 1
+
+    instance = Comment.objects.create(**fields)
+    if parent is not None:
+        ParentChildComment.objects.create(parent=parent, child=instance)
+        Comment.objects.filter(id=parent.id) \
+            .update(reply_count=F('reply_count') + 1)
+
+    CommentClosure.objects.attach(instance, parent=parent)
+    Pain.objects.filter(id=instance.pain_id) \
+        .update(comment_count=F('comment_count') + 1)
+
+    trending.record(instance.pain_id, 'comment')
+    bump_pains([instance.pain.uuid])
+    return instance
+
+
+@transaction.atomic
+def delete_comment(instance):
+    """Delete the comment and its whole subtree"""
+    parent_id = CommentClosure.objects \
+        .filter(descendant=instance, depth=1) \
+        .values_list('ancestor_id', flat=True) \
+        .first()
+
+    _count, deleted = Comment.objects \
+        .filter(ancestor_closures__ancestor=instance) \
+        .delete()
+    deleted = deleted.get(Comment._meta.label, 0)
+
+    if parent_id is not None:
+        Comment.objects.filter(id=parent_id) \
+            .update(reply_count=Greatest(F('reply_count') - 1, 0))
+
+    Pain.objects.filter(id=instance.pain_id) \
+        .update(comment_count=Greatest(F('comment_count') - deleted, 0))
+
+    bump_pains([instance.pain.uuid])
+    return deleted
+
+
+def get_thread(instance, depth=None):
+    """
+    Subtree of :instance in one query, :depth levels below it
+    or all of them. Return :instance with the replies nested
+    """
+    lookup = {'ancestor_closures__ancestor': instance}
+    if depth is not None:
+        # same join as the ancestor, one filter() call
+        lookup['ancestor_closures__depth__lte'] = depth
+
+    queryset = Comment.objects.filter(**lookup)
+
+    comments = list(with_parent(queryset).order_by('create_at', 'id'))
+    nodes = {x.uuid: x for x in comments}
+
+    for comment in comments:
+        comment.thread_replies = list()
+
+    root = nodes.get(instance.uuid, instance)
+    for comment in comments:
+        parent = nodes.get(comment.parent_uuid)
+        if parent is not None and comment is not root:
+            parent.thread_replies.append(comment)
+    return root
+
+
+def attach_replies(instances, limit):
+    """
+    First :limit direct replies of every comment in :instances, ranked
+    per parent with ROW_NUMBER() so a long thread doesn't load whole
+    """
+    parents = {x.id: x for x in instances}
+    for instance in instances:
+        instance.thread_replies = list()
+
+    if not parents or limit <= 0:
+        return instances
+
+    ranked = CommentClosure.objects \
+        .filter(ancestor_id__in=list(parents), depth=1) \
+        .annotate(reply_rank=Window(
+            expression=RowNumber(),
+            partition_by=[F('ancestor_id')],
+            order_by=F('descendant_id').asc()
+        )) \
+        .values('descendant_id', 'reply_rank')
+
+    sql, params = ranked.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT descendant_id FROM (%s) ranked WHERE reply_rank <= %%s' % sql,
+            params + (limit,)
+        )
+        reply_ids = [x[0] for x in cursor.fetchall()]
+
+    if not reply_ids:
+        return instances
+
+    replies = with_parent(Comment.objects.filter(id__in=reply_ids)) \
+        .order_by('create_at', 'id')
+
+    uuids = {x.uuid: x for x in instances}
+    for reply in replies:
+        reply.thread_replies = list()
+        uuids[reply.parent_uuid].thread_replies.append(reply)
+    return instances
+
+
+def reconcile_pains(pain_ids):
+    """
+    Compare the counters of :pain_ids and their comments with the real
+    counts, fix the drifted ones. Return ids of the pains drifted
+    """
+    comment_counts = dict(
+        Comment.objects
+        .filter(pain_id__in=pain_ids)
+        .values('pain_id')
+        .order_by()
+        .annotate(count=Count('id'))
+        .values_list('pain_id', 'count')
+    )
+    # from the adjacency record, closure rows can be missing
+    # for older comments, see rebuild_comment_closure
+    reply_counts = dict(
+        ParentChildComment.objects
+        .filter(parent__pain_id__in=pain_ids)
+        .values('parent_id')
+        .order_by()
+        .annotate(count=Count('child_id', distinct=True))
+        .values_list('parent_id', 'count')
+    )
+
+    drifted = set()
+    pains = Pain.objects \
+        .filter(id__in=pain_ids) \
+        .values_list('id', 'uuid', 'comment_count')
+
+    for pain_id, uuid, comment_count in pains:
+        count = comment_counts.get(pain_id, 0)
+        if count != comment_count:
+            Pain.objects.filter(id=pain_id).update(comment_count=count)
+            drifted.add(uuid)
+
+    comments = Comment.objects \
+        .filter(pain_id__in=pain_ids) \
+        .values_list('id', 'pain__uuid', 'reply_count')
+
+    for comment_id, uuid, reply_count in comments:
+        count = reply_counts.get(comment_id, 0)
+        if count != reply_count:
+            Comment.objects.filter(id=comment_id).update(reply_count=count)
+            drifted.add(uuid)
+
+    bump_pains(drifted)
+    return drifted
+
+
+def reconcile(full=False, chunk_size=500):
+    """
+    Repair comment counters. Only pains with comments written since
+    the last run unless :full. Return number of pains drifted
+    """
+    now = timezone.now()
+    checked = cache.get(CHECKED_KEY)
+
+    if not full and checked is not None:
+        # overlap for transactions committed late, deleted comments
+        # are still in the history
+        since = checked - timezone.timedelta(minutes=1)
+        pain_ids = Comment.history \
+            .filter(history_date__gte=since) \
+            .order_by() \
+            .values_list('pain_id', flat=True)
+    else:
+        pain_ids = Pain.objects.order_by().values_list('id', flat=True)
+
+    pain_ids = sorted(set(pain_ids))
+    drifted = 0
+
+    for i in range(0, len(pain_ids), chunk_size):
+        with transaction.atomic():
+            drifted += len(reconcile_pains(pain_ids[i:i + chunk_size]))
+
+    cache.set(CHECKED_KEY, now, None)
+    return drifted
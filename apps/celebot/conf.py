@@ -6,5 +6,96 @@ from appconf import AppConf
 class CelebotAppConf(AppConf):
     DEFAULT_LOCALE = 'en_US'
 
+    # Items accepted by POST /pains/batch/
+    PAIN_BATCH_MAX_SIZE = 100
+
+    # Items accepted by POST /reactions/batch/
+    REACTION_BATCH_MAX_SIZE = 100
+
+    # Write-behind reaction buffer, a redis url enable it
+    # see apps.celebot.buffer
+    REACTION_BUFFER_URL = None
+
+    # Cached reaction stat of a pain, read again after
+    # REACTION_STAT_CACHE_FRESH seconds by one request
+    REACTION_STAT_CACHE_TIMEOUT = 60 * 10
+    REACTION_STAT_CACHE_FRESH = 10
+
+    # Websocket, at most one stat update per pain every
+    # LIVE_STAT_INTERVAL seconds
+    LIVE_STAT_INTERVAL = 2
+    LIVE_MAX_SUBSCRIPTIONS = 50
+
+    # Reaction rollups, reactions younger than ROLLUP_SETTLE
+    # seconds wait for the next run
+    ROLLUP_SETTLE = 60
+    TIMELINE_MAX_BUCKETS = 24 * 31
+
+    # Tag autocomplete, each process check the tags version
+    # every TAG_INDEX_CHECK_INTERVAL seconds. The most used tags of
+    # prefixes up to TAG_INDEX_SHORT_PREFIX characters are ranked
+    # ahead, they match too many tags to scan per keystroke
+    TAG_INDEX_CHECK_INTERVAL = 5
+    TAG_INDEX_SHORT_PREFIX = 2
+    TAG_AUTOCOMPLETE_LIMIT = 10
+    TAG_AUTOCOMPLETE_MAX_LIMIT = 50
+
+    # GET /tags/<slug>/related/
+    TAG_RELATED_LIMIT = 10
+
+    # Direct replies inlined under each top-level comment,
+    # ?replies= up to COMMENT_INLINE_REPLIES_MAX
+    COMMENT_INLINE_REPLIES = 3
+    COMMENT_INLINE_REPLIES_MAX = 20
+
+    # Resumable uploads, see apps.celebot.uploads
+    # partial files under MEDIA_ROOT/uploads/partial unless
+    # UPLOAD_TEMP_DIR, it must be shared by every web worker
+    UPLOAD_TEMP_DIR = None
+    UPLOAD_BLOCK_SIZE = 64 * 1024
+    # a PATCH keep the session UPLOAD_LOCK_TIMEOUT seconds after its
+    # last block, a stalled request free it for the client retry
+    UPLOAD_LOCK_TIMEOUT = 60
+    UPLOAD_EXPIRE = 60 * 60 * 24
+    UPLOAD_MAX_SIZE = {
+        'attachment': 1024 * 1024 * 20,
+        'picture': 1000 * 2500,
+    }
+    UPLOAD_MIMES = {
+        'picture': ('image/jpeg', 'image/png',),
+    }
+
+    # Image attachment thumbnails, {size: (width, height, crop)}
+    # formats and quality from PERSON_THUMBNAIL_*
+    ATTACHMENT_THUMBNAILS = {
+        'medium': (480, 480, False),
+        'large': (1280, 1280, False),
+    }
+
+    # Paginated totals
+    COUNT_CACHE_TIMEOUT = 60 * 5
+    COUNT_ESTIMATE_THRESHOLD = 100000
+
+    # Cached viewer independent pain detail
+    PAIN_DETAIL_CACHE_TIMEOUT = 60 * 60
+
+    # Trending, score halves every TRENDING_HALF_LIFE seconds
+    TRENDING_HALF_LIFE = 60 * 60 * 6
+    TRENDING_WINDOW = 60 * 60 * 24 * 7
+    TRENDING_WEIGHTS = {
+        'celebrate': 1.0,
+        'support': 1.0,
+        'favorite': 1.5,
+        'insightful': 2.0,
+        'curious': 0.5,
+        'comment': 2.0,
+    }
+
+    # Full-text search, BM25
+    SEARCH_MAX_RESULTS = 1000
+    SEARCH_BM25_K1 = 1.2
+    SEARCH_BM25_B = 0.75
+    SEARCH_STATS_TIMEOUT = 60 * 5
+
     class Meta:
         perefix = 'celebot'
@@ -0,0 +1,79 @@
+import uuid
+
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from django.utils.translation import gettext_lazy as _
+
+from .conf import settings
+from .live import FEED_GROUP, pain_group
+
+
+class LiveConsumer(AsyncJsonWebsocketConsumer):
+    """
+    Authenticated with apps.person.middleware.JWTAuthMiddleware
+
+    SEND
+    -----
+        {"action": "subscribe", "pain": "uuid64"}
+        {"action": "subscribe", "feed": "pains"}
+        {"action": "unsubscribe", "pain": "uuid64"}
+
+    RECEIVE
+    -----
+        {"type": "pain.stat", "pain": "uuid64", "stat": {...}}
+        {"type": "pain.created", "pain": "uuid64", "user": "uuid64"}
+    """
+
+    async def connect(self):
+        if not self.scope['user'].is_authenticated:
+            await self.close(code=4401)
+            return
+
+        self.subscriptions = set()
+        await self.accept()
+
+    async def disconnect(self, code):
+        for group in getattr(self, 'subscriptions', []):
+            await self.channel_layer.group_discard(group, self.channel_name)
+
+    async def receive_json(self, content, **kwargs):
+        action = content.get('action') if isinstance(content, dict) else None
+        group = self.get_group(content) if action else None
+
+        if action not in ('subscribe', 'unsubscribe') or group is None:
+            await self.send_json({
+                'type': 'error',
+                'detail': str(_("Invalid action."))
+            })
+            return
+
+        if action == 'subscribe':
+            if len(self.subscriptions) >= settings.CELEBOT_LIVE_MAX_SUBSCRIPTIONS:
+                await self.send_json({
+                    'type': 'error',
+                    'detail': str(_("Too many subscriptions."))
+                })
+                return
+
+            await self.channel_layer.group_add(group, self.channel_name)
+            self.subscriptions.add(group)
+        else:
+            await self.channel_layer.group_discard(group, self.channel_name)
+            self.subscriptions.discard(group)
+
+        ret = {x: content[x] for x in ('pain', 'feed') if x in content}
+        await self.send_json({'type': action, **ret})
+
+    def get_group(self, content):
+        if content.get('feed') == 'pains':
+            return FEED_GROUP
+
+        try:
+            return pain_group(uuid.UUID(str(content.get('pain'))))
+        except ValueError:
+            return None
+
+    async def pain_stat(self, event):
+        await self.send_json(event['data'])
+
+    async def pain_created(self, event):
+        await self.send_json(event['data'])
@@ -0,0 +1,186 @@
+"""
+Tag pairs used together on the same object
+
+The TagItem history is the change feed, rows after the watermark are
+replayed per object on top of the tags the object had before them so
+a chunk boundary never counts a pair twice. History ids are uuids, the
+watermark is the history_date in microseconds
+"""
+from collections import Counter
+from itertools import combinations
+
+from django.apps import apps
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .conf import settings
+
+TagItem = apps.get_model('celebot', 'TagItem')
+TagCooccurrence = apps.get_model('celebot', 'TagCooccurrence')
+RollupWatermark = apps.get_model('celebot', 'RollupWatermark')
+
+WATERMARK = 'tag_cooccurrence'
+EPOCH = timezone.datetime(1970, 1, 1, tzinfo=timezone.utc)
+MICROSECOND = timezone.timedelta(microseconds=1)
+
+
+def to_position(value):
+    return (value - EPOCH) // MICROSECOND
+
+
+def from_position(position):
+    return EPOCH + position * MICROSECOND
+
+
+def count_pairs(counts, tag_id, others, delta):
+    for other in others:
+        counts[(tag_id, other)] += delta
+        counts[(other, tag_id)] += delta
+
+
+def update(chunk_size=2000):
+    """
+    Apply the TagItem history written after the watermark, one
+    transaction per chunk of about :chunk_size rows, rows of the same
+    date are never split. Return number of history rows applied
+    """
+    History = TagItem.history.model
+    # rows of transactions still open get a chance to commit
+    settled = timezone.now() - timezone.timedelta(
+        seconds=settings.CELEBOT_ROLLUP_SETTLE
+    )
+    applied = 0
+
+    while True:
+        with transaction.atomic():
+            watermark, _created = RollupWatermark.objects \
+                .select_for_update() \
+                .get_or_create(name=WATERMARK)
+            since = from_position(watermark.position)
+
+            pending = History.objects \
+                .filter(history_date__gt=since, history_date__lte=settled) \
+                .order_by('history_date')
+
+            until = pending.values_list('history_date', flat=True)[chunk_size - 1:chunk_size]
+            until = until[0] if until else settled
+
+            chunk = pending \
+                .filter(history_date__lte=until) \
+                .values_list('history_date', 'content_type_id', 'object_id', 'tag_id', 'history_type')
+            chunk = list(chunk)
+            if not chunk:
+                break
+
+            objects = {(x[1], x[2]) for x in chunk}
+            object_ids = {x[2] for x in chunk}
+
+            # tags now, the later history undone below
+            tags = {x: set() for x in objects}
+            items = TagItem.objects \
+                .filter(object_id__in=object_ids) \
+                .values_list('content_type_id', 'object_id', 'tag_id')
+
+            for content_type_id, object_id, tag_id in items:
+                if (content_type_id, object_id) in tags:
+                    tags[(content_type_id, object_id)].add(tag_id)
+
+            later = History.objects \
+                .filter(history_date__gt=since, object_id__in=object_ids) \
+                .order_by('-history_date') \
+                .values_list('content_type_id', 'object_id', 'tag_id', 'history_type')
+
+            for content_type_id, object_id, tag_id, history_type in later:
+                key = (content_type_id, object_id)
+                if key not in tags:
+                    continue
+
+                if history_type == '+':
+                    tags[key].discard(tag_id)
+                elif history_type == '-':
+                    tags[key].add(tag_id)
+
+            counts = Counter()
+            for _date, content_type_id, object_id, tag_id, history_type in chunk:
+                current = tags[(content_type_id, object_id)]
+
+                if history_type == '+' and tag_id not in current:
+                    count_pairs(counts, tag_id, current, 1)
+                    current.add(tag_id)
+                elif history_type == '-' and tag_id in current:
+                    current.discard(tag_id)
+                    count_pairs(counts, tag_id, current, -1)
+
+            counts = {k: v for k, v in counts.items() if v}
+            TagCooccurrence.objects.increment(counts)
+            TagCooccurrence.objects \
+                .filter(tag_id__in={x[0] for x in counts}, count__lte=0) \
+                .delete()
+
+            watermark.position = to_position(chunk[-1][0])
+            watermark.save(update_fields=('position', 'update_at'))
+            applied += len(chunk)
+    return applied
+
+
+@transaction.atomic
+def rebuild(batch_size=1000):
+    """
+    Count every pair again from TagItem, a sparse Counter streamed
+    object by object. The watermark moves to the newest history row
+    of the same snapshot. Return number of pairs
+    """
+    History = TagItem.history.model
+
+    # the history and TagItem are read in one snapshot, InnoDB use
+    # REPEATABLE READ already. Must be the first statement
+    if connection.vendor == 'postgresql' and not connection.savepoint_ids:
+        with connection.cursor() as cursor:
+            cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+
+    watermark, _created = RollupWatermark.objects \
+        .select_for_update() \
+        .get_or_create(name=WATERMARK)
+
+    # newest change the scan below sees, update() replay the later ones
+    latest = History.objects.aggregate(latest=Max('history_date'))['latest']
+
+    items = TagItem.objects \
+        .order_by('content_type_id', 'object_id') \
+        .values_list('content_type_id', 'object_id', 'tag_id') \
+        .iterator()
+
+    counts = Counter()
+    key = None
+    tags = list()
+
+    for content_type_id, object_id, tag_id in items:
+        if (content_type_id, object_id) != key:
+            counts.update(combinations(sorted(set(tags)), 2))
+            key = (content_type_id, object_id)
+            tags = list()
+        tags.append(tag_id)
+    counts.update(combinations(sorted(set(tags)), 2))
+
+    TagCooccurrence.objects.all().delete()
+    TagCooccurrence.objects.bulk_create(
+        [
+            TagCooccurrence(tag_id=x[0], related_id=x[1], count=v)
+            for k, v in counts.items()
+            for x in (k, k[::-1])
+        ],
+        batch_size=batch_size
+    )
+
+    if latest is not None:
+        watermark.position = to_position(latest)
+        watermark.save(update_fields=('position', 'update_at'))
+    return len(counts)
+
+
+def get_related(tag_id, limit=10):
+    return TagCooccurrence.objects \
+        .filter(tag_id=tag_id, count__gt=0) \
+        .select_related('related') \
+        .order_by('-count')[:limit]
@@ -1,4 +1,17 @@
-from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.utils.dateparse import parse_datetime
+from django.utils.translation import gettext_lazy as _
+from django.utils.translation.trans_real import parse_accept_lang_header
+
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.utils.urls import replace_query_param
+
+from apps.person.helpers import KeysetPagination  # noqa
+from .caches import make_key
+from .conf import settings
+from .locales import LocaleChoices
 
 
 class Pagination:
@@ -19,11 +32,196 @@ class Pagination:
         self.show_full_result_count = True
 
 
+def match_locales(code):
+    """
+    Known locales for a language code, exact first then the
+    same language in other regions. ie id-ID -> ['id_ID']
+    """
+    code = code.replace('-', '_')
+    language, _sep, region = code.partition('_')
+    code = '%s_%s' % (language.lower(), region.upper()) if region else language.lower()
+
+    ret = [code] if code in LocaleChoices.values else []
+    ret.extend(
+        x for x in LocaleChoices.values
+        if x != code and x.split('_')[0] == language.lower()
+    )
+    return ret
+
+
+def get_locale_chain(request):
+    """
+    Fallback chain of locales for the request
+    ?locale= then Accept-Language then CELEBOT_DEFAULT_LOCALE
+    """
+    candidates = list()
+
+    locale = request.query_params.get('locale', None)
+    if locale:
+        candidates.append(locale)
+
+    header = request.META.get('HTTP_ACCEPT_LANGUAGE', '')
+    candidates.extend(
+        x[0] for x in parse_accept_lang_header(header) if x[0] != '*'
+    )
+    candidates.append(settings.CELEBOT_DEFAULT_LOCALE)
+
+    chain = list()
+    for candidate in candidates:
+        for code in match_locales(candidate):
+            if code not in chain:
+                chain.append(code)
+    return chain
+
+
+def get_timeline_window(request):
+    """
+    ?granularity=hour|day&since=<datetime>&until=<datetime>
+    Return (granularity, since, until) for apps.celebot.rollups.timeline
+    """
+    from .rollups import get_window
+
+    granularity = request.query_params.get('granularity', 'day')
+    params = dict()
+
+    for name in ('since', 'until'):
+        value = request.query_params.get(name, None)
+        if not value:
+            continue
+
+        try:
+            params[name] = parse_datetime(value)
+        except ValueError:
+            params[name] = None
+
+        if params[name] is None:
+            raise ValidationError(detail={name: _("Invalid datetime.")})
+
+    try:
+        since, until = get_window(granularity, **params)
+    except ValueError:
+        raise ValidationError(detail={
+            'granularity': _("Unknown granularity or too many buckets.")
+        })
+    return granularity, since, until
+
+
+def estimate_count(model):
+    """
+    Row count from the table statistics, None if the backend
+    doesn't keep them (sqlite)
+    """
+    table = model._meta.db_table
+
+    with connection.cursor() as cursor:
+        if connection.vendor == 'mysql':
+            cursor.execute(
+                "SELECT TABLE_ROWS FROM information_schema.TABLES "
+                "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+                [table]
+            )
+        elif connection.vendor == 'postgresql':
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE relname = %s",
+                [table]
+            )
+        else:
+            return None
+        row = cursor.fetchone()
+
+    if not row or row[0] is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+class CountedPagination(LimitOffsetPagination):
+    """
+    LimitOffsetPagination with a count strategy, views opt in by
+    passing the filter :signature to paginate_queryset
+
+    :count_kind tell which total returned;
+        exact       COUNT(*) on the queryset
+        cached      exact count cached per filter signature
+        estimate    table statistics, unfiltered and above threshold
+        None        ?count=false, no total at all
+    """
+    count_query_param = 'count'
+    count_cache_name = None
+
+    def __init__(self, count_cache_name=None):
+        if count_cache_name:
+            self.count_cache_name = count_cache_name
+
+    def is_count_disabled(self, request):
+        value = request.query_params.get(self.count_query_param, '')
+        return value.lower() in ('false', '0', 'no')
+
+    def get_count_strategy(self, queryset, request, signature=None):
+        if self.is_count_disabled(request):
+            return None, None
+
+        if signature is None or not self.count_cache_name:
+            return self.get_count(queryset), 'exact'
+
+        # unfiltered, rows map to the table
+        if not any(signature.values()):
+            estimate = estimate_count(queryset.model)
+            if estimate is not None and estimate >= settings.CELEBOT_COUNT_ESTIMATE_THRESHOLD:
+                return estimate, 'estimate'
+
+        key = make_key(self.count_cache_name, signature=signature)
+        count = cache.get(key)
+        if count is not None:
+            return count, 'cached'
+
+        count = self.get_count(queryset)
+        cache.set(key, count, settings.CELEBOT_COUNT_CACHE_TIMEOUT)
+        return count, 'exact'
+
+    def paginate_queryset(self, queryset, request, view=None, signature=None):
+        self.request = request
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+
+        self.offset = self.get_offset(request)
+        self.count, self.count_kind = self.get_count_strategy(
+            queryset,
+            request,
+            signature=signature
+        )
+
+        if self.count_kind in ('exact', 'cached'):
+            self.has_next = self.offset + self.limit < self.count
+            if self.count == 0 or self.offset > self.count:
+                return []
+            return list(queryset[self.offset:self.offset + self.limit])
+
+        # total unknown or approximate, fetch one more row for next link
+        results = list(queryset[self.offset:self.offset + self.limit + 1])
+        self.has_next = len(results) > self.limit
+        return results[:self.limit]
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.limit_query_param, self.limit)
+        offset = self.offset + self.limit
+        return replace_query_param(url, self.offset_query_param, offset)
+
+
 def build_result_pagination(self, _PAGINATOR, serializer):
     result = {
         'offset': _PAGINATOR.offset,
         'limit': _PAGINATOR.limit,
         'total': _PAGINATOR.count,
+        'total_kind': getattr(
+            _PAGINATOR,
+            'count_kind',
+            'exact' if _PAGINATOR.count is not None else None
+        ),
         'previous': _PAGINATOR.get_previous_link(),
         'next': _PAGINATOR.get_next_link(),
         'results': serializer.data,
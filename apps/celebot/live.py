@@ -0,0 +1,66 @@
+"""
+Publish writes to the websocket groups of apps.celebot.consumers
+
+Stat updates are coalesced, the first write of a pain schedules one
+send after CELEBOT_LIVE_STAT_INTERVAL and the writes until then ride
+along with it
+"""
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.core.cache import cache
+from django.db import transaction
+
+from .conf import settings
+
+FEED_GROUP = 'celebot.feed.pains'
+PENDING_KEY = 'celebot:live:stat:%s'
+
+
+def pain_group(uuid):
+    return 'celebot.pain.%s' % uuid
+
+
+def group_send(group, kind, data):
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+
+    async_to_sync(channel_layer.group_send)(group, {
+        'type': kind.replace('.', '_'),
+        'data': {'type': kind, **data},
+    })
+
+
+def publish_stats(pains):
+    """:pains is list of (pain_id, pain_uuid) which counters changed"""
+    from .tasks import send_live_stat
+
+    def schedule():
+        interval = settings.CELEBOT_LIVE_STAT_INTERVAL
+
+        for pain_id, pain_uuid in set(pains):
+            if settings.DEBUG:
+                send_live_stat(pain_id, str(pain_uuid))  # without celery
+                continue
+
+            if cache.add(PENDING_KEY % pain_id, 1, interval):
+                send_live_stat.apply_async(
+                    (pain_id, str(pain_uuid)),
+                    countdown=interval
+                )  # with celery
+
+    transaction.on_commit(schedule)
+
+
+def publish_pains(pains):
+    """:pains is list of new Pain"""
+    events = [
+        {'pain': str(x.uuid), 'user': str(x.user.uuid)}
+        for x in pains
+    ]
+
+    def send():
+        for event in events:
+            group_send(FEED_GROUP, 'pain.created', event)
+
+    transaction.on_commit(send)
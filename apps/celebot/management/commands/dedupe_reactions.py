@@ -0,0 +1,42 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Max
+
+Reaction = apps.get_model('celebot', 'Reaction')
+PainReactionStats = apps.get_model('celebot', 'PainReactionStats')
+
+
+class Command(BaseCommand):
+    help = (
+        "Keep the latest reaction of every (user, pain), run before "
+        "adding the unique constraint"
+    )
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        duplicates = Reaction.objects \
+            .values('user_id', 'pain_id') \
+            .order_by() \
+            .annotate(count=Count('id'), last_id=Max('id')) \
+            .filter(count__gt=1)
+
+        pain_ids = set()
+        deleted = 0
+
+        for row in duplicates:
+            count, _deleted = Reaction.objects \
+                .filter(user_id=row['user_id'], pain_id=row['pain_id']) \
+                .exclude(id=row['last_id']) \
+                .delete()
+
+            pain_ids.add(row['pain_id'])
+            deleted += count
+
+        # deleting fire reaction_delete_handler, start again from the rows
+        if pain_ids:
+            PainReactionStats.objects.rebuild(pain_ids=pain_ids)
+
+        self.stdout.write(
+            self.style.SUCCESS("Deleted %d duplicate reactions" % deleted)
+        )
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from ...rollups import rebuild_global
+
+
+class Command(BaseCommand):
+    help = "Rebuild ReactionRollup from PainReactionRollup"
+
+    def handle(self, *args, **options):
+        rows = rebuild_global()
+        self.stdout.write(
+            self.style.SUCCESS("Rebuilt %d reaction rollups" % rows)
+        )
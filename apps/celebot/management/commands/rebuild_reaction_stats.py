@@ -0,0 +1,33 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+PainReactionStats = apps.get_model('celebot', 'PainReactionStats')
+
+
+class Command(BaseCommand):
+    help = "Rebuild PainReactionStats counters from Reaction"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--pain',
+            action='append',
+            dest='pains',
+            help="Pain uuid, can be repeated. Default all pains"
+        )
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        pain_ids = None
+        if options['pains']:
+            Pain = apps.get_model('celebot', 'Pain')
+            pain_ids = Pain.objects \
+                .filter(uuid__in=options['pains']) \
+                .values_list('id', flat=True)
+
+        rebuilt = PainReactionStats.objects.rebuild(
+            pain_ids=pain_ids,
+            chunk_size=options['chunk_size']
+        )
+        self.stdout.write(
+            self.style.SUCCESS("Rebuilt reaction stats for %d pains" % rebuilt)
+        )
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from ...cooccurrence import rebuild
+
+
+class Command(BaseCommand):
+    help = "Rebuild TagCooccurrence from TagItem"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        pairs = rebuild(batch_size=options['batch_size'])
+        self.stdout.write(
+            self.style.SUCCESS("Counted %d tag pairs" % pairs)
+        )
@@ -0,0 +1,39 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from ...tagindex import invalidate as invalidate_tag_index
+
+Tag = apps.get_model('celebot', 'Tag')
+
+
+class Command(BaseCommand):
+    help = "Rebuild Tag usage_count from TagItem"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tag',
+            action='append',
+            dest='tags',
+            help="Tag slug, can be repeated. Default all tags"
+        )
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        tag_ids = None
+        if options['tags']:
+            tag_ids = Tag.objects \
+                .filter(slug__in=options['tags']) \
+                .values_list('id', flat=True)
+
+        changed = Tag.objects.rebuild(
+            tag_ids=tag_ids,
+            chunk_size=options['chunk_size']
+        )
+
+        # update() write no history, every process load the index again
+        if changed:
+            invalidate_tag_index(reload=True)
+
+        self.stdout.write(
+            self.style.SUCCESS("Rebuilt usage count of %d tags" % changed)
+        )
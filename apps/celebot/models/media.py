@@ -1,10 +1,13 @@
 import os
 
+from django.conf import settings
 from django.db import models
 from django.utils.translation import ugettext_lazy as _
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 
+from apps.person.storage import blob_storage
+
 from .abstract import AbstractCommonField
 
 
@@ -13,11 +16,25 @@ class AbstractAttachment(AbstractCommonField):
     object_id = models.CharField(max_length=255)
     content_object = GenericForeignKey('content_type', 'object_id')
 
-    file = models.FileField(upload_to='attachment/%Y/%m/%d')
+    file = models.FileField(
+        upload_to='attachment/%Y/%m/%d',
+        storage=blob_storage,
+        db_index=True
+    )
     filename = models.CharField(max_length=255, editable=False)
     filepath = models.CharField(max_length=255, editable=False)
     filesize = models.IntegerField(editable=False)
     filemime = models.CharField(max_length=255, editable=False)
+    # sha256 hex digest of the content
+    filehash = models.CharField(
+        max_length=64,
+        editable=False,
+        db_index=True,
+        blank=True,
+        default=''
+    )
+    # images only, see apps.person.thumbnails
+    thumbnails = models.JSONField(default=dict, blank=True, editable=False)
 
     label = models.CharField(max_length=255, null=True, blank=True)
     caption = models.TextField(null=True, blank=True)
@@ -33,6 +50,50 @@ class AbstractAttachment(AbstractCommonField):
 
     def save(self, *args, **kwargs):
         if not self.label:
-            base = os.path.basename(self.file.name)
+            # the stored name is the content hash
+            base = self.filename or os.path.basename(self.file.name)
             self.label = base
         super().save(*args, **kwargs)
+
+
+class AbstractUploadSession(AbstractCommonField):
+    """
+    Resumable upload in progress, chunks are appended to :tempname
+    until :offset reach :length. See apps.celebot.uploads
+    """
+    class Targets(models.TextChoices):
+        ATTACHMENT = 'attachment', _("Attachment")
+        PICTURE = 'picture', _("Profile Picture")
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        related_name='upload_sessions',
+        on_delete=models.CASCADE
+    )
+    target = models.CharField(max_length=15, choices=Targets.choices)
+
+    # object of the attachment
+    content_type = models.ForeignKey(
+        ContentType,
+        null=True,
+        blank=True,
+        on_delete=models.CASCADE
+    )
+    object_id = models.CharField(max_length=255, null=True, blank=True)
+    label = models.CharField(max_length=255, null=True, blank=True)
+    caption = models.TextField(null=True, blank=True)
+
+    filename = models.CharField(max_length=255)
+    filemime = models.CharField(max_length=255, blank=True, default='')
+    tempname = models.CharField(max_length=255, editable=False)
+    length = models.PositiveBigIntegerField()
+    offset = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+        app_label = 'celebot'
+        verbose_name = _("Upload Session")
+        verbose_name_plural = _("Upload Sessions")
+
+    def __str__(self) -> str:
+        return self.filename
@@ -3,6 +3,9 @@ from simple_history.models import HistoricalRecords
 from .trouble import *
 from .respond import *
 from .media import *
+from .stat import *
+from .search import *
+from .rollup import *
 
 from ..utils import is_model_registered
 
@@ -73,3 +76,102 @@ if not is_model_registered('celebot', 'Attachment'):
             pass
 
     __all__.append('Attachment')
+
+
+# 7
+if not is_model_registered('celebot', 'PainReactionStats'):
+    class PainReactionStats(AbstractPainReactionStats):
+        class Meta(AbstractPainReactionStats.Meta):
+            pass
+
+    __all__.append('PainReactionStats')
+
+
+# 8
+if not is_model_registered('celebot', 'SearchTerm'):
+    class SearchTerm(AbstractSearchTerm):
+        class Meta(AbstractSearchTerm.Meta):
+            pass
+
+    __all__.append('SearchTerm')
+
+
+# 9
+if not is_model_registered('celebot', 'SearchPosting'):
+    class SearchPosting(AbstractSearchPosting):
+        class Meta(AbstractSearchPosting.Meta):
+            pass
+
+    __all__.append('SearchPosting')
+
+
+# 10
+if not is_model_registered('celebot', 'PainTrend'):
+    class PainTrend(AbstractPainTrend):
+        class Meta(AbstractPainTrend.Meta):
+            pass
+
+    __all__.append('PainTrend')
+
+
+# 11
+if not is_model_registered('celebot', 'PainReactionRollup'):
+    class PainReactionRollup(AbstractPainReactionRollup):
+        class Meta(AbstractPainReactionRollup.Meta):
+            pass
+
+    __all__.append('PainReactionRollup')
+
+
+# 12
+if not is_model_registered('celebot', 'TagReactionRollup'):
+    class TagReactionRollup(AbstractTagReactionRollup):
+        class Meta(AbstractTagReactionRollup.Meta):
+            pass
+
+    __all__.append('TagReactionRollup')
+
+
+# 13
+if not is_model_registered('celebot', 'RollupWatermark'):
+    class RollupWatermark(AbstractRollupWatermark):
+        class Meta(AbstractRollupWatermark.Meta):
+            pass
+
+    __all__.append('RollupWatermark')
+
+
+# 14
+if not is_model_registered('celebot', 'TagCooccurrence'):
+    class TagCooccurrence(AbstractTagCooccurrence):
+        class Meta(AbstractTagCooccurrence.Meta):
+            pass
+
+    __all__.append('TagCooccurrence')
+
+
+# 15
+if not is_model_registered('celebot', 'CommentClosure'):
+    class CommentClosure(AbstractCommentClosure):
+        class Meta(AbstractCommentClosure.Meta):
+            pass
+
+    __all__.append('CommentClosure')
+
+
+# 16
+if not is_model_registered('celebot', 'UploadSession'):
+    class UploadSession(AbstractUploadSession):
+        class Meta(AbstractUploadSession.Meta):
+            pass
+
+    __all__.append('UploadSession')
+
+
+# 17
+if not is_model_registered('celebot', 'ReactionRollup'):
+    class ReactionRollup(AbstractReactionRollup):
+        class Meta(AbstractReactionRollup.Meta):
+            pass
+
+    __all__.append('ReactionRollup')
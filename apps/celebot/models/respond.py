@@ -1,7 +1,11 @@
+import uuid
+
+from django.apps import apps
 from django.contrib.contenttypes.fields import GenericRelation
 from django.core.validators import RegexValidator
-from django.db import models
+from django.db import connections, models, transaction
 from django.conf import settings
+from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 
 from taggit.managers import TaggableManager
@@ -10,6 +14,219 @@ from .tag import TagItem
 from .abstract import AbstractCommonField
 
 
+class ReactionQuerySet(models.query.QuerySet):
+    upsert_fields = ('uuid', 'create_at', 'update_at', 'user', 'pain',
+                     'translate', 'identifier',)
+    upsert_updates = ('update_at', 'translate', 'identifier',)
+
+    @transaction.atomic
+    def upsert(self, rows, user=None, batch_size=500):
+        """
+        Insert or update reactions keyed by (user, pain)
+        :rows is list of dict of user_id, pain_id, translate_id and
+        identifier, the last one wins for the same key
+        Return list of (instance, previous identifier)
+
+        New keys go through an insert that tells which rows it
+        created, the others are locked and read before they are
+        updated, so a key inserted concurrently is an update here
+        and the counters move once
+        """
+        rows = list({(x['user_id'], x['pain_id']): x for x in rows}.values())
+        if not rows:
+            return []
+
+        # old identifiers for the counters, see PainReactionStats
+        previous = self._lock_previous([(x['user_id'], x['pain_id']) for x in rows])
+        fresh = [x for x in rows if (x['user_id'], x['pain_id']) not in previous]
+
+        connection = connections[self.db]
+        created = set()
+        # history already written by the post_save of simple_history
+        signaled = set()
+
+        for i in range(0, len(fresh), batch_size):
+            chunk = fresh[i:i + batch_size]
+            inserted = self._insert_sql(connection, chunk)
+
+            if inserted is None:
+                inserted = set()
+                for row in chunk:
+                    _instance, is_created = self.get_or_create(
+                        user_id=row['user_id'],
+                        pain_id=row['pain_id'],
+                        defaults={
+                            'translate_id': row['translate_id'],
+                            'identifier': row['identifier'],
+                        }
+                    )
+                    if is_created:
+                        inserted.add((row['user_id'], row['pain_id']))
+                signaled.update(inserted)
+            created.update(inserted)
+
+        # inserted by a concurrent request after our read
+        raced = [
+            (x['user_id'], x['pain_id']) for x in fresh
+            if (x['user_id'], x['pain_id']) not in created
+        ]
+        if raced:
+            previous.update(self._lock_previous(raced))
+
+        existing = [x for x in rows if (x['user_id'], x['pain_id']) not in created]
+        for i in range(0, len(existing), batch_size):
+            chunk = existing[i:i + batch_size]
+            if not self._upsert_sql(connection, chunk):
+                for row in chunk:
+                    self.filter(user_id=row['user_id'], pain_id=row['pain_id']) \
+                        .update(
+                            translate_id=row['translate_id'],
+                            identifier=row['identifier'],
+                            update_at=timezone.now()
+                        )
+
+        instances = {
+            (x.user_id, x.pain_id): x
+            for x in self.filter(
+                user_id__in={x['user_id'] for x in rows},
+                pain_id__in={x['pain_id'] for x in rows}
+            )
+        }
+
+        ret = list()
+        history_created = list()
+        history_updated = list()
+
+        for row in rows:
+            key = (row['user_id'], row['pain_id'])
+            instance = instances[key]
+
+            if key in created:
+                if key not in signaled:
+                    history_created.append(instance)
+                ret.append((instance, None))
+                continue
+
+            old = previous[key]
+            if old != (instance.identifier, instance.translate_id):
+                history_updated.append(instance)
+            ret.append((instance, old[0]))
+
+        history = self.model.history
+        history.bulk_history_create(history_created, default_user=user)
+        history.bulk_history_create(history_updated, update=True, default_user=user)
+        return ret
+
+    def _lock_previous(self, keys):
+        """(identifier, translate_id) of the existing :keys, locked"""
+        lookup = {
+            'user_id__in': {x[0] for x in keys},
+            'pain_id__in': {x[1] for x in keys},
+        }
+        previous = self.select_for_update() \
+            .filter(**lookup) \
+            .values_list('user_id', 'pain_id', 'identifier', 'translate_id')
+        keys = set(keys)
+        return {x[:2]: x[2:] for x in previous if x[:2] in keys}
+
+    def _values_sql(self, connection, rows):
+        """INSERT statement without conflict clause and its params"""
+        opts = self.model._meta
+        qn = connection.ops.quote_name
+        fields = [opts.get_field(x) for x in self.upsert_fields]
+
+        now = timezone.now()
+        params = list()
+        for row in rows:
+            instance = self.model(create_at=now, update_at=now, **row)
+            params.extend(
+                x.get_db_prep_save(getattr(instance, x.attname), connection)
+                for x in fields
+            )
+
+        placeholder = '(%s)' % ', '.join(['%s'] * len(fields))
+        sql = 'INSERT INTO %s (%s) VALUES %s' % (
+            qn(opts.db_table),
+            ', '.join(qn(x.column) for x in fields),
+            ', '.join([placeholder] * len(rows))
+        )
+        return sql, params
+
+    def _insert_sql(self, connection, rows):
+        """
+        Insert the rows whose key is free, return the set of keys
+        inserted or None when the backend can't tell
+        """
+        opts = self.model._meta
+        qn = connection.ops.quote_name
+        key = [qn(opts.get_field(x).column) for x in ('user', 'pain')]
+
+        if connection.vendor == 'mysql':
+            # no RETURNING and affected rows can't tell with FOUND_ROWS,
+            # a row is ours when it kept the uuid we gave, the conflict
+            # clause leaves the existing row as is
+            rows = [
+                dict(x, uuid=uuid.UUID(str(x['uuid'])) if x.get('uuid') else uuid.uuid4())
+                for x in rows
+            ]
+            sql, params = self._values_sql(connection, rows)
+            column = qn(opts.get_field('update_at').column)
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    sql + ' ON DUPLICATE KEY UPDATE {0} = {0}'.format(column),
+                    params
+                )
+
+            given = {(x['user_id'], x['pain_id']): x['uuid'] for x in rows}
+            stored = self.select_for_update() \
+                .filter(
+                    user_id__in={x[0] for x in given},
+                    pain_id__in={x[1] for x in given}
+                ) \
+                .values_list('user_id', 'pain_id', 'uuid')
+            return {x[:2] for x in stored if given.get(x[:2]) == x[2]}
+
+        if connection.vendor == 'postgresql' or (
+                connection.vendor == 'sqlite'
+                and connection.Database.sqlite_version_info >= (3, 35)):
+            # a conflicting insert not committed yet is waited for
+            sql, params = self._values_sql(connection, rows)
+            sql += ' ON CONFLICT (%s) DO NOTHING RETURNING %s' % (
+                ', '.join(key), ', '.join(key)
+            )
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                return {tuple(x) for x in cursor.fetchall()}
+
+        return None
+
+    def _upsert_sql(self, connection, rows):
+        """Native upsert, False when the backend can't do it"""
+        opts = self.model._meta
+        qn = connection.ops.quote_name
+        key = [qn(opts.get_field(x).column) for x in ('user', 'pain')]
+        updates = [qn(opts.get_field(x).column) for x in self.upsert_updates]
+
+        if connection.vendor == 'mysql':
+            conflict = 'ON DUPLICATE KEY UPDATE ' + ', '.join(
+                '{0} = VALUES({0})'.format(x) for x in updates
+            )
+        elif connection.vendor == 'postgresql' or (
+                connection.vendor == 'sqlite'
+                and connection.Database.sqlite_version_info >= (3, 24)):
+            conflict = 'ON CONFLICT (%s) DO UPDATE SET ' % ', '.join(key)
+            conflict += ', '.join(
+                '{0} = EXCLUDED.{0}'.format(x) for x in updates
+            )
+        else:
+            return False
+
+        sql, params = self._values_sql(connection, rows)
+        with connection.cursor() as cursor:
+            cursor.execute(sql + ' ' + conflict, params)
+        return True
+
+
 class AbstractReaction(AbstractCommonField):
     class Identifiers(models.TextChoices):
         CELEBRATE = 'celebrate', _("Celebrate")
@@ -46,11 +263,24 @@ class AbstractReaction(AbstractCommonField):
         ]
     )
 
+    objects = ReactionQuerySet.as_manager()
+
     class Meta:
         abstract = True
         app_label = 'celebot'
         verbose_name = _("Reaction")
         verbose_name_plural = _("Reactions")
+        indexes = [
+            models.Index(fields=('pain', 'create_at', 'id')),
+            # reactions written since the last check, see stats.check()
+            models.Index(fields=('update_at', 'pain')),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'pain'),
+                name='%(app_label)s_%(class)s_unique_user_pain'
+            ),
+        ]
 
     def __str__(self):
         return self.get_identifier_display()
@@ -79,11 +309,19 @@ class AbstractComment(AbstractCommonField):
     attachments = GenericRelation('celebot.Attachment')
     tags = TaggableManager(through=TagItem, blank=True)
 
+    # 0 for top-level, see AbstractCommentClosure
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
+    # direct replies, see apps.celebot.comments
+    reply_count = models.PositiveIntegerField(default=0, editable=False)
+
     class Meta:
         abstract = True
         app_label = 'celebot'
         verbose_name = _("Comment")
         verbose_name_plural = _("Comments")
+        indexes = [
+            models.Index(fields=('pain', 'depth', 'create_at', 'id')),
+        ]
 
     def __str__(self) -> str:
         return self.content
@@ -110,3 +348,132 @@ class AbstractParentChildComment(AbstractCommonField):
 
     def __str__(self) -> str:
         return '{} -> {}'.format(str(self.child.id), str(self.parent.id))
+
+
+class CommentClosureQuerySet(models.query.QuerySet):
+    def attach(self, comment, parent=None):
+        """
+        Rows of a new comment, itself at depth 0 then one per
+        ancestor of :parent
+        """
+        rows = [self.model(ancestor=comment, descendant=comment, depth=0)]
+
+        if parent is not None:
+            ancestors = self.filter(descendant=parent) \
+                .values_list('ancestor_id', 'depth')
+
+            rows.extend(
+                self.model(ancestor_id=x[0], descendant=comment, depth=x[1] + 1)
+                for x in ancestors
+            )
+        return self.bulk_create(rows)
+
+    def rebuild_pains(self, pain_ids):
+        """
+        Rows and Comment.depth of the comments of :pain_ids from
+        ParentChildComment. Return number of comments
+        """
+        Pain = apps.get_model('celebot', 'Pain')
+        Comment = apps.get_model('celebot', 'Comment')
+        ParentChildComment = apps.get_model('celebot', 'ParentChildComment')
+
+        # create_comment() update the pain in its transaction
+        list(Pain.objects.select_for_update().filter(id__in=pain_ids).values_list('id'))
+
+        comments = dict(
+            Comment.objects
+            .filter(pain_id__in=pain_ids)
+            .values_list('id', 'depth')
+        )
+
+        # the first parent row wins if a child has many
+        parents = dict(
+            ParentChildComment.objects
+            .filter(child__pain_id__in=pain_ids)
+            .order_by('-id')
+            .values_list('child_id', 'parent_id')
+        )
+
+        rows = list()
+        depths = dict()
+        for comment_id in comments:
+            rows.append(self.model(ancestor_id=comment_id, descendant_id=comment_id, depth=0))
+
+            seen = {comment_id}
+            parent_id = parents.get(comment_id)
+            while parent_id is not None and parent_id not in seen:
+                seen.add(parent_id)
+                rows.append(self.model(
+                    ancestor_id=parent_id,
+                    descendant_id=comment_id,
+                    depth=len(seen) - 1
+                ))
+                parent_id = parents.get(parent_id)
+
+            depth = len(seen) - 1
+            if depth != comments[comment_id]:
+                depths.setdefault(depth, []).append(comment_id)
+
+        self.filter(descendant__pain_id__in=pain_ids).delete()
+        self.bulk_create(rows, batch_size=1000)
+
+        for depth, comment_ids in depths.items():
+            Comment.objects.filter(id__in=comment_ids).update(depth=depth)
+        return len(comments)
+
+    def rebuild(self, pain_ids=None, chunk_size=500):
+        """
+        Rebuild the rows of every comment in chunks of pains, for the
+        comments written before the closure. Return number of comments
+        """
+        Pain = apps.get_model('celebot', 'Pain')
+        pains = Pain.objects.order_by('id').values_list('id', flat=True)
+        if pain_ids is not None:
+            pains = pains.filter(id__in=pain_ids)
+
+        rebuilt = 0
+        last_id = 0
+        while True:
+            chunk = list(pains.filter(id__gt=last_id)[:chunk_size])
+            if not chunk:
+                break
+
+            last_id = chunk[-1]
+            with transaction.atomic():
+                rebuilt += self.rebuild_pains(chunk)
+        return rebuilt
+
+
+class AbstractCommentClosure(models.Model):
+    """
+    Every (ancestor, descendant) pair of the comment trees, a subtree
+    or a depth-limited slice of it is one indexed read on :ancestor
+    ParentChildComment stays the adjacency record
+    """
+    ancestor = models.ForeignKey(
+        'celebot.Comment',
+        related_name='descendant_closures',
+        on_delete=models.CASCADE
+    )
+    descendant = models.ForeignKey(
+        'celebot.Comment',
+        related_name='ancestor_closures',
+        on_delete=models.CASCADE
+    )
+    depth = models.PositiveSmallIntegerField()
+
+    objects = CommentClosureQuerySet.as_manager()
+
+    class Meta:
+        abstract = True
+        app_label = 'celebot'
+        verbose_name = _("Comment Closure")
+        verbose_name_plural = _("Comment Closures")
+        unique_together = ('ancestor', 'descendant',)
+        indexes = [
+            models.Index(fields=('ancestor', 'depth')),
+            models.Index(fields=('descendant', 'depth')),
+        ]
+
+    def __str__(self) -> str:
+        return '{} -> {}'.format(str(self.descendant_id), str(self.ancestor_id))
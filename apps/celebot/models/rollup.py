@@ -0,0 +1,164 @@
+from django.db import models
+from django.db.models import Case, F, When
+from django.utils.translation import ugettext_lazy as _
+
+from .respond import AbstractReaction
+
+
+class RollupQuerySet(models.query.QuerySet):
+    def increment(self, counts):
+        """
+        Add to the counts, :counts is dict of `key_fields` values -> count
+        One insert for missing rows and one UPDATE with CASE
+        """
+        if not counts:
+            return
+
+        fields = self.model.key_fields
+        self.bulk_create(
+            [self.model(**dict(zip(fields, x))) for x in counts],
+            ignore_conflicts=True
+        )
+
+        # superset of the keys, matched in python
+        lookup = {
+            '%s__in' % field: {x[i] for x in counts}
+            for i, field in enumerate(fields)
+        }
+        rows = self.filter(**lookup).values_list('id', *fields)
+        rows = {x[0]: counts[x[1:]] for x in rows if x[1:] in counts}
+
+        self.filter(id__in=list(rows)).update(count=Case(
+            *[When(id=k, then=F('count') + v) for k, v in rows.items()],
+            default=F('count')
+        ))
+
+
+class AbstractRollup(models.Model):
+    class Granularities(models.TextChoices):
+        HOUR = 'hour', _("Hour")
+        DAY = 'day', _("Day")
+
+    granularity = models.CharField(max_length=4, choices=Granularities.choices)
+    bucket = models.DateTimeField()
+    count = models.PositiveIntegerField(default=0)
+
+    objects = RollupQuerySet.as_manager()
+
+    class Meta:
+        abstract = True
+
+    def __str__(self) -> str:
+        return str(self.count)
+
+
+class AbstractPainReactionRollup(AbstractRollup):
+    """Reactions given to a pain by identifier in an hour or a day"""
+    key_fields = ('pain_id', 'identifier', 'granularity', 'bucket',)
+
+    pain = models.ForeignKey(
+        'celebot.Pain',
+        related_name='reaction_rollups',
+        on_delete=models.CASCADE
+    )
+    identifier = models.CharField(
+        max_length=15,
+        choices=AbstractReaction.Identifiers.choices
+    )
+
+    class Meta:
+        abstract = True
+        app_label = 'celebot'
+        verbose_name = _("Pain Reaction Rollup")
+        verbose_name_plural = _("Pain Reaction Rollups")
+        unique_together = ('pain', 'identifier', 'granularity', 'bucket',)
+        indexes = [
+            models.Index(fields=('granularity', 'bucket')),
+        ]
+
+
+class AbstractReactionRollup(AbstractRollup):
+    """Reactions given to every pain by identifier in an hour or a day"""
+    key_fields = ('identifier', 'granularity', 'bucket',)
+
+    identifier = models.CharField(
+        max_length=15,
+        choices=AbstractReaction.Identifiers.choices
+    )
+
+    class Meta:
+        abstract = True
+        app_label = 'celebot'
+        verbose_name = _("Reaction Rollup")
+        verbose_name_plural = _("Reaction Rollups")
+        unique_together = ('granularity', 'bucket', 'identifier',)
+
+
+class AbstractTagReactionRollup(AbstractRollup):
+    """Reactions given to translates of a tag in an hour or a day"""
+    key_fields = ('tag_id', 'granularity', 'bucket',)
+
+    tag = models.ForeignKey(
+        'celebot.Tag',
+        related_name='reaction_rollups',
+        on_delete=models.CASCADE
+    )
+
+    class Meta:
+        abstract = True
+        app_label = 'celebot'
+        verbose_name = _("Tag Reaction Rollup")
+        verbose_name_plural = _("Tag Reaction Rollups")
+        unique_together = ('tag', 'granularity', 'bucket',)
+
+
+class AbstractTagCooccurrence(models.Model):
+    """
+    Objects tagged with both :tag and :related, every pair is kept in
+    both directions so the related tags of one tag are a range read
+    See apps.celebot.cooccurrence
+    """
+    key_fields = ('tag_id', 'related_id',)
+
+    tag = models.ForeignKey(
+        'celebot.Tag',
+        related_name='cooccurrences',
+        on_delete=models.CASCADE
+    )
+    related = models.ForeignKey(
+        'celebot.Tag',
+        related_name='+',
+        on_delete=models.CASCADE
+    )
+    count = models.IntegerField(default=0)
+
+    objects = RollupQuerySet.as_manager()
+
+    class Meta:
+        abstract = True
+        app_label = 'celebot'
+        verbose_name = _("Tag Cooccurrence")
+        verbose_name_plural = _("Tag Cooccurrences")
+        unique_together = ('tag', 'related',)
+        indexes = [
+            models.Index(fields=('tag', '-count')),
+        ]
+
+    def __str__(self) -> str:
+        return str(self.count)
+
+
+class AbstractRollupWatermark(models.Model):
+    """Last source row folded into the rollups, one row per job"""
+    name = models.CharField(max_length=50, unique=True)
+    position = models.BigIntegerField(default=0)
+    update_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        abstract = True
+        app_label = 'celebot'
+        verbose_name = _("Rollup Watermark")
+        verbose_name_plural = _("Rollup Watermarks")
+
+    def __str__(self) -> str:
+        return self.name
@@ -0,0 +1,48 @@
+from django.db import models
+from django.utils.translation import ugettext_lazy as _
+
+
+class AbstractSearchTerm(models.Model):
+    """Document frequency per token"""
+    token = models.CharField(max_length=64, unique=True)
+    document_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+        app_label = 'celebot'
+        verbose_name = _("Search Term")
+        verbose_name_plural = _("Search Terms")
+
+    def __str__(self) -> str:
+        return self.token
+
+
+class AbstractSearchPosting(models.Model):
+    """
+    Inverted index entry, token -> translate with term frequency
+    :length is the token count of the translate, kept here so
+    scoring doesn't need a join
+    """
+    token = models.CharField(max_length=64)
+    translate = models.ForeignKey(
+        'celebot.Translate',
+        related_name='search_postings',
+        on_delete=models.CASCADE
+    )
+    pain = models.ForeignKey(
+        'celebot.Pain',
+        related_name='search_postings',
+        on_delete=models.CASCADE
+    )
+    frequency = models.PositiveIntegerField(default=1)
+    length = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+        app_label = 'celebot'
+        unique_together = ('token', 'translate')
+        verbose_name = _("Search Posting")
+        verbose_name_plural = _("Search Postings")
+
+    def __str__(self) -> str:
+        return self.token
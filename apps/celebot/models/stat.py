@@ -0,0 +1,296 @@
+from django.apps import apps
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, Count, F, Q, When
+from django.db.models.functions import Greatest
+from django.utils.translation import ugettext_lazy as _
+
+from .respond import AbstractReaction
+
+
+class PainReactionStatsQuerySet(models.query.QuerySet):
+    def shift(self, pain_id, added=None, removed=None):
+        """
+        Move one reaction between counters with atomic increments.
+        :added or :removed is an identifier value, None on one side
+        means the reaction was created or deleted
+        """
+        if added == removed:
+            return
+
+        fields = dict()
+        if added:
+            fields[added] = F(added) + 1
+        if removed:
+            fields[removed] = Greatest(F(removed) - 1, 0)
+        if added and not removed:
+            fields['total'] = F('total') + 1
+        elif removed and not added:
+            fields['total'] = Greatest(F('total') - 1, 0)
+
+        updated = self.filter(pain_id=pain_id).update(**fields)
+
+        # first reaction for this pain, nothing to decrement otherwise
+        if updated or not added:
+            return
+
+        try:
+            with transaction.atomic():
+                self.create(pain_id=pain_id, total=1, **{added: 1})
+        except IntegrityError:
+            # created by a concurrent request
+            self.filter(pain_id=pain_id).update(**fields)
+
+    def apply_changes(self, changes):
+        """
+        Bulk `shift()`, :changes is list of
+        (pain_id, added, removed) identifiers
+        """
+        deltas = dict()
+        for pain_id, added, removed in changes:
+            if added == removed:
+                continue
+
+            counters = deltas.setdefault(pain_id, dict())
+            if added:
+                counters[added] = counters.get(added, 0) + 1
+            if removed:
+                counters[removed] = counters.get(removed, 0) - 1
+            if not (added and removed):
+                counters['total'] = counters.get('total', 0) + (1 if added else -1)
+        self.apply_deltas(deltas)
+
+    def apply_deltas(self, deltas):
+        """
+        Add :deltas, dict of pain_id -> {counter: delta}, at once.
+        One insert for missing rows and
+        one UPDATE with CASE per counter for every pain
+        """
+        deltas = {k: v for k, v in deltas.items() if any(v.values())}
+        if not deltas:
+            return
+
+        self.bulk_create(
+            [self.model(pain_id=x) for x in deltas],
+            ignore_conflicts=True
+        )
+
+        whens = dict()
+        for pain_id, counters in deltas.items():
+            for field, delta in counters.items():
+                if delta:
+                    whens.setdefault(field, []).append(When(
+                        pain_id=pain_id,
+                        then=Greatest(F(field) + delta, 0)
+                    ))
+
+        fields = {
+            k: Case(*v, default=F(k))
+            for k, v in whens.items()
+        }
+
+        self.filter(pain_id__in=list(deltas)).update(**fields)
+
+    def mark_flushed(self, pain_id, token):
+        """
+        Keep the :token of the buffer flush written in the same
+        transaction, see apps.celebot.buffer
+        """
+        self.bulk_create([self.model(pain_id=pain_id)], ignore_conflicts=True)
+        self.filter(pain_id=pain_id).update(flush_token=token)
+
+    def aggregate_reactions(self, pain_ids):
+        """Real counters from Reaction, dict of pain_id -> counters"""
+        Reaction = apps.get_model('celebot', 'Reaction')
+        counts = {
+            x.value: Count('id', filter=Q(identifier=x.value))
+            for x in Reaction.Identifiers
+        }
+
+        aggregates = Reaction.objects \
+            .filter(pain_id__in=pain_ids) \
+            .values('pain_id') \
+            .order_by() \
+            .annotate(total=Count('id'), **counts)
+
+        empty = dict.fromkeys(self.model.counter_fields, 0)
+        ret = {x: dict(empty) for x in pain_ids}
+        for row in aggregates:
+            ret[row['pain_id']] = {
+                f: row[f] for f in self.model.counter_fields
+            }
+        return ret
+
+    def iter_pain_ids(self, pain_ids=None, chunk_size=500):
+        Pain = apps.get_model('celebot', 'Pain')
+        pains = Pain.objects.order_by('id').values_list('id', flat=True)
+        if pain_ids is not None:
+            pains = pains.filter(id__in=pain_ids)
+
+        last_id = 0
+        while True:
+            chunk = list(pains.filter(id__gt=last_id)[:chunk_size])
+            if not chunk:
+                break
+
+            last_id = chunk[-1]
+            yield chunk
+
+    def rebuild(self, pain_ids=None, chunk_size=500):
+        """
+        Recompute counters from Reaction in chunks of pains
+        Return number of pains rebuilt
+        """
+        rebuilt = 0
+
+        for chunk in self.iter_pain_ids(pain_ids, chunk_size):
+            aggregates = self.aggregate_reactions(chunk)
+            existing = set(
+                self.filter(pain_id__in=chunk)
+                    .values_list('pain_id', flat=True)
+            )
+
+            to_create = list()
+            to_update = list()
+
+            for pain_id in chunk:
+                obj = self.model(pain_id=pain_id, **aggregates[pain_id])
+
+                if pain_id in existing:
+                    to_update.append(obj)
+                else:
+                    to_create.append(obj)
+
+            with transaction.atomic():
+                self.bulk_create(to_create, ignore_conflicts=True)
+                self.bulk_update(to_update, self.model.counter_fields)
+
+            rebuilt += len(chunk)
+        return rebuilt
+
+    def verify(self, pain_ids=None, chunk_size=500):
+        """
+        Compare counters with the real aggregate
+        Return ids of the pains drifted
+        """
+        drifted = list()
+
+        for chunk in self.iter_pain_ids(pain_ids, chunk_size):
+            aggregates = self.aggregate_reactions(chunk)
+            stored = self.filter(pain_id__in=chunk) \
+                .values('pain_id', *self.model.counter_fields)
+            stored = {x.pop('pain_id'): x for x in stored}
+
+            for pain_id in chunk:
+                expected = aggregates[pain_id]
+                if stored.get(pain_id, dict.fromkeys(expected, 0)) != expected:
+                    drifted.append(pain_id)
+        return drifted
+
+
+class AbstractPainReactionStats(models.Model):
+    """
+    Read model for reaction counters, one row per pain
+    Kept in sync by reaction writes, see `shift()`
+    """
+    counter_fields = ('total',) + tuple(AbstractReaction.Identifiers.values)
+
+    pain = models.OneToOneField(
+        'celebot.Pain',
+        primary_key=True,
+        related_name='reaction_stats',
+        on_delete=models.CASCADE
+    )
+
+    total = models.PositiveIntegerField(default=0)
+    celebrate = models.PositiveIntegerField(default=0)
+    support = models.PositiveIntegerField(default=0)
+    favorite = models.PositiveIntegerField(default=0)
+    insightful = models.PositiveIntegerField(default=0)
+    curious = models.PositiveIntegerField(default=0)
+
+    # last reaction buffer flush committed
+    flush_token = models.CharField(max_length=32, blank=True, default='')
+
+    objects = PainReactionStatsQuerySet.as_manager()
+
+    class Meta:
+        abstract = True
+        app_label = 'celebot'
+        verbose_name = _("Pain Reaction Stats")
+        verbose_name_plural = _("Pain Reaction Stats")
+
+    def __str__(self) -> str:
+        return str(self.total)
+
+    def to_stat(self):
+        """Counters sorted by the most given"""
+        ret = {x: getattr(self, x, 0) for x in self.counter_fields}
+        sorted_ret = sorted(ret.items(), key=lambda x: x[1], reverse=True)
+        return {x[0]: x[1] for x in sorted_ret}
+
+
+class PainTrendQuerySet(models.query.QuerySet):
+    def bump(self, pain_id, scores):
+        """
+        Atomic increment, :scores is dict of field -> score
+        Create the row for the first activity
+        """
+        fields = {k: F(k) + v for k, v in scores.items()}
+        updated = self.filter(pain_id=pain_id).update(**fields)
+
+        if updated:
+            return
+
+        try:
+            with transaction.atomic():
+                self.create(pain_id=pain_id, **scores)
+        except IntegrityError:
+            self.filter(pain_id=pain_id).update(**fields)
+
+    def add_scores(self, field, scores):
+        """
+        Add :scores, dict of pain_id -> score, to :field at once.
+        One insert for missing rows and one UPDATE with CASE
+        """
+        if not scores:
+            return
+
+        self.bulk_create(
+            [self.model(pain_id=x) for x in scores],
+            ignore_conflicts=True
+        )
+
+        whens = [
+            When(pain_id=pain_id, then=F(field) + score)
+            for pain_id, score in scores.items()
+        ]
+        self.filter(pain_id__in=list(scores)) \
+            .update(**{field: Case(*whens, default=F(field))})
+
+
+class AbstractPainTrend(models.Model):
+    """
+    Precomputed time-decayed score, all rows are relative to the same
+    epoch so ordering by the score is the trending order. Two columns,
+    the list reads one while recompute() fills the other
+    See apps.celebot.trending
+    """
+    pain = models.OneToOneField(
+        'celebot.Pain',
+        primary_key=True,
+        related_name='trend',
+        on_delete=models.CASCADE
+    )
+    score_a = models.FloatField(default=0, db_index=True)
+    score_b = models.FloatField(default=0, db_index=True)
+
+    objects = PainTrendQuerySet.as_manager()
+
+    class Meta:
+        abstract = True
+        app_label = 'celebot'
+        verbose_name = _("Pain Trend")
+        verbose_name_plural = _("Pain Trends")
+
+    def __str__(self) -> str:
+        return '%s / %s' % (self.score_a, self.score_b)
@@ -1,4 +1,7 @@
+from django.apps import apps
 from django.db import models
+from django.db.models import Count, F
+from django.db.models.functions import Greatest
 from django.utils.translation import gettext_lazy as _
 
 from taggit.models import GenericTaggedItemBase, TagBase
@@ -6,6 +9,66 @@ from simple_history.models import HistoricalRecords
 from ..utils import locales
 
 
+class TagQuerySet(models.query.QuerySet):
+    def shift(self, counts):
+        """
+        Move usage_count, :counts is dict of tag id -> delta
+        One UPDATE per distinct delta, never below zero
+        """
+        grouped = dict()
+        for tag_id, delta in counts.items():
+            if delta:
+                grouped.setdefault(delta, []).append(tag_id)
+
+        for delta, tag_ids in grouped.items():
+            self.filter(id__in=tag_ids) \
+                .update(usage_count=Greatest(F('usage_count') + delta, 0))
+
+    def rebuild(self, tag_ids=None, chunk_size=1000):
+        """
+        Recompute usage_count from TagItem, chunk by chunk of tags
+        Return number of tags which count changed
+        """
+        TagItem = apps.get_model('celebot', 'TagItem')
+        queryset = self.order_by('id')
+        if tag_ids is not None:
+            queryset = queryset.filter(id__in=tag_ids)
+
+        changed = 0
+        last_id = 0
+
+        while True:
+            chunk = dict(
+                queryset
+                .filter(id__gt=last_id)
+                .values_list('id', 'usage_count')[:chunk_size]
+            )
+            if not chunk:
+                break
+
+            counts = dict(
+                TagItem.objects
+                .filter(tag_id__in=list(chunk))
+                .values('tag_id')
+                .order_by()
+                .annotate(count=Count('id'))
+                .values_list('tag_id', 'count')
+            )
+
+            grouped = dict()
+            for tag_id, usage_count in chunk.items():
+                count = counts.get(tag_id, 0)
+                if count != usage_count:
+                    grouped.setdefault(count, []).append(tag_id)
+                    changed += 1
+
+            for count, ids in grouped.items():
+                self.filter(id__in=ids).update(usage_count=count)
+
+            last_id = max(chunk)
+        return changed
+
+
 class Tag(TagBase):
     description = models.TextField(null=True, blank=True)
     locale = models.CharField(
@@ -14,12 +77,19 @@ class Tag(TagBase):
         blank=True,
         choices=locales()
     )
+    # TagItem rows of the tag, see apps.celebot.signals
+    usage_count = models.PositiveIntegerField(default=0, editable=False)
     history = HistoricalRecords(inherit=True)
 
+    objects = TagQuerySet.as_manager()
+
     class Meta:
         app_label = 'celebot'
         verbose_name = _("Tag")
         verbose_name_plural = _("Tags")
+        indexes = [
+            models.Index(fields=('-usage_count', 'id')),
+        ]
 
 
 class TagItem(GenericTaggedItemBase):
@@ -20,6 +20,9 @@ class AbstractPain(AbstractCommonField):
         on_delete=models.CASCADE
     )
 
+    # Comments of every depth, see apps.celebot.comments
+    comment_count = models.PositiveIntegerField(default=0, editable=False)
+
     class Meta:
         abstract = True
         app_label = 'celebot'
@@ -32,6 +35,14 @@ class AbstractPain(AbstractCommonField):
 
     @property
     def default_translate(self):
+        # avoid query when translates prefetched
+        prefetched = getattr(self, '_prefetched_objects_cache', {})
+        if 'translates' in prefetched:
+            return next((
+                x for x in prefetched['translates']
+                if x.locale == settings.CELEBOT_DEFAULT_LOCALE
+            ), None)
+
         try:
             return self.translates.get(locale=settings.CELEBOT_DEFAULT_LOCALE)
         except ObjectDoesNotExist:
@@ -0,0 +1,167 @@
+from collections import Counter
+
+from django.apps import apps
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .conf import settings
+
+Reaction = apps.get_model('celebot', 'Reaction')
+Translate = apps.get_model('celebot', 'Translate')
+TagItem = apps.get_model('celebot', 'TagItem')
+PainReactionRollup = apps.get_model('celebot', 'PainReactionRollup')
+ReactionRollup = apps.get_model('celebot', 'ReactionRollup')
+TagReactionRollup = apps.get_model('celebot', 'TagReactionRollup')
+RollupWatermark = apps.get_model('celebot', 'RollupWatermark')
+
+WATERMARK = 'reactions'
+GRANULARITIES = PainReactionRollup.Granularities
+STEPS = {
+    GRANULARITIES.HOUR: timezone.timedelta(hours=1),
+    GRANULARITIES.DAY: timezone.timedelta(days=1),
+}
+
+
+def truncate(value, granularity):
+    value = value.astimezone(timezone.utc)
+    value = value.replace(minute=0, second=0, microsecond=0)
+    if granularity == GRANULARITIES.DAY:
+        value = value.replace(hour=0)
+    return value
+
+
+def rollup(chunk_size=2000):
+    """
+    Fold reactions created after the watermark into the rollups,
+    one transaction per chunk. Return number of reactions folded
+    """
+    # reactions of transactions still open get a chance to commit
+    settled = timezone.now() - timezone.timedelta(
+        seconds=settings.CELEBOT_ROLLUP_SETTLE
+    )
+    content_type = ContentType.objects.get_for_model(Translate)
+    folded = 0
+
+    while True:
+        with transaction.atomic():
+            watermark, _created = RollupWatermark.objects \
+                .select_for_update() \
+                .get_or_create(name=WATERMARK)
+
+            chunk = Reaction.objects \
+                .filter(id__gt=watermark.position) \
+                .order_by('id') \
+                .values_list('id', 'pain_id', 'translate_id', 'identifier', 'create_at')
+            chunk = list(chunk[:chunk_size])
+
+            # the watermark is an id, stop at the first unsettled one
+            # or a later id created earlier would be skipped for good
+            for i, row in enumerate(chunk):
+                if row[4] > settled:
+                    chunk = chunk[:i]
+                    break
+            if not chunk:
+                break
+
+            tags = dict()
+            items = TagItem.objects \
+                .filter(
+                    content_type=content_type,
+                    object_id__in={x[2] for x in chunk}
+                ) \
+                .values_list('object_id', 'tag_id')
+
+            for translate_id, tag_id in items:
+                tags.setdefault(translate_id, set()).add(tag_id)
+
+            pain_counts = Counter()
+            global_counts = Counter()
+            tag_counts = Counter()
+
+            for _id, pain_id, translate_id, identifier, create_at in chunk:
+                for granularity in GRANULARITIES.values:
+                    bucket = truncate(create_at, granularity)
+                    pain_counts[(pain_id, identifier, granularity, bucket)] += 1
+                    global_counts[(identifier, granularity, bucket)] += 1
+
+                    for tag_id in tags.get(translate_id, ()):
+                        tag_counts[(tag_id, granularity, bucket)] += 1
+
+            PainReactionRollup.objects.increment(pain_counts)
+            ReactionRollup.objects.increment(global_counts)
+            TagReactionRollup.objects.increment(tag_counts)
+
+            watermark.position = chunk[-1][0]
+            watermark.save(update_fields=('position', 'update_at'))
+            folded += len(chunk)
+    return folded
+
+
+@transaction.atomic
+def rebuild_global():
+    """
+    Sum ReactionRollup again from PainReactionRollup, for the buckets
+    folded before it. Return number of rows
+    """
+    # hold rollup() off meanwhile
+    RollupWatermark.objects \
+        .select_for_update() \
+        .get_or_create(name=WATERMARK)
+
+    rows = PainReactionRollup.objects \
+        .values('identifier', 'granularity', 'bucket') \
+        .order_by() \
+        .annotate(count=Sum('count'))
+
+    ReactionRollup.objects.all().delete()
+    created = ReactionRollup.objects.bulk_create(
+        [ReactionRollup(**x) for x in rows.iterator()],
+        batch_size=1000
+    )
+    return len(created)
+
+
+def get_window(granularity, since=None, until=None):
+    """
+    Buckets to serve, at most CELEBOT_TIMELINE_MAX_BUCKETS
+    Raise ValueError for an unknown granularity or a too wide window
+    """
+    if granularity not in GRANULARITIES.values:
+        raise ValueError(granularity)
+
+    step = STEPS[granularity]
+    max_buckets = settings.CELEBOT_TIMELINE_MAX_BUCKETS
+
+    until = truncate(until or timezone.now(), granularity)
+    since = truncate(since or until - step * (max_buckets - 1), granularity)
+
+    if since > until or (until - since) / step >= max_buckets:
+        raise ValueError(since)
+    return since, until
+
+
+def timeline(queryset, granularity, since, until, by_identifier=True):
+    """
+    Rollup rows of :queryset summed by bucket, the rows of one pain,
+    one tag or ReactionRollup for every pain
+    """
+    fields = ('bucket', 'identifier') if by_identifier else ('bucket',)
+    rows = queryset \
+        .filter(granularity=granularity, bucket__gte=since, bucket__lte=until) \
+        .values(*fields) \
+        .order_by() \
+        .annotate(count=Sum('count'))
+
+    buckets = dict()
+    for row in rows:
+        bucket = buckets.setdefault(row['bucket'], {'total': 0})
+        bucket['total'] += row['count']
+        if by_identifier:
+            bucket[row['identifier']] = row['count']
+
+    return [
+        {'bucket': k, **buckets[k]}
+        for k in sorted(buckets)
+    ]
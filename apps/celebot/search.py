@@ -0,0 +1,259 @@
+import math
+import re
+import unicodedata
+from collections import Counter
+
+from django.apps import apps
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, ExpressionWrapper, F, FloatField, Sum, Value, When
+from django.db.models.functions import Cast, Greatest
+
+from .conf import settings
+
+Translate = apps.get_model('celebot', 'Translate')
+SearchTerm = apps.get_model('celebot', 'SearchTerm')
+SearchPosting = apps.get_model('celebot', 'SearchPosting')
+
+SEARCH_FIELDS = ('label', 'problem', 'solution')
+STATS_KEY = 'celebot:search:stats'
+TOKEN_RE = re.compile(r'\w+')
+
+# en_US, en_GB and id_ID only, see LocaleChoices
+STOPWORDS = frozenset((
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'but', 'by', 'for', 'if',
+    'in', 'into', 'is', 'it', 'no', 'not', 'of', 'on', 'or', 'such',
+    'that', 'the', 'their', 'then', 'there', 'these', 'they', 'this',
+    'to', 'was', 'will', 'with', 'i', 'my', 'me', 'we', 'you',
+    'dan', 'di', 'ke', 'dari', 'yang', 'ini', 'itu', 'untuk', 'dengan',
+    'atau', 'pada', 'adalah', 'tidak', 'saya', 'kami', 'kita', 'ada',
+))
+
+
+def tokenize(text):
+    """Casefolded word tokens without stopwords"""
+    if not text:
+        return []
+
+    text = unicodedata.normalize('NFKC', text).casefold()
+    return [
+        x for x in TOKEN_RE.findall(text)
+        if 1 < len(x) <= 64 and x not in STOPWORDS
+    ]
+
+
+def document_tokens(translate):
+    tokens = list()
+    for field in SEARCH_FIELDS:
+        tokens.extend(tokenize(getattr(translate, field, None)))
+    return tokens
+
+
+def shift_terms(added=(), removed=()):
+    """Keep document frequency of tokens in sync with postings"""
+    if added:
+        SearchTerm.objects.bulk_create(
+            [SearchTerm(token=x) for x in added],
+            ignore_conflicts=True
+        )
+        SearchTerm.objects \
+            .filter(token__in=added) \
+            .update(document_count=F('document_count') + 1)
+
+    if removed:
+        SearchTerm.objects \
+            .filter(token__in=removed) \
+            .update(document_count=Greatest(F('document_count') - 1, 0))
+
+
+def build_postings(translate):
+    """Unsaved postings of a translate, one per token"""
+    frequencies = Counter(document_tokens(translate))
+    length = sum(frequencies.values())
+    return [
+        SearchPosting(
+            token=token,
+            translate_id=translate.id,
+            pain_id=translate.pain_id,
+            frequency=frequency,
+            length=length
+        ) for token, frequency in frequencies.items()
+    ]
+
+
+@transaction.atomic
+def index_translate(translate):
+    """Incrementally (re)index one translate, diff with its postings"""
+    frequencies = Counter(document_tokens(translate))
+    length = sum(frequencies.values())
+    postings = {
+        x.token: x for x in
+        SearchPosting.objects.filter(translate_id=translate.id)
+    }
+
+    added = [x for x in frequencies if x not in postings]
+    removed = [x for x in postings if x not in frequencies]
+    changed = list()
+
+    for token, posting in postings.items():
+        frequency = frequencies.get(token)
+        if frequency and (posting.frequency, posting.length) != (frequency, length):
+            posting.frequency = frequency
+            posting.length = length
+            changed.append(posting)
+
+    if removed:
+        SearchPosting.objects \
+            .filter(translate_id=translate.id, token__in=removed) \
+            .delete()
+
+    SearchPosting.objects.bulk_create([
+        SearchPosting(
+            token=x,
+            translate_id=translate.id,
+            pain_id=translate.pain_id,
+            frequency=frequencies[x],
+            length=length
+        ) for x in added
+    ])
+    SearchPosting.objects.bulk_update(changed, ('frequency', 'length'))
+    shift_terms(added=added, removed=removed)
+
+
+@transaction.atomic
+def index_translates(translates):
+    """
+    Index new translates in bulk, they must not have postings yet
+    Document frequency updated with one query per distinct count
+    """
+    postings = list()
+    document_counts = Counter()
+
+    for translate in translates:
+        tokens = build_postings(translate)
+        document_counts.update(x.token for x in tokens)
+        postings.extend(tokens)
+
+    if not postings:
+        return
+
+    SearchPosting.objects.bulk_create(postings, batch_size=1000)
+    SearchTerm.objects.bulk_create(
+        [SearchTerm(token=x) for x in document_counts],
+        ignore_conflicts=True
+    )
+
+    grouped = dict()
+    for token, count in document_counts.items():
+        grouped.setdefault(count, []).append(token)
+
+    for count, tokens in grouped.items():
+        SearchTerm.objects \
+            .filter(token__in=tokens) \
+            .update(document_count=F('document_count') + count)
+
+
+@transaction.atomic
+def unindex_translate(translate):
+    postings = SearchPosting.objects.filter(translate_id=translate.id)
+    shift_terms(removed=list(postings.values_list('token', flat=True)))
+    postings.delete()
+
+
+def corpus_stats():
+    """Number of documents and average length, cached"""
+    stats = cache.get(STATS_KEY)
+
+    if stats is None:
+        documents = Translate.objects.count()
+        tokens = SearchPosting.objects \
+            .aggregate(total=Sum('frequency')) \
+            .get('total') or 0
+
+        stats = (documents, tokens / documents if documents else 0)
+        cache.set(STATS_KEY, stats, settings.CELEBOT_SEARCH_STATS_TIMEOUT)
+    return stats
+
+
+def search_pains(query, limit=None):
+    """
+    Rank pains with BM25 over their translates
+    Return list of (pain_id, score) the best first
+    """
+    limit = limit or settings.CELEBOT_SEARCH_MAX_RESULTS
+    tokens = list(dict.fromkeys(tokenize(query)))
+    if not tokens:
+        return []
+
+    documents, avgdl = corpus_stats()
+    if not documents:
+        return []
+
+    frequencies = SearchTerm.objects \
+        .filter(token__in=tokens, document_count__gt=0) \
+        .values_list('token', 'document_count')
+
+    idf = {
+        token: math.log(1 + (documents - df + 0.5) / (df + 0.5))
+        for token, df in frequencies
+    }
+    if not idf:
+        return []
+
+    k1 = settings.CELEBOT_SEARCH_BM25_K1
+    b = settings.CELEBOT_SEARCH_BM25_B
+    weight = Case(
+        *[When(token=k, then=Value(v)) for k, v in idf.items()],
+        output_field=FloatField()
+    )
+    tf = Cast('frequency', FloatField())
+    length = Cast('length', FloatField())
+    score = ExpressionWrapper(
+        weight * tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / max(avgdl, 1))),
+        output_field=FloatField()
+    )
+
+    ranked = SearchPosting.objects \
+        .filter(token__in=list(idf)) \
+        .values('pain_id') \
+        .annotate(score=Sum(score)) \
+        .order_by('-score', '-pain_id')[:limit]
+    return [(x['pain_id'], x['score']) for x in ranked]
+
+
+@transaction.atomic
+def rebuild_index(chunk_size=500):
+    """Drop and rebuild the whole index, return translates indexed"""
+    SearchPosting.objects.all().delete()
+    SearchTerm.objects.all().delete()
+
+    queryset = Translate.objects \
+        .order_by('id') \
+        .only('id', 'pain_id', *SEARCH_FIELDS)
+
+    document_counts = Counter()
+    last_id = 0
+    indexed = 0
+
+    while True:
+        chunk = list(queryset.filter(id__gt=last_id)[:chunk_size])
+        if not chunk:
+            break
+
+        last_id = chunk[-1].id
+        postings = list()
+
+        for translate in chunk:
+            tokens = build_postings(translate)
+            document_counts.update(x.token for x in tokens)
+            postings.extend(tokens)
+
+        SearchPosting.objects.bulk_create(postings, batch_size=1000)
+        indexed += len(chunk)
+
+    SearchTerm.objects.bulk_create(
+        [SearchTerm(token=k, document_count=v) for k, v in document_counts.items()],
+        batch_size=1000
+    )
+    cache.delete(STATS_KEY)
+    return indexed
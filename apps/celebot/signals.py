@@ -0,0 +1,100 @@
+from collections import Counter
+
+from django.apps import apps
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+
+from .caches import bump_pains, bump_version, profile_version_name
+from .search import unindex_translate
+from .tagindex import invalidate as invalidate_tag_index
+from .tasks import make_attachment_thumbnails
+
+Pain = apps.get_model('celebot', 'Pain')
+Translate = apps.get_model('celebot', 'Translate')
+Tag = apps.get_model('celebot', 'Tag')
+TagItem = apps.get_model('celebot', 'TagItem')
+PainReactionStats = apps.get_model('celebot', 'PainReactionStats')
+
+
+def reaction_delete_handler(sender, instance, **kwargs):
+    PainReactionStats.objects.shift(
+        instance.pain_id,
+        removed=instance.identifier
+    )
+
+
+def pain_count_invalidate_handler(sender, instance, **kwargs):
+    # cached totals of the pain list
+    bump_version('pain_count')
+
+
+def translate_delete_handler(sender, instance, **kwargs):
+    unindex_translate(instance)
+
+
+def pain_detail_invalidate_handler(sender, instance, **kwargs):
+    # cached pain detail, see PainViewSet.retrieve()
+    if isinstance(instance, Pain):
+        uuids = [instance.uuid]
+    elif isinstance(instance, TagItem):
+        if instance.content_type_id != ContentType.objects.get_for_model(Translate).id:
+            return
+
+        uuids = Translate.objects \
+            .filter(id=instance.object_id) \
+            .values_list('pain__uuid', flat=True)
+    else:
+        # Translate and Reaction
+        uuids = Pain.objects \
+            .filter(id=instance.pain_id) \
+            .values_list('uuid', flat=True)
+
+    bump_pains(uuids)
+
+
+def profile_invalidate_handler(sender, instance, **kwargs):
+    user_id = getattr(instance, 'user_id', instance.pk)
+    bump_version(profile_version_name(user_id))
+
+
+def tag_index_invalidate_handler(sender, instance, **kwargs):
+    # autocomplete index of every process, see apps.celebot.tagindex
+    invalidate_tag_index()
+
+
+def tag_usage_save_handler(sender, instance, created, **kwargs):
+    if created:
+        Tag.objects.shift({instance.tag_id: 1})
+
+
+def tag_usage_delete_handler(sender, instance, **kwargs):
+    Tag.objects.shift({instance.tag_id: -1})
+
+
+def tag_items_bulk_delete_handler(sender, instances, **kwargs):
+    # the TagItem post_delete receivers above, once for every row
+    counts = Counter(x.tag_id for x in instances)
+    Tag.objects.shift({k: -v for k, v in counts.items()})
+
+    content_type_id = ContentType.objects.get_for_model(Translate).id
+    translate_ids = {
+        x.object_id for x in instances
+        if x.content_type_id == content_type_id
+    }
+    if translate_ids:
+        bump_pains(
+            Translate.objects
+            .filter(id__in=translate_ids)
+            .values_list('pain__uuid', flat=True)
+        )
+
+    bump_version('pain_count')
+    invalidate_tag_index()
+
+
+def attachment_thumbnails_save_handler(sender, instance, **kwargs):
+    if not instance.file or not instance.filemime.startswith('image/'):
+        return
+
+    if instance.thumbnails.get('source') != instance.file.name:
+        transaction.on_commit(lambda: make_attachment_thumbnails.delay(instance.id))
@@ -0,0 +1,86 @@
+import time
+
+from django.apps import apps
+from django.core.cache import cache
+from django.utils import timezone
+
+from .conf import settings
+
+Reaction = apps.get_model('celebot', 'Reaction')
+PainReactionStats = apps.get_model('celebot', 'PainReactionStats')
+
+STAT_KEY = 'celebot:stat:%s'
+LOCK_KEY = 'celebot:stat:lock:%s'
+CHECKED_KEY = 'celebot:stat:checked'
+
+# enough to read one row
+LOCK_TIMEOUT = 10
+
+
+def read_stat(pain_id):
+    try:
+        stats = PainReactionStats.objects.get(pain_id=pain_id)
+    except PainReactionStats.DoesNotExist:
+        stats = PainReactionStats(pain_id=pain_id)
+    return stats.to_stat()
+
+
+def get_stat(pain_id, refresh=False):
+    """
+    Counters of a pain from PainReactionStats behind the cache
+    A stale value is served while one request reads it again, so a
+    hot pain never sends every reader to the database at once
+    :refresh read and cache now, after a write of the same request
+    """
+    key = STAT_KEY % pain_id
+    now = time.time()
+    cached = None if refresh else cache.get(key)
+
+    if cached is not None:
+        if cached['fresh_until'] > now:
+            return cached['stat']
+
+        # someone else is reading it again
+        if not cache.add(LOCK_KEY % pain_id, 1, LOCK_TIMEOUT):
+            return cached['stat']
+
+    stat = read_stat(pain_id)
+    cache.set(key, {
+        'stat': stat,
+        'fresh_until': now + settings.CELEBOT_REACTION_STAT_CACHE_FRESH,
+    }, settings.CELEBOT_REACTION_STAT_CACHE_TIMEOUT)
+
+    cache.delete(LOCK_KEY % pain_id)
+    return stat
+
+
+def check(full=False):
+    """
+    Compare the counters with the real aggregate and rebuild the
+    drifted ones. Only pains with reactions written since the last
+    check unless :full. Return ids of the pains rebuilt
+    """
+    now = timezone.now()
+    checked = cache.get(CHECKED_KEY)
+
+    pain_ids = None
+    if not full and checked is not None:
+        # overlap for transactions committed late
+        since = checked - timezone.timedelta(minutes=1)
+        pain_ids = set(
+            Reaction.objects
+            .filter(update_at__gte=since)
+            .order_by()
+            .values_list('pain_id', flat=True)
+        )
+
+    drifted = list()
+    if pain_ids is None or pain_ids:
+        drifted = PainReactionStats.objects.verify(pain_ids=pain_ids)
+
+    if drifted:
+        PainReactionStats.objects.rebuild(pain_ids=drifted)
+        cache.delete_many([STAT_KEY % x for x in drifted])
+
+    cache.set(CHECKED_KEY, now, None)
+    return drifted
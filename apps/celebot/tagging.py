@@ -0,0 +1,196 @@
+from collections import Counter
+
+from django.apps import apps
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models.functions import Lower
+
+from .tagindex import invalidate as invalidate_tag_index
+from .utils import bulk_delete_with_history
+
+Tag = apps.get_model('celebot', 'Tag')
+TagItem = apps.get_model('celebot', 'TagItem')
+
+
+def normalize_tags(names):
+    """
+    Strip and dedupe names case insensitively, the first spelling wins
+    Return dict of lowered name -> name
+    """
+    ret = dict()
+    for name in names or []:
+        name = (name or '').strip()
+        if name:
+            ret.setdefault(name.lower(), name)
+    return ret
+
+
+def make_slugs(names):
+    """
+    Unique slugs for new tags, same scheme as TagBase.save() but the
+    collisions resolved in memory instead of one insert per attempt
+    """
+    slugify = Tag().slugify
+    bases = {name: slugify(name) for name in names}
+
+    taken = set(
+        Tag.objects
+        .filter(slug__in=set(bases.values()))
+        .values_list('slug', flat=True)
+    )
+
+    # only colliding slugs need their suffixed variants
+    collided = {x for x in bases.values() if x in taken}
+    for base in collided:
+        taken.update(
+            Tag.objects
+            .filter(slug__startswith='%s_' % base)
+            .values_list('slug', flat=True)
+        )
+
+    slugs = dict()
+    for name, base in bases.items():
+        slug = base
+        i = 1
+        while slug in taken:
+            slug = slugify(name, i)
+            i += 1
+
+        taken.add(slug)
+        slugs[name] = slug
+    return slugs
+
+
+@transaction.atomic
+def resolve_tags(names, user=None):
+    """
+    Get or create tags in one pass, matched case insensitively
+    like TAGGIT_CASE_INSENSITIVE
+    Return dict of lowered name -> Tag
+    """
+    wanted = normalize_tags(names)
+    if not wanted:
+        return {}
+
+    def fetch(lowered):
+        return {
+            x.name_lower: x for x in
+            Tag.objects
+            .annotate(name_lower=Lower('name'))
+            .filter(name_lower__in=lowered)
+        }
+
+    tags = fetch(list(wanted))
+    missing = [v for k, v in wanted.items() if k not in tags]
+    if not missing:
+        return tags
+
+    slugs = make_slugs(missing)
+    Tag.objects.bulk_create(
+        [Tag(name=x, slug=slugs[x]) for x in missing],
+        ignore_conflicts=True
+    )
+
+    created = fetch([x.lower() for x in missing])
+    tags.update(created)
+
+    # bulk_create skip the signals
+    invalidate_tag_index()
+
+    # ours unless a concurrent request won the insert
+    Tag.history.bulk_history_create(
+        [x for x in created.values() if slugs.get(x.name) == x.slug],
+        default_user=user
+    )
+
+    # lost a slug race, let taggit retry one by one
+    for name in missing:
+        if name.lower() not in tags:
+            tags[name.lower()], _created = Tag.objects.get_or_create(
+                name__iexact=name,
+                defaults={'name': name}
+            )
+    return tags
+
+
+@transaction.atomic
+def bulk_add_tags(items, user=None):
+    """
+    Tag many objects of one model at once
+    :items is list of (instance, [Tag]), existing tags are skipped
+    Return TagItem created
+    """
+    items = [x for x in items if x[1]]
+    if not items:
+        return []
+
+    content_type = ContentType.objects.get_for_model(items[0][0])
+    object_ids = {x[0].pk for x in items}
+    tag_ids = {t.pk for x in items for t in x[1]}
+
+    queryset = TagItem.objects.filter(
+        content_type=content_type,
+        object_id__in=object_ids,
+        tag_id__in=tag_ids
+    )
+    existing = set(queryset.values_list('object_id', 'tag_id'))
+
+    pairs = list()
+    seen = set(existing)
+    for instance, tags in items:
+        for tag in tags:
+            pair = (instance.pk, tag.pk)
+            if pair not in seen:
+                seen.add(pair)
+                pairs.append(pair)
+
+    if not pairs:
+        return []
+
+    TagItem.objects.bulk_create([
+        TagItem(content_type=content_type, object_id=x[0], tag_id=x[1])
+        for x in pairs
+    ])
+
+    # backends without RETURNING, get them back by the pairs
+    pairs = set(pairs)
+    created = [
+        x for x in queryset.order_by('id')
+        if (x.object_id, x.tag_id) in pairs
+    ]
+    TagItem.history.bulk_history_create(created, default_user=user)
+
+    # bulk_create skip tag_usage_save_handler
+    Tag.objects.shift(Counter(x.tag_id for x in created))
+    invalidate_tag_index()
+    return created
+
+
+def add_tags(instance, names, user=None):
+    """taggit `tags.add(*names)` with a constant number of queries"""
+    resolved = resolve_tags(names, user=user)
+    return bulk_add_tags(
+        [(instance, [resolved[x] for x in normalize_tags(names)])],
+        user=user
+    )
+
+
+@transaction.atomic
+def set_tags(instance, names, user=None):
+    """
+    taggit `tags.set(names)` with a constant number of queries, tags
+    of :instance not in :names are removed
+    """
+    resolved = resolve_tags(names, user=user)
+    tags = [resolved[x] for x in normalize_tags(names)]
+
+    # usage counts and caches by tag_items_bulk_delete_handler
+    content_type = ContentType.objects.get_for_model(instance)
+    bulk_delete_with_history(
+        TagItem.objects
+        .filter(content_type=content_type, object_id=instance.pk)
+        .exclude(tag_id__in=[x.pk for x in tags]),
+        user=user
+    )
+
+    return bulk_add_tags([(instance, tags)], user=user)
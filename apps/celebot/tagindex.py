@@ -0,0 +1,204 @@
+"""
+Per process prefix index of tag names for autocomplete
+
+Lowered names are kept in a sorted list and a prefix is the bisect
+range between `prefix` and `prefix + MAX_CHAR`. Short prefixes match
+a large part of the tags, their most used tags are ranked by load()
+and patch() instead of at each search. Tag writes bump the
+'tags' cache version, a process seeing a new version reads the tags
+changed since its last sync from the history tables (the change feed)
+instead of loading the whole table again. Writes leaving no history
+bump the 'tags-reload' version too and every process loads it again
+"""
+import heapq
+import threading
+import time
+from bisect import bisect_left
+
+from django.apps import apps
+from django.utils import timezone
+
+from .caches import bump_version, get_version
+from .conf import settings
+
+Tag = apps.get_model('celebot', 'Tag')
+TagItem = apps.get_model('celebot', 'TagItem')
+
+VERSION_NAME = 'tags'
+RELOAD_VERSION_NAME = 'tags-reload'
+MAX_CHAR = '\U0010ffff'
+
+
+def invalidate(reload=False):
+    """:reload after writes without history, update() or raw SQL"""
+    if reload:
+        bump_version(RELOAD_VERSION_NAME)
+    bump_version(VERSION_NAME)
+
+
+class TagIndex:
+    def __init__(self):
+        self.keys = list()  # sorted (lowered name, tag id)
+        self.tags = dict()  # tag id -> (name, slug, locale, count)
+        self.top = dict()  # short prefix -> {locale: most used tags}
+        self.version = None
+        self.reload_version = None
+        self.synced_at = None
+        self.checked_at = 0
+        self.lock = threading.Lock()
+
+    def fetch(self, tag_ids=None):
+        queryset = Tag.objects.all()
+        if tag_ids is not None:
+            queryset = queryset.filter(id__in=tag_ids)
+
+        return {
+            x[0]: x[1:]
+            for x in queryset.values_list('id', 'name', 'slug', 'locale', 'usage_count')
+        }
+
+    def get_short_prefixes(self, name):
+        name = name.lower()
+        return {
+            name[:i]
+            for i in range(1, min(len(name), settings.CELEBOT_TAG_INDEX_SHORT_PREFIX) + 1)
+        }
+
+    def rank(self, keys, tags, prefix):
+        """
+        Most used tags of :prefix by lowered locale, None for every
+        tag and '' for tags without locale
+        """
+        size = settings.CELEBOT_TAG_AUTOCOMPLETE_MAX_LIMIT
+        count = lambda x: x[3]
+        lo = bisect_left(keys, (prefix,))
+        hi = bisect_left(keys, (prefix + MAX_CHAR,))
+
+        groups = dict()
+        for x in keys[lo:hi]:
+            tag = tags[x[1]]
+            groups.setdefault((tag[2] or '').lower(), []).append(tag)
+
+        matches = [x for group in groups.values() for x in group]
+        ret = {None: heapq.nlargest(size, matches, key=count)}
+        for locale, group in groups.items():
+            ret[locale] = heapq.nlargest(
+                size, group + groups.get('', []) if locale else group, key=count
+            )
+        return ret
+
+    def load(self):
+        tags = self.fetch()
+        keys = sorted((v[0].lower(), k) for k, v in tags.items())
+
+        prefixes = set()
+        for name, _tag_id in keys:
+            prefixes.update(self.get_short_prefixes(name))
+
+        top = {x: self.rank(keys, tags, x) for x in prefixes}
+        self.keys, self.tags, self.top = keys, tags, top
+
+    def patch(self, since):
+        """Apply the tags changed since :since, deleted ones removed"""
+        tag_ids = set(
+            Tag.history
+            .filter(history_date__gte=since)
+            .values_list('id', flat=True)
+        )
+        tag_ids.update(
+            TagItem.history
+            .filter(history_date__gte=since)
+            .values_list('tag_id', flat=True)
+        )
+        if not tag_ids:
+            return
+
+        changed = self.fetch(tag_ids)
+        keys = list(self.keys)
+        tags = dict(self.tags)
+        top = dict(self.top)
+        prefixes = set()
+
+        for tag_id in tag_ids:
+            old = tags.pop(tag_id, None)
+            if old is not None:
+                prefixes.update(self.get_short_prefixes(old[0]))
+                i = bisect_left(keys, (old[0].lower(), tag_id))
+                if i < len(keys) and keys[i] == (old[0].lower(), tag_id):
+                    del keys[i]
+
+            if tag_id in changed:
+                tags[tag_id] = changed[tag_id]
+                prefixes.update(self.get_short_prefixes(changed[tag_id][0]))
+                key = (changed[tag_id][0].lower(), tag_id)
+                keys.insert(bisect_left(keys, key), key)
+
+        for prefix in prefixes:
+            top[prefix] = self.rank(keys, tags, prefix)
+            if not top[prefix][None]:
+                del top[prefix]
+
+        # swapped at once, readers never see a half patched index
+        self.keys, self.tags, self.top = keys, tags, top
+
+    def sync(self):
+        """
+        Check the version at most every CELEBOT_TAG_INDEX_CHECK_INTERVAL
+        seconds, so most keystrokes don't touch the cache either
+        """
+        now = time.time()
+        if self.version is not None and now - self.checked_at < settings.CELEBOT_TAG_INDEX_CHECK_INTERVAL:
+            return
+
+        with self.lock:
+            if self.version is not None and now - self.checked_at < settings.CELEBOT_TAG_INDEX_CHECK_INTERVAL:
+                return
+
+            version = get_version(VERSION_NAME)
+            reload_version = get_version(RELOAD_VERSION_NAME)
+            if version != self.version or reload_version != self.reload_version:
+                synced_at = timezone.now()
+                if self.synced_at is None or reload_version != self.reload_version:
+                    self.load()
+                else:
+                    # overlap for transactions committed late
+                    self.patch(self.synced_at - timezone.timedelta(minutes=1))
+
+                self.version = version
+                self.reload_version = reload_version
+                self.synced_at = synced_at
+            self.checked_at = now
+
+    def search(self, prefix, locale=None, limit=10):
+        """
+        Tags which name start with :prefix, most used first
+        :locale keep tags of the language and the ones without locale
+        :limit is up to CELEBOT_TAG_AUTOCOMPLETE_MAX_LIMIT for short prefixes
+        Return list of (name, slug, locale, count)
+        """
+        self.sync()
+
+        prefix = prefix.strip().lower()
+        if not prefix:
+            return []
+
+        if len(prefix) <= settings.CELEBOT_TAG_INDEX_SHORT_PREFIX:
+            ranked = self.top.get(prefix, {})
+            if locale:
+                ranked = ranked.get(locale.lower(), ranked.get('', []))
+            else:
+                ranked = ranked.get(None, [])
+            return ranked[:limit]
+
+        keys, tags = self.keys, self.tags
+        lo = bisect_left(keys, (prefix,))
+        hi = bisect_left(keys, (prefix + MAX_CHAR,))
+
+        matches = (tags[x[1]] for x in keys[lo:hi] if x[1] in tags)
+        if locale:
+            locale = locale.lower()
+            matches = (x for x in matches if not x[2] or x[2].lower() == locale)
+        return heapq.nlargest(limit, matches, key=lambda x: x[3])
+
+
+index = TagIndex()
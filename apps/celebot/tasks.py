@@ -0,0 +1,90 @@
+import logging
+
+from django.apps import apps
+from django.utils.translation import ugettext_lazy as _
+
+# Celery config
+from celery import shared_task
+
+from apps.person import thumbnails
+from . import buffer, comments, cooccurrence, live, rollups, stats, uploads
+from .conf import settings
+from .trending import recompute
+
+
+@shared_task
+def recompute_trending():
+    logging.info(_("Recompute trending run"))
+    ranked = recompute()
+    if ranked is None:
+        logging.info('Trending recompute already running')
+        return
+
+    logging.info('Trending ranked %d pains' % ranked)
+
+
+@shared_task
+def flush_reaction_buffer():
+    if not buffer.is_enabled():
+        return
+
+    flushed = buffer.flush()
+    if flushed:
+        logging.info('Reaction buffer flushed %d pains' % flushed)
+
+
+@shared_task
+def check_reaction_stats(full=False):
+    drifted = stats.check(full=full)
+    if drifted:
+        logging.warning('Reaction stats drifted for %d pains' % len(drifted))
+
+
+@shared_task
+def send_live_stat(pain_id, pain_uuid):
+    stat = stats.get_stat(pain_id, refresh=True)
+    deltas = buffer.get_deltas([pain_id])
+
+    live.group_send(live.pain_group(pain_uuid), 'pain.stat', {
+        'pain': pain_uuid,
+        'stat': buffer.merge_stat(stat, deltas.get(pain_id)),
+    })
+
+
+@shared_task
+def rollup_reactions():
+    folded = rollups.rollup()
+    if folded:
+        logging.info('Reaction rollups folded %d reactions' % folded)
+
+
+@shared_task
+def update_tag_cooccurrence():
+    applied = cooccurrence.update()
+    if applied:
+        logging.info('Tag cooccurrence applied %d tag changes' % applied)
+
+
+@shared_task
+def reconcile_comment_counts(full=False):
+    drifted = comments.reconcile(full=full)
+    if drifted:
+        logging.warning('Comment counts drifted for %d pains' % drifted)
+
+
+@shared_task
+def expire_uploads():
+    expired = uploads.expire()
+    if expired:
+        logging.info('Expired %d upload sessions' % expired)
+
+
+@shared_task
+def make_attachment_thumbnails(attachment_id):
+    thumbnails.update(
+        apps.get_model('celebot', 'Attachment'),
+        attachment_id,
+        'file',
+        'thumbnails',
+        settings.CELEBOT_ATTACHMENT_THUMBNAILS
+    )
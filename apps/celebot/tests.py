@@ -1,3 +1,735 @@
-from django.test import TestCase
+import io
+import json
+import shutil
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+import fakeredis
+from PIL import Image
+
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from rest_framework.test import APIClient
+
+from apps.person import storage
+from apps.person.storage import blob_storage
+
+from . import buffer, comments, cooccurrence, rollups, search, uploads
+
+Pain = apps.get_model('celebot', 'Pain')
+Reaction = apps.get_model('celebot', 'Reaction')
+PainReactionStats = apps.get_model('celebot', 'PainReactionStats')
+PainTrend = apps.get_model('celebot', 'PainTrend')
+ReactionRollup = apps.get_model('celebot', 'ReactionRollup')
+TagCooccurrence = apps.get_model('celebot', 'TagCooccurrence')
+Translate = apps.get_model('celebot', 'Translate')
+SearchTerm = apps.get_model('celebot', 'SearchTerm')
+SearchPosting = apps.get_model('celebot', 'SearchPosting')
+Comment = apps.get_model('celebot', 'Comment')
+CommentClosure = apps.get_model('celebot', 'CommentClosure')
+Attachment = apps.get_model('celebot', 'Attachment')
+UploadSession = apps.get_model('celebot', 'UploadSession')
+Blob = apps.get_model('person', 'Blob')
+
+
+class APITestCase(TestCase):
+    def setUp(self):
+        # throttles, counts and stats are cached
+        cache.clear()
+        self.user = get_user_model().objects.create(username='tester', email='tester@example.com')
+        self.api = APIClient()
+        self.api.force_authenticate(self.user)
+
+    def create_pain(self, label, tags=('test',), problem='problem', solution='solution'):
+        response = self.api.post('/api/celebot/v1/pains/', {'translate': {
+            'locale': 'en_US',
+            'label': label,
+            'problem': problem,
+            'solution': solution,
+            'tags': list(tags),
+        }}, format='json')
+        self.assertEqual(response.status_code, 201)
+        return response.json()
+
+    def batch(self, pains):
+        return self.api.post('/api/celebot/v1/reactions/batch/', [
+            {
+                'pain': x['uuid'],
+                'translate': x['translates'][0]['uuid'],
+                'identifier': 'celebrate',
+            } for x in pains
+        ], format='json')
+
+
+class PainRetrieveTest(APITestCase):
+    def test_retrieve(self):
+        pain = self.create_pain('one')
+        response = self.api.get('/api/celebot/v1/pains/%s/' % pain['uuid'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['uuid'], pain['uuid'])
+
+    def test_malformed_uuid(self):
+        for method in ('get', 'patch', 'delete'):
+            response = getattr(self.api, method)('/api/celebot/v1/pains/not-a-uuid/')
+            self.assertEqual(response.status_code, 404, method)
+
+
+class KeysetPaginationTest(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.pains = [self.create_pain('pain %d' % i)['uuid'] for i in range(5)]
+
+        # same create_at, the order falls back on id
+        Pain.objects.update(create_at=timezone.now())
+        self.expected = [
+            str(x) for x in Pain.objects.order_by('-id').values_list('uuid', flat=True)
+        ]
+
+    def get(self, url, **params):
+        response = self.api.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        return [x['uuid'] for x in data['results']], data
+
+    def test_cursor_round_trip(self):
+        uuids, data = self.get('/api/celebot/v1/pains/', cursor='', limit=2)
+        self.assertIsNone(data['previous'])
+        self.assertIsNone(data['total'])
+
+        pages = [uuids]
+        while data['next']:
+            uuids, data = self.get(data['next'])
+            pages.append(uuids)
+
+        self.assertEqual([len(x) for x in pages], [2, 2, 1])
+        self.assertEqual(sum(pages, []), self.expected)
+
+        # back from the last page
+        uuids, data = self.get(data['previous'])
+        self.assertEqual(uuids, pages[1])
+        uuids, data = self.get(data['previous'])
+        self.assertEqual(uuids, pages[0])
+        self.assertIsNone(data['previous'])
+
+    def test_invalid_cursor(self):
+        response = self.api.get('/api/celebot/v1/pains/', {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 404)
+
+
+class SearchTest(APITestCase):
+    def test_ranking(self):
+        often = self.create_pain('database timeout', problem='timeout after timeout')
+        once = self.create_pain('slow database', problem='the query timeout')
+        self.create_pain('cooking', problem='burnt rice')
+
+        response = self.api.get('/api/celebot/v1/pains/', {'q': 'Timeout'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [x['uuid'] for x in response.json()['results']],
+            [often['uuid'], once['uuid']]
+        )
+        self.assertEqual(search.search_pains('the and'), [])
+
+    def test_index_diff(self):
+        pain = self.create_pain('database timeout', problem='timeout', solution='retry')
+        translate = Translate.objects.get(uuid=pain['translates'][0]['uuid'])
+
+        translate.problem = 'deadlock'
+        translate.solution = 'retry retry'
+        search.index_translate(translate)
+
+        postings = SearchPosting.objects \
+            .filter(translate_id=translate.id) \
+            .values_list('token', 'frequency', 'length')
+        self.assertEqual(sorted(postings), [
+            ('database', 1, 5), ('deadlock', 1, 5), ('retry', 2, 5), ('timeout', 1, 5)
+        ])
+        self.assertEqual(
+            dict(SearchTerm.objects.values_list('token', 'document_count')),
+            {'database': 1, 'deadlock': 1, 'retry': 1, 'timeout': 1}
+        )
+
+        # nothing changed, nothing written
+        with CaptureQueriesContext(connection) as queries:
+            search.index_translate(translate)
+        self.assertFalse([
+            x for x in queries
+            if x['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))
+        ])
+
+        translate.delete()
+        self.assertFalse(SearchPosting.objects.exists())
+        self.assertEqual(set(SearchTerm.objects.values_list('document_count', flat=True)), {0})
+
+
+class TagQueryTest(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.pains = {
+            'both': self.create_pain('both', tags=('python', 'django')),
+            'flask': self.create_pain('flask', tags=('python', 'flask')),
+            'go': self.create_pain('go', tags=('go',)),
+            'python': self.create_pain('python', tags=('python',)),
+        }
+        self.labels = {x['uuid']: k for k, x in self.pains.items()}
+
+    def filter(self, tags):
+        response = self.api.get('/api/celebot/v1/pains/', {'tags': tags, 'cursor': ''})
+        self.assertEqual(response.status_code, 200)
+        return {self.labels[x['uuid']] for x in response.json()['results']}
+
+    def test_and_or(self):
+        self.assertEqual(self.filter('python+django'), {'both'})
+        self.assertEqual(self.filter('python django'), {'both'})
+        self.assertEqual(self.filter('python+django,go'), {'both', 'go'})
+        self.assertEqual(self.filter('Python'), {'both', 'flask', 'python'})
+
+    def test_unknown_tag(self):
+        self.assertEqual(self.filter('python+unknown,go'), {'go'})
+        self.assertEqual(self.filter('unknown'), set())
+
+    def test_not_apply_to_every_clause(self):
+        self.assertEqual(self.filter('python,-flask'), {'both', 'python'})
+        self.assertEqual(self.filter('python+django,go,-django'), {'go'})
+        self.assertEqual(self.filter('-python'), {'go'})
+
+    def test_invalid(self):
+        for tags in ('python,,go', '-', 'python+-', ','):
+            response = self.api.get('/api/celebot/v1/pains/', {'tags': tags})
+            self.assertEqual(response.status_code, 400, tags)
+
+
+class ReactionBatchTest(APITestCase):
+    def test_queries_constant(self):
+        pains = [self.create_pain('pain %d' % i) for i in range(12)]
+
+        with CaptureQueriesContext(connection) as small:
+            self.assertEqual(self.batch(pains[:2]).status_code, 200)
+        with CaptureQueriesContext(connection) as large:
+            self.assertEqual(self.batch(pains[2:]).status_code, 200)
+
+        self.assertEqual(len(small), len(large))
+        self.assertEqual(Reaction.objects.count(), 12)
+        self.assertEqual(PainTrend.objects.filter(score_a__gt=0).count(), 12)
+
+
+class ReactionUpsertTest(APITestCase):
+    def setUp(self):
+        super().setUp()
+        pains = [self.create_pain('pain %d' % i) for i in range(3)]
+        self.assertEqual(self.batch(pains[1:]).status_code, 200)
+
+        self.translates = dict(
+            Translate.objects.order_by('pain_id').values_list('pain_id', 'id')
+        )
+        self.pain_ids = list(self.translates)
+
+    def rows(self, *identifiers):
+        return [
+            {
+                'user_id': self.user.id,
+                'pain_id': pain_id,
+                'translate_id': self.translates[pain_id],
+                'identifier': identifier,
+            } for pain_id, identifier in zip(self.pain_ids, identifiers)
+        ]
+
+    def stat(self, pain_id):
+        stat = PainReactionStats.objects.get(pain_id=pain_id).to_stat()
+        return {k: v for k, v in stat.items() if v}
+
+    def test_created_changed_unchanged(self):
+        History = Reaction.history.model
+        before = list(History.objects.values_list('history_id', flat=True))
+
+        changes = Reaction.objects.upsert(self.rows('favorite', 'support', 'celebrate'), user=self.user)
+        self.assertEqual(
+            [(x.pain_id, x.identifier, previous) for x, previous in changes],
+            [
+                (self.pain_ids[0], 'favorite', None),
+                (self.pain_ids[1], 'support', 'celebrate'),
+                (self.pain_ids[2], 'celebrate', 'celebrate'),
+            ]
+        )
+
+        # one created and one changed, nothing for the unchanged
+        history = History.objects \
+            .exclude(history_id__in=before) \
+            .values_list('pain_id', 'history_type')
+        self.assertEqual(sorted(history), [(self.pain_ids[0], '+'), (self.pain_ids[1], '~')])
+
+        PainReactionStats.objects.apply_changes([
+            (x.pain_id, x.identifier, previous) for x, previous in changes
+        ])
+        self.assertEqual(self.stat(self.pain_ids[0]), {'total': 1, 'favorite': 1})
+        self.assertEqual(self.stat(self.pain_ids[1]), {'total': 1, 'support': 1})
+        self.assertEqual(self.stat(self.pain_ids[2]), {'total': 1, 'celebrate': 1})
+
+    def test_last_row_win(self):
+        rows = self.rows('favorite') + self.rows('support')
+        changes = Reaction.objects.upsert(rows, user=self.user)
+
+        self.assertEqual([(x.identifier, previous) for x, previous in changes], [('support', None)])
+        self.assertEqual(Reaction.objects.get(pain_id=self.pain_ids[0]).identifier, 'support')
+
+    def test_inserted_concurrently(self):
+        QuerySet = type(Reaction.objects.all())
+        lock_previous = QuerySet._lock_previous
+        calls = list()
+
+        # the row appear between the read and the insert
+        def racing(queryset, keys):
+            calls.append(keys)
+            if len(calls) == 1:
+                return {}
+            return lock_previous(queryset, keys)
+
+        with mock.patch.object(QuerySet, '_lock_previous', racing):
+            changes = Reaction.objects.upsert(self.rows(None, 'support')[1:], user=self.user)
+
+        self.assertEqual(len(calls), 2)
+        self.assertEqual([(x.identifier, previous) for x, previous in changes], [('support', 'celebrate')])
+        self.assertEqual(Reaction.objects.count(), 2)
+
+
+class CommentClosureTest(APITestCase):
+    def setUp(self):
+        super().setUp()
+        pain = self.create_pain('one')
+        self.pain = Pain.objects.get(uuid=pain['uuid'])
+        self.translate = self.pain.translates.get()
+
+    def comment(self, parent=None):
+        return comments.create_comment(
+            parent=parent,
+            user=self.user,
+            pain=self.pain,
+            translate=self.translate,
+            content='content'
+        )
+
+    def closure(self, instance):
+        return sorted(
+            CommentClosure.objects
+            .filter(descendant=instance)
+            .values_list('ancestor_id', 'depth')
+        )
+
+    def test_attach(self):
+        root = self.comment()
+        reply = self.comment(parent=root)
+        nested = self.comment(parent=reply)
+
+        self.assertEqual(self.closure(root), [(root.id, 0)])
+        self.assertEqual(self.closure(nested), [(root.id, 2), (reply.id, 1), (nested.id, 0)])
+        self.assertEqual(nested.depth, 2)
+
+        thread = comments.get_thread(root)
+        self.assertEqual([x.id for x in thread.thread_replies], [reply.id])
+        self.assertEqual([x.id for x in thread.thread_replies[0].thread_replies], [nested.id])
+
+    def test_counters(self):
+        root = self.comment()
+        reply = self.comment(parent=root)
+        self.comment(parent=reply)
+        self.comment(parent=root)
+
+        root.refresh_from_db()
+        self.pain.refresh_from_db()
+        self.assertEqual(root.reply_count, 2)
+        self.assertEqual(self.pain.comment_count, 4)
+
+        # the subtree goes with it
+        self.assertEqual(comments.delete_comment(reply), 2)
+        root.refresh_from_db()
+        self.pain.refresh_from_db()
+        self.assertEqual(root.reply_count, 1)
+        self.assertEqual(self.pain.comment_count, 2)
+        self.assertEqual(CommentClosure.objects.filter(descendant__pain=self.pain).count(), 3)
+
+        self.assertFalse(comments.reconcile_pains([self.pain.id]))
+
+    def test_reconcile(self):
+        root = self.comment()
+        self.comment(parent=root)
+        Comment.objects.filter(id=root.id).update(reply_count=5)
+
+        self.assertEqual(comments.reconcile_pains([self.pain.id]), {self.pain.uuid})
+        root.refresh_from_db()
+        self.assertEqual(root.reply_count, 1)
+
+    def test_rebuild(self):
+        root = self.comment()
+        reply = self.comment(parent=root)
+        nested = self.comment(parent=reply)
+        CommentClosure.objects.exclude(depth=0).delete()
+        Comment.objects.update(depth=0)
+
+        self.assertEqual(CommentClosure.objects.rebuild(), 3)
+        self.assertEqual(self.closure(nested), [(root.id, 2), (reply.id, 1), (nested.id, 0)])
+        nested.refresh_from_db()
+        self.assertEqual(nested.depth, 2)
+
+
+class MediaTestCase(APITestCase):
+    def setUp(self):
+        super().setUp()
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+
+        override = override_settings(MEDIA_ROOT=media)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.pain = self.create_pain('one')
+
+
+class BlobStorageTest(MediaTestCase):
+    def attach(self, content):
+        instance = Attachment(
+            content_type=ContentType.objects.get_for_model(Pain),
+            object_id=str(Pain.objects.get(uuid=self.pain['uuid']).pk),
+            filename='file.txt',
+            filesize=len(content),
+            filemime='text/plain'
+        )
+        instance.file.save('file.txt', ContentFile(content))
+        return instance
+
+    def refcounts(self):
+        return dict(Blob.objects.values_list('name', 'refcount'))
+
+    def test_same_content_stored_once(self):
+        first = self.attach(b'same')
+        second = self.attach(b'same')
+
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertEqual(self.refcounts(), {first.file.name: 2})
+        self.assertEqual(first.file.read(), b'same')
+
+    def test_replace_and_delete(self):
+        first = self.attach(b'same')
+        second = self.attach(b'same')
+        name = first.file.name
+
+        first.file.save('file.txt', ContentFile(b'other'))
+        self.assertEqual(self.refcounts(), {name: 1, first.file.name: 1})
+
+        second.delete()
+        self.assertEqual(self.refcounts(), {name: 0, first.file.name: 1})
+
+    @override_settings(PERSON_BLOB_GRACE=0)
+    def test_collect(self):
+        orphan = self.attach(b'orphan')
+        kept = self.attach(b'kept')
+        orphan.delete()
+
+        # drifted, still referenced by :kept
+        Blob.objects.filter(name=kept.file.name).update(refcount=0)
+
+        self.assertEqual(storage.collect(), 1)
+        self.assertEqual(self.refcounts(), {kept.file.name: 1})
+        self.assertFalse(blob_storage.exists(orphan.file.name))
+        self.assertTrue(blob_storage.exists(kept.file.name))
+
+
+class UploadTest(MediaTestCase):
+
+    def png(self, size=(8, 8)):
+        data = io.BytesIO()
+        Image.new('RGB', size, 'red').save(data, 'PNG')
+        return data.getvalue()
+
+    def start(self, length, target='attachment', filename='file.png'):
+        data = {'target': target, 'filename': filename, 'length': length}
+        if target == 'attachment':
+            data.update({'attach_to': 'pain', 'object': self.pain['uuid']})
+
+        response = self.api.post('/api/celebot/v1/uploads/', data, format='json')
+        self.assertEqual(response.status_code, 201)
+        return response.json()['uuid']
+
+    def patch(self, uuid, data, offset):
+        return self.api.generic(
+            'PATCH', '/api/celebot/v1/uploads/%s/' % uuid, data,
+            content_type='application/offset+octet-stream',
+            HTTP_UPLOAD_OFFSET=str(offset)
+        )
+
+    def test_chunks(self):
+        content = self.png()
+        uuid = self.start(len(content))
+
+        response = self.patch(uuid, content[:20], 0)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Upload-Offset'], '20')
+
+        response = self.patch(uuid, content[20:], 20)
+        self.assertEqual(response.status_code, 200)
+
+        attachment = Attachment.objects.get()
+        self.assertEqual((attachment.filemime, attachment.filesize), ('image/png', len(content)))
+        self.assertFalse(UploadSession.objects.exists())
+
+    def test_offset_mismatch(self):
+        content = self.png()
+        uuid = self.start(len(content))
+        self.assertEqual(self.patch(uuid, content[:20], 0).status_code, 200)
+
+        # the client resend what was counted already
+        response = self.patch(uuid, content[:20], 0)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(UploadSession.objects.get().offset, 20)
+
+    def test_length_overflow(self):
+        content = self.png()
+        uuid = self.start(len(content) - 1)
+
+        response = self.patch(uuid, content, 0)
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(UploadSession.objects.get().offset, 0)
+
+    def test_locked(self):
+        content = self.png()
+        uuid = self.start(len(content))
+        uploads.lock(UploadSession.objects.get())
+
+        self.assertEqual(self.patch(uuid, content, 0).status_code, 423)
+
+    def test_picture_mime(self):
+        content = b'%PDF-1.4 not a picture'
+        uuid = self.start(len(content), target='picture', filename='file.png')
+
+        self.assertEqual(self.patch(uuid, content, 0).status_code, 415)
+
+    def test_picture_forged(self):
+        # png magic bytes then garbage
+        content = b'\x89PNG\r\n\x1a\n' + b'\x00' * 64
+        uuid = self.start(len(content), target='picture')
+
+        response = self.patch(uuid, content, 0)
+        self.assertEqual(response.status_code, 415)
+        self.assertEqual(response.json(), {'mime': 'Not a valid image'})
+        self.assertFalse(self.user.profile.picture)
+
+    def test_picture(self):
+        content = self.png()
+        uuid = self.start(len(content), target='picture')
+
+        self.assertEqual(self.patch(uuid, content, 0).status_code, 200)
+        self.user.profile.refresh_from_db()
+        self.assertTrue(self.user.profile.picture.name.endswith('.png'))
+
+
+class RollupTest(APITestCase):
+    def test_unsettled_id_hold_watermark(self):
+        self.batch([self.create_pain('one'), self.create_pain('two')])
+        first, second = Reaction.objects.order_by('id')
+        old = timezone.now() - timezone.timedelta(hours=1)
+
+        # the lower id is still settling, the higher one is not
+        Reaction.objects.filter(id=second.id).update(create_at=old)
+        self.assertEqual(rollups.rollup(), 0)
+
+        Reaction.objects.filter(id=first.id).update(create_at=old)
+        self.assertEqual(rollups.rollup(), 2)
+        self.assertEqual(rollups.rollup(), 0)
+
+        total = ReactionRollup.objects \
+            .filter(granularity=rollups.GRANULARITIES.HOUR) \
+            .values_list('count', flat=True)
+        self.assertEqual(sum(total), 2)
+
+
+@override_settings(CELEBOT_ROLLUP_SETTLE=0)
+class TagCooccurrenceTest(APITestCase):
+    def counts(self):
+        return dict(
+            TagCooccurrence.objects
+            .filter(tag__name='alpha')
+            .values_list('related__name', 'count')
+        )
+
+    def test_rebuild_history_not_replayed(self):
+        self.create_pain('one', tags=('alpha', 'beta'))
+        earlier = timezone.now() - timezone.timedelta(hours=1)
+
+        # the tags were written while the scan was running
+        with mock.patch.object(cooccurrence.timezone, 'now', return_value=earlier):
+            self.assertEqual(cooccurrence.rebuild(), 1)
+
+        self.assertEqual(cooccurrence.update(), 0)
+        self.assertEqual(self.counts(), {'beta': 1})
+
+    def test_update_after_rebuild(self):
+        self.create_pain('one', tags=('alpha', 'beta'))
+        cooccurrence.rebuild()
+        self.create_pain('two', tags=('alpha', 'beta', 'gamma'))
+
+        self.assertEqual(cooccurrence.update(), 3)
+        self.assertEqual(self.counts(), {'beta': 2, 'gamma': 1})
+
+
+@override_settings(CELEBOT_REACTION_BUFFER_URL='redis://buffer')
+class ReactionBufferTest(APITestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(buffer, '_client', fakeredis.FakeRedis(decode_responses=True))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client_redis = buffer.get_client()
+        self.pains = [self.create_pain(x) for x in ('one', 'two')]
+
+    def react(self, pain, identifier):
+        response = self.api.post('/api/celebot/v1/reactions/', {
+            'pain': pain['uuid'],
+            'translate': pain['translates'][0]['uuid'],
+            'identifier': identifier,
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return response.json()
+
+    def pain_id(self, pain):
+        return Pain.objects.get(uuid=pain['uuid']).id
+
+    def test_buffered(self):
+        self.react(self.pains[0], 'celebrate')
+        pain_id = self.pain_id(self.pains[0])
+
+        self.assertFalse(Reaction.objects.exists())
+        self.assertEqual(buffer.get_deltas([pain_id]), {pain_id: {'celebrate': 1, 'total': 1}})
+
+        self.assertEqual(buffer.flush(), 1)
+        self.assertEqual(Reaction.objects.get().identifier, 'celebrate')
+
+    def test_flush_failure_stay_dirty(self):
+        self.react(self.pains[0], 'celebrate')
+        self.react(self.pains[1], 'support')
+        failing = self.pain_id(self.pains[0])
+        write = buffer.write
+
+        def failing_write(pain_id, entries, token):
+            if pain_id == failing:
+                raise RuntimeError('database down')
+            return write(pain_id, entries, token)
+
+        with mock.patch.object(buffer, 'write', failing_write):
+            self.assertEqual(buffer.flush(), 1)
+
+        self.assertEqual(self.client_redis.smembers(buffer.DIRTY_KEY), {str(failing)})
+        self.assertTrue(self.client_redis.exists(buffer.FLUSHING_KEY % failing))
+        self.assertEqual(Reaction.objects.get().pain_id, self.pain_id(self.pains[1]))
+
+        # the leftover is written by the next run
+        self.assertEqual(buffer.flush(), 1)
+        self.assertEqual(Reaction.objects.count(), 2)
+        self.assertFalse(self.client_redis.smembers(buffer.DIRTY_KEY))
+
+    def test_flush_interrupted_stay_dirty(self):
+        self.react(self.pains[0], 'celebrate')
+        self.react(self.pains[1], 'support')
+
+        with mock.patch.object(buffer, 'flush_pain', side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                buffer.flush()
+
+        self.assertEqual(
+            self.client_redis.smembers(buffer.DIRTY_KEY),
+            {str(self.pain_id(x)) for x in self.pains}
+        )
+
+    def test_flush_locked_stay_dirty(self):
+        self.react(self.pains[0], 'celebrate')
+        pain_id = self.pain_id(self.pains[0])
+        self.client_redis.set(buffer.LOCK_KEY % pain_id, 1)
+
+        self.assertEqual(buffer.flush(), 0)
+        self.assertEqual(self.client_redis.smembers(buffer.DIRTY_KEY), {str(pain_id)})
+
+    def test_committed_flush_not_counted_twice(self):
+        self.react(self.pains[0], 'celebrate')
+        pain_id = self.pain_id(self.pains[0])
+
+        # the keys are deleted on commit, still there in between
+        buffer.flush()
+        self.assertTrue(self.client_redis.exists(buffer.FLUSHING_DELTA_KEY % pain_id))
+        self.assertEqual(buffer.get_deltas([pain_id]), {})
+        self.assertEqual(buffer.get_pending([(self.user.id, pain_id)]), {})
+        self.assertEqual(PainReactionStats.objects.get(pain_id=pain_id).celebrate, 1)
+
+    def test_flush_delete_keys_on_commit(self):
+        reaction = self.react(self.pains[0], 'celebrate')
+        pain_id = self.pain_id(self.pains[0])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            buffer.flush()
+
+        self.assertFalse(self.client_redis.exists(
+            buffer.FLUSHING_KEY % pain_id,
+            buffer.FLUSHING_DELTA_KEY % pain_id,
+            buffer.FLUSHING_TOKEN_KEY % pain_id
+        ))
+        self.assertIsNone(buffer.get_pain_id(reaction['uuid']))
+
+    def test_flush_rename_delta_racing(self):
+        self.react(self.pains[0], 'celebrate')
+        pain_id = self.pain_id(self.pains[0])
+        delta = buffer.DELTA_KEY % pain_id
+        self.client_redis.delete(delta)
+        racing = [True]
+
+        def transaction(func, *watches, **kwargs):
+            def race(pipe):
+                multi = pipe.multi
+
+                # a record() landing after the delta was looked up
+                def racing_multi():
+                    if racing:
+                        racing.pop()
+                        self.client_redis.hincrby(delta, 'total', 1)
+                    multi()
+
+                pipe.multi = racing_multi
+                return func(pipe)
+            return client_transaction(race, *watches, **kwargs)
+
+        client_transaction = self.client_redis.transaction
+        with mock.patch.object(self.client_redis, 'transaction', transaction):
+            with mock.patch.object(buffer, 'write'):
+                buffer.flush()
+
+        self.assertFalse(self.client_redis.exists(delta))
+        self.assertEqual(
+            self.client_redis.hgetall(buffer.FLUSHING_DELTA_KEY % pain_id),
+            {'total': '1'}
+        )
+
+    def test_update_buffered(self):
+        reaction = self.react(self.pains[0], 'celebrate')
+
+        response = self.api.patch(
+            '/api/celebot/v1/reactions/%s/' % reaction['uuid'],
+            {'identifier': 'support'},
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+
+        pending = json.loads(self.client_redis.hget(
+            buffer.PENDING_KEY % self.pain_id(self.pains[0]), self.user.id
+        ))
+        self.assertEqual(pending['i'], 'support')
+
+    def test_list_buffered(self):
+        self.react(self.pains[0], 'celebrate')
+
+        response = self.api.get('/api/celebot/v1/reactions/', {'pain': self.pains[0]['uuid']})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 1)
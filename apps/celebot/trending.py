@@ -0,0 +1,185 @@
+import time
+from collections import defaultdict
+
+from django.apps import apps
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .conf import settings
+
+Reaction = apps.get_model('celebot', 'Reaction')
+Comment = apps.get_model('celebot', 'Comment')
+PainTrend = apps.get_model('celebot', 'PainTrend')
+
+STATE_KEY = 'celebot:trending:state'
+LOCK_KEY = 'celebot:trending:lock'
+
+# PainTrend columns, one read and one rebuilt by recompute()
+FIELDS = ('score_a', 'score_b',)
+
+# 2 ** 1000 still fit in a float
+MAX_EXPONENT = 1000
+
+
+def get_state():
+    """
+    :field is the column read, its scores are relative to :epoch.
+    :next is the column and epoch recompute() is filling, or None
+    """
+    state = cache.get(STATE_KEY)
+    if state is None:
+        state = {'field': FIELDS[0], 'epoch': time.time(), 'next': None}
+        cache.add(STATE_KEY, state, None)
+        state = cache.get(STATE_KEY, state)
+    return state
+
+
+def get_score_field():
+    return get_state()['field']
+
+
+def decayed(weight, timestamp, epoch):
+    """Weight at :timestamp expressed at :epoch"""
+    exponent = (timestamp - epoch) / settings.CELEBOT_TRENDING_HALF_LIFE
+    return weight * 2 ** min(exponent, MAX_EXPONENT)
+
+
+def record(pain_id, kind):
+    """
+    Incremental update on write, :kind is a reaction identifier
+    or 'comment'
+    """
+    weight = settings.CELEBOT_TRENDING_WEIGHTS.get(kind, 0)
+    if not weight:
+        return
+
+    now = time.time()
+    state = get_state()
+    scores = {state['field']: decayed(weight, now, state['epoch'])}
+
+    # the column being rebuilt must see it too
+    if state['next'] is not None:
+        rebuilt = state['next']
+        scores[rebuilt['field']] = decayed(weight, now, rebuilt['epoch'])
+
+    PainTrend.objects.bump(pain_id, scores)
+
+
+def record_many(events):
+    """
+    Same as record() for a batch, :events is list of (pain_id, kind).
+    One add_scores() per column whatever the number of pains
+    """
+    now = time.time()
+    state = get_state()
+
+    columns = [state]
+    if state['next'] is not None:
+        columns.append(state['next'])
+
+    for column in columns:
+        scores = defaultdict(float)
+        for pain_id, kind in events:
+            weight = settings.CELEBOT_TRENDING_WEIGHTS.get(kind, 0)
+            if weight:
+                scores[pain_id] += decayed(weight, now, column['epoch'])
+        PainTrend.objects.add_scores(column['field'], scores)
+
+
+def iter_pain_ids(lookup, chunk_size):
+    while True:
+        chunk = list(
+            PainTrend.objects
+            .filter(**lookup)
+            .order_by()
+            .values_list('pain_id', flat=True)[:chunk_size]
+        )
+        if not chunk:
+            break
+        yield chunk
+
+
+def recompute(chunk_size=2000):
+    """
+    Rebuild every score from the activity inside the window, relative
+    to now. Return number of pains ranked, None if a run is going on
+    """
+    # longer than any run, released at the end
+    if not cache.add(LOCK_KEY, 1, settings.CELEBOT_TRENDING_WINDOW):
+        return None
+
+    try:
+        return rebuild(chunk_size)
+    finally:
+        cache.delete(LOCK_KEY)
+
+
+def rebuild(chunk_size):
+    """
+    Scores go to the column not read, in short transactions of
+    :chunk_size pains, while record() writes both columns. Moving
+    the list to the new column is one cache write, no lock on the
+    rows is held during the scan of the window
+    """
+    state = get_state()
+    field = state['field']
+    next_field = FIELDS[1 - FIELDS.index(field)]
+
+    # a run that died left its column behind
+    if state['next'] is not None:
+        state = dict(state, next=None)
+        cache.set(STATE_KEY, state, None)
+
+    for chunk in iter_pain_ids({'%s__gt' % next_field: 0}, chunk_size):
+        PainTrend.objects.filter(pain_id__in=chunk).update(**{next_field: 0})
+
+    # activity after :until reach the new column through record(),
+    # a write racing this switch may be missed until the next run
+    now = timezone.now()
+    epoch = now.timestamp()
+    cache.set(STATE_KEY, dict(state, next={'field': next_field, 'epoch': epoch}), None)
+
+    since = now - timezone.timedelta(seconds=settings.CELEBOT_TRENDING_WINDOW)
+    weights = settings.CELEBOT_TRENDING_WEIGHTS
+    scores = defaultdict(float)
+
+    reactions = Reaction.objects \
+        .filter(create_at__gte=since, create_at__lt=now) \
+        .values_list('pain_id', 'identifier', 'create_at') \
+        .iterator(chunk_size=chunk_size)
+
+    for pain_id, identifier, create_at in reactions:
+        scores[pain_id] += decayed(
+            weights.get(identifier, 0),
+            create_at.timestamp(),
+            epoch
+        )
+
+    comments = Comment.objects \
+        .filter(create_at__gte=since, create_at__lt=now) \
+        .values_list('pain_id', 'create_at') \
+        .iterator(chunk_size=chunk_size)
+
+    for pain_id, create_at in comments:
+        scores[pain_id] += decayed(
+            weights.get('comment', 0),
+            create_at.timestamp(),
+            epoch
+        )
+
+    scores = [(k, v) for k, v in scores.items() if v > 0]
+    for i in range(0, len(scores), chunk_size):
+        with transaction.atomic():
+            PainTrend.objects.add_scores(next_field, dict(scores[i:i + chunk_size]))
+
+    # swap, incremental writes from now on are relative to this run
+    cache.set(STATE_KEY, {'field': next_field, 'epoch': epoch, 'next': None}, None)
+
+    # pains without activity inside the window, a row bumped
+    # meanwhile no longer match
+    lookup = {'%s__lte' % next_field: 0}
+    for chunk in iter_pain_ids(lookup, chunk_size):
+        PainTrend.objects.filter(pain_id__in=chunk, **lookup).delete()
+
+    return len(scores)
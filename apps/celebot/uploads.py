@@ -0,0 +1,310 @@
+"""
+Resumable uploads, a tus-like protocol
+
+A session is created with the declared length, then each PATCH appends
+its raw body at Upload-Offset. Bytes go from the request stream to a
+partial file block by block, the MIME type is sniffed once SNIFF_SIZE
+bytes arrived and the length is enforced before a byte past it is
+written. The body streams under a cache lock on the session and no
+database transaction, the offset is then moved only if no other
+request moved it. The last chunk streams the file to the storage while
+hashing it, then creates the Attachment (or sets Profile.picture) and
+deletes the session in one short transaction. Memory stays at one
+block whatever the file size
+"""
+import hashlib
+import mimetypes
+import os
+import uuid
+
+from django.apps import apps
+from django.core.cache import cache
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image
+
+from .conf import settings
+
+Attachment = apps.get_model('celebot', 'Attachment')
+UploadSession = apps.get_model('celebot', 'UploadSession')
+Profile = apps.get_model('person', 'Profile')
+
+TARGETS = UploadSession.Targets
+LOCK_KEY = 'celebot:upload:lock:%s'
+
+SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+    (b'%PDF-', 'application/pdf'),
+    (b'PK\x03\x04', 'application/zip'),
+)
+
+# bytes read by sniff_mime(), up to the WEBP tag of RIFF
+SNIFF_SIZE = 12
+
+
+class UploadError(ValueError):
+    """:code is offset, length, mime or locked"""
+
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+
+
+class HashingReader:
+    """File-like reader hashing what the storage reads from it"""
+
+    def __init__(self, file, size):
+        self.file = file
+        self.size = size
+        self.name = file.name
+        self.hash = hashlib.sha256()
+
+    def read(self, size=-1):
+        data = self.file.read(size)
+        self.hash.update(data)
+        return data
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        # storages rewind before reading, start over
+        if offset == 0 and whence == os.SEEK_SET:
+            self.hash = hashlib.sha256()
+        return self.file.seek(offset, whence)
+
+    def tell(self):
+        return self.file.tell()
+
+
+def sniff_mime(head, filename=None):
+    """
+    MIME type from the magic bytes, from :filename when none match
+    Return None when neither tell
+    """
+    for signature, mime in SIGNATURES:
+        if head.startswith(signature):
+            return mime
+
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+
+    if head[4:8] == b'ftyp':
+        return 'video/mp4'
+
+    if filename is None:
+        return None
+
+    guessed, _encoding = mimetypes.guess_type(filename)
+    return guessed or 'application/octet-stream'
+
+
+def check_mime(session, head):
+    allowed = settings.CELEBOT_UPLOAD_MIMES.get(session.target)
+
+    # restricted targets trust the content alone
+    mime = sniff_mime(head, None if allowed else session.filename)
+    if allowed and mime not in allowed:
+        raise UploadError('mime', "%s not accepted" % (mime or "Unknown type"))
+    return mime
+
+
+def verify_image(path, mime):
+    """The magic bytes of a picture are easy to forge, Pillow parse it"""
+    try:
+        with Image.open(path) as image:
+            format = image.format
+            image.verify()
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError):
+        raise UploadError('mime', "Not a valid image")
+
+    if Image.MIME.get(format) != mime:
+        raise UploadError('mime', "%s is not %s" % (format, mime))
+
+
+def get_temp_path(tempname):
+    directory = settings.CELEBOT_UPLOAD_TEMP_DIR
+    if not directory:
+        directory = os.path.join(settings.MEDIA_ROOT, 'uploads', 'partial')
+
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, tempname)
+
+
+def remove_temp(session):
+    try:
+        os.remove(get_temp_path(session.tempname))
+    except FileNotFoundError:
+        pass
+
+
+def create_session(user, target, filename, length, **fields):
+    max_size = settings.CELEBOT_UPLOAD_MAX_SIZE[target]
+    if length > max_size:
+        raise UploadError('length', "Upload-Length over %d bytes" % max_size)
+
+    session = UploadSession(
+        user=user,
+        target=target,
+        filename=os.path.basename(filename),
+        length=length,
+        tempname=uuid.uuid4().hex,
+        **fields
+    )
+
+    open(get_temp_path(session.tempname), 'wb').close()
+    session.save()
+    return session
+
+
+def lock(session):
+    if not cache.add(LOCK_KEY % session.uuid, 1, settings.CELEBOT_UPLOAD_LOCK_TIMEOUT):
+        raise UploadError('locked', "Another request is writing this upload")
+
+
+def unlock(session):
+    cache.delete(LOCK_KEY % session.uuid)
+
+
+def write(session, stream, offset):
+    """Stream :stream to the partial file at :offset, return the new offset"""
+    block_size = settings.CELEBOT_UPLOAD_BLOCK_SIZE
+    position = offset
+    head = b''
+
+    with open(get_temp_path(session.tempname), 'r+b') as file:
+        if not session.filemime:
+            head = file.read(min(position, SNIFF_SIZE))
+
+        # bytes of an interrupted request were never counted
+        file.seek(position)
+        file.truncate()
+
+        while True:
+            block = stream.read(block_size)
+            if not block:
+                break
+
+            if position + len(block) > session.length:
+                raise UploadError('length', "Body past Upload-Length")
+
+            if not session.filemime:
+                head += block[:SNIFF_SIZE]
+                if len(head) >= SNIFF_SIZE:
+                    session.filemime = check_mime(session, head)
+
+            file.write(block)
+            position += len(block)
+
+            # past the lock timeout another request could write too
+            if not cache.touch(LOCK_KEY % session.uuid, settings.CELEBOT_UPLOAD_LOCK_TIMEOUT):
+                raise UploadError('locked', "Upload lock lost")
+
+    # shorter than SNIFF_SIZE
+    if not session.filemime and position == session.length:
+        session.filemime = check_mime(session, head)
+    return position
+
+
+def append(session, stream, offset):
+    """
+    Append :stream at :offset, the session row is read without lock
+    Return the object created by the last chunk, else None
+    """
+    if offset != session.offset:
+        raise UploadError('offset', "Upload-Offset must be %d" % session.offset)
+
+    lock(session)
+    try:
+        position = write(session, stream, offset)
+
+        # moved or deleted meanwhile, the bytes are not counted
+        updated = UploadSession.objects \
+            .filter(id=session.id, offset=offset) \
+            .update(offset=position, filemime=session.filemime, update_at=timezone.now())
+        if not updated:
+            raise UploadError('offset', "Upload-Offset changed, read it again")
+
+        session.offset = position
+        if session.offset == session.length:
+            return complete(session)
+    finally:
+        unlock(session)
+    return None
+
+
+def complete(session):
+    """
+    Write the file to the storage then change the rows in one
+    transaction, a failed transaction drops the stored file
+    """
+    path = get_temp_path(session.tempname)
+    if session.target == TARGETS.PICTURE:
+        verify_image(path, session.filemime)
+
+    with open(path, 'rb') as file:
+        reader = HashingReader(file, session.length)
+        content = File(reader, name=session.filename)
+
+        if session.target == TARGETS.PICTURE:
+            instance = Profile.objects.get(user_id=session.user_id)
+            instance.picture.save(session.filename, content, save=False)
+            stored = instance.picture
+        else:
+            instance = Attachment(
+                content_type_id=session.content_type_id,
+                object_id=session.object_id,
+                label=session.label,
+                caption=session.caption,
+                filename=session.filename,
+                filesize=session.length,
+                filemime=session.filemime
+            )
+            instance.file.save(session.filename, content, save=False)
+            instance.filepath = instance.file.name
+            instance.filehash = reader.hash.hexdigest()
+            stored = instance.file
+
+    try:
+        with transaction.atomic():
+            if session.target == TARGETS.PICTURE:
+                picture = stored.name
+                instance = Profile.objects \
+                    .select_for_update() \
+                    .get(pk=instance.pk)
+                instance.picture = picture
+                instance.save(update_fields=('picture', 'update_at'))
+            else:
+                instance.save()
+            session.delete()
+    except Exception:
+        stored.storage.delete(stored.name)
+        raise
+
+    remove_temp(session)
+    return instance
+
+
+def abort(session):
+    """Delete the session, refused while a request writes it"""
+    lock(session)
+    try:
+        remove_temp(session)
+        session.delete()
+    finally:
+        unlock(session)
+
+
+def expire():
+    """Drop sessions idle for CELEBOT_UPLOAD_EXPIRE seconds"""
+    expired = timezone.now() - timezone.timedelta(
+        seconds=settings.CELEBOT_UPLOAD_EXPIRE
+    )
+    sessions = list(UploadSession.objects.filter(update_at__lt=expired))
+
+    for session in sessions:
+        remove_temp(session)
+
+    UploadSession.objects.filter(id__in=[x.id for x in sessions]).delete()
+    return len(sessions)
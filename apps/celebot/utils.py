@@ -1,9 +1,17 @@
 import pycountry
 
 from django.apps import apps
+from django.db import transaction
+from django.dispatch import Signal
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 
+# sent by bulk_delete_with_history(), the post_delete of many rows
+# with (sender, instances, using)
+post_bulk_delete = Signal()
+
+
 def is_model_registered(app_label, model_name):
     """
     Checks whether a given model is registered. This is used to only
@@ -30,3 +38,62 @@ def locales():
             langs.append((code, _(name)))
 
     return langs
+
+
+@transaction.atomic
+def bulk_create_with_history(objs, user=None, batch_size=None):
+    """
+    bulk_create objects of one model and their history rows
+    Backends not returning primary keys get them back by :uuid
+    """
+    if not objs:
+        return objs
+
+    model = type(objs[0])
+    model.objects.bulk_create(objs, batch_size=batch_size)
+
+    if objs[0].pk is None:
+        ids = model.objects \
+            .filter(uuid__in=[x.uuid for x in objs]) \
+            .values_list('uuid', 'pk')
+        ids = dict(ids)
+
+        for obj in objs:
+            obj.pk = ids[obj.uuid]
+
+    model.history.bulk_history_create(
+        objs,
+        batch_size=batch_size,
+        default_user=user
+    )
+    return objs
+
+
+@transaction.atomic
+def bulk_delete_with_history(queryset, user=None):
+    """
+    Delete the rows of :queryset with their history rows, without the
+    per row signals. post_bulk_delete receivers apply the side effects
+    once for every row. Return objects deleted
+    """
+    objs = list(queryset)
+    if not objs:
+        return objs
+
+    model = queryset.model
+    history = model.history.model
+    now = timezone.now()
+
+    history.objects.bulk_create([
+        history(
+            history_date=now,
+            history_user=user,
+            history_change_reason='',
+            history_type='-',
+            **{x.attname: getattr(obj, x.attname) for x in history.tracked_fields}
+        ) for obj in objs
+    ])
+
+    model.objects.filter(pk__in=[x.pk for x in objs])._raw_delete(queryset.db)
+    post_bulk_delete.send(sender=model, instances=objs, using=queryset.db)
+    return objs
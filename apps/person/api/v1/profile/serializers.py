@@ -4,6 +4,9 @@ from django.db import transaction
 
 from rest_framework import serializers
 
+from ....conf import settings
+from ....thumbnails import get_urls
+
 Profile = apps.get_model('person', 'Profile')
 
 
@@ -17,7 +20,16 @@ class BaseProfileSerializer(serializers.ModelSerializer):
 
 
 class RetrieveProfileSerializer(BaseProfileSerializer):
-    pass
+    # {size: {format: url}}, the picture until they are made
+    picture_thumbnails = serializers.SerializerMethodField(read_only=True)
+
+    def get_picture_thumbnails(self, instance):
+        return get_urls(
+            instance.picture_thumbnails,
+            instance.picture,
+            settings.PERSON_PICTURE_THUMBNAILS,
+            request=self.context.get('request')
+        )
 
 
 class UpdateProfileSerializer(BaseProfileSerializer):
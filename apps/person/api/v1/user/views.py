@@ -24,13 +24,14 @@ from .serializers import (
 )
 from ..profile.serializers import UpdateProfileSerializer
 from ..password.serializers import ChangePasswordSerializer
-from ....helpers import build_result_pagination
+from ....helpers import KeysetPagination, build_result_pagination
 
 UserModel = get_user_model()
 Profile = apps.get_model('person', 'Profile')
 
 # Define to avoid used ...().paginate__
 _PAGINATOR = LimitOffsetPagination()
+_KEYSET_PAGINATOR = KeysetPagination(ordering=('-date_joined', '-id'))
 
 
 class BaseViewSet(viewsets.ViewSet):
@@ -141,14 +142,19 @@ class UserViewSet(BaseViewSet):
 
     def list(self, request, format=None):
         queryset = self.queryset()
-        paginator = _PAGINATOR.paginate_queryset(queryset, request)
+        # ?cursor= switch to keyset pagination
+        pagination = _PAGINATOR
+        if _KEYSET_PAGINATOR.is_requested(request):
+            pagination = _KEYSET_PAGINATOR
+
+        paginator = pagination.paginate_queryset(queryset, request)
         serializer = ListUserSerializer(
             paginator,
             context=self.context,
             many=True
         )
 
-        results = build_result_pagination(self, _PAGINATOR, serializer)
+        results = build_result_pagination(self, pagination, serializer)
         return Response(results, status=response_status.HTTP_200_OK)
 
     def retrieve(self, request, hexid=None, format=None):
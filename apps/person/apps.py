@@ -1,5 +1,5 @@
-from django.apps import AppConfig
-from django.db.models.signals import post_save
+from django.apps import AppConfig, apps
+from django.db.models.signals import post_delete, post_save, pre_save
 
 
 class PersonConfig(AppConfig):
@@ -13,10 +13,17 @@ class PersonConfig(AppConfig):
         from .signals import (
             user_save_handler,
             group_save_handler,
-            securecode_save_handler
+            securecode_save_handler,
+            blob_release_save_handler,
+            blob_release_delete_handler,
+            blob_thumbnails_delete_handler,
+            picture_thumbnails_save_handler
         )
+        from .storage import get_blob_fields
 
         SecureCode = self.get_model('SecureCode')
+        Profile = self.get_model('Profile')
+        Blob = self.get_model('Blob')
 
         # User
         post_save.connect(user_save_handler, sender=settings.AUTH_USER_MODEL,
@@ -29,3 +36,20 @@ class PersonConfig(AppConfig):
         # Group
         post_save.connect(group_save_handler, sender=Group,
                           dispatch_uid='group_save_signal')
+
+        # Blob references, any model with a file in the blob storage
+        for model in apps.get_models():
+            if not get_blob_fields(model):
+                continue
+
+            label = model._meta.label_lower.replace('.', '_')
+            pre_save.connect(blob_release_save_handler, sender=model,
+                             dispatch_uid='%s_blob_save_signal' % label)
+            post_delete.connect(blob_release_delete_handler, sender=model,
+                                dispatch_uid='%s_blob_delete_signal' % label)
+
+        # Thumbnails
+        post_save.connect(picture_thumbnails_save_handler, sender=Profile,
+                          dispatch_uid='profile_thumbnails_save_signal')
+        post_delete.connect(blob_thumbnails_delete_handler, sender=Blob,
+                            dispatch_uid='blob_thumbnails_delete_signal')
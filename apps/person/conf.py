@@ -6,5 +6,20 @@ from appconf import AppConf
 class PersonAppConf(AppConf):
     VERIFICATION_FIELDS = ['email']
 
+    # Content-addressed storage, blobs without reference for
+    # BLOB_GRACE seconds are deleted
+    BLOB_GRACE = 60 * 60
+
+    # Profile.picture thumbnails, {size: (width, height, crop)}
+    PICTURE_THUMBNAILS = {
+        'small': (64, 64, True),
+        'medium': (256, 256, True),
+    }
+    THUMBNAIL_FORMATS = ('webp', 'jpeg',)
+    THUMBNAIL_QUALITY = 80
+    # sources decoding to more pixels are never resized, only JPEG
+    # is scaled down while decoding
+    THUMBNAIL_MAX_PIXELS = 40 * 1000 * 1000
+
     class Meta:
         perefix = 'person'
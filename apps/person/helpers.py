@@ -1,9 +1,18 @@
+import base64
+import json
+from datetime import date
+
 from django.contrib.auth.backends import ModelBackend
+from django.core.exceptions import ValidationError
 from django.db.models import Q
 from django.utils.translation import ugettext_lazy as _
 from django.contrib.auth import get_user_model
 from django.conf import settings
 
+from rest_framework.exceptions import NotFound
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
 UserModel = get_user_model()
 
 
@@ -64,11 +73,144 @@ class Pagination:
         self.show_full_result_count = True
 
 
+class KeysetPagination:
+    """
+    Cursor pagination keyed on :ordering, default (create_at, id)
+    Each page is a seek on an index, no COUNT(*) and no OFFSET scan
+    so deep pages cost the same as the first one.
+
+    Use ?cursor= (empty for the first page) to enable it. Exposes
+    the attributes used by build_result_pagination, :offset and
+    :count always None
+    """
+    cursor_query_param = 'cursor'
+    limit_query_param = 'limit'
+    default_limit = api_settings.PAGE_SIZE
+    max_limit = 200
+    ordering = ('-create_at', '-id')
+    invalid_cursor_message = _("Invalid cursor")
+
+    def __init__(self, ordering=None):
+        if ordering:
+            self.ordering = ordering
+
+        self.offset = None
+        self.count = None
+
+    def is_requested(self, request):
+        return self.cursor_query_param in request.query_params
+
+    def get_limit(self, request):
+        try:
+            limit = int(request.query_params[self.limit_query_param])
+            if limit <= 0:
+                raise ValueError()
+        except (KeyError, ValueError):
+            return self.default_limit
+        return min(limit, self.max_limit)
+
+    def encode_cursor(self, instance, reverse=False):
+        position = list()
+        for field in self.ordering:
+            value = getattr(instance, field.lstrip('-'))
+            if isinstance(value, date):
+                value = value.isoformat()
+            position.append(value)
+
+        data = json.dumps({'p': position, 'r': int(reverse)})
+        cursor = base64.urlsafe_b64encode(data.encode('ascii'))
+        return replace_query_param(
+            self.base_url,
+            self.cursor_query_param,
+            cursor.decode('ascii')
+        )
+
+    def decode_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None, False
+
+        try:
+            data = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+            position = data['p']
+            reverse = bool(data.get('r', 0))
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def get_ordering(self, reverse=False):
+        if not reverse:
+            return self.ordering
+
+        return tuple(
+            x[1:] if x.startswith('-') else '-%s' % x
+            for x in self.ordering
+        )
+
+    def get_seek_filter(self, position, reverse=False):
+        # (a < x) OR (a = x AND b < y) for descending ordering
+        seek = Q()
+        equal = dict()
+
+        for field, value in zip(self.get_ordering(reverse), position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            seek |= Q(**equal, **{'%s__%s' % (name, lookup): value})
+            equal[name] = value
+        return seek
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.limit = self.get_limit(request)
+
+        position, reverse = self.decode_cursor(request)
+        queryset = queryset.order_by(*self.get_ordering(reverse))
+
+        if position is not None:
+            try:
+                queryset = queryset.filter(
+                    self.get_seek_filter(position, reverse)
+                )
+            except (TypeError, ValueError, ValidationError):
+                raise NotFound(self.invalid_cursor_message)
+
+        # fetch one more row to know if there is a next page
+        results = list(queryset[:self.limit + 1])
+        has_more = len(results) > self.limit
+        results = results[:self.limit]
+
+        if reverse:
+            results.reverse()
+            self.has_previous = has_more
+            self.has_next = position is not None
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+
+        self.results = results
+        return results
+
+    def get_next_link(self):
+        if not self.has_next or not self.results:
+            return None
+        return self.encode_cursor(self.results[-1])
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.results:
+            return None
+        return self.encode_cursor(self.results[0], reverse=True)
+
+
 def build_result_pagination(self, _PAGINATOR, serializer):
     result = {
         'offset': _PAGINATOR.offset,
         'limit': _PAGINATOR.limit,
         'total': _PAGINATOR.count,
+        'total_kind': 'exact' if _PAGINATOR.count is not None else None,
         'previous': _PAGINATOR.get_previous_link(),
         'next': _PAGINATOR.get_next_link(),
         'results': serializer.data,
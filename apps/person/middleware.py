@@ -0,0 +1,49 @@
+from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+from django.contrib.auth.models import AnonymousUser
+
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+
+
+@database_sync_to_async
+def get_user(raw_token):
+    authentication = JWTAuthentication()
+
+    try:
+        validated_token = authentication.get_validated_token(raw_token)
+        return authentication.get_user(validated_token)
+    except (InvalidToken, TokenError):
+        return AnonymousUser()
+
+
+class JWTAuthMiddleware(BaseMiddleware):
+    """
+    Websocket auth with the same SimpleJWT access token as the API
+    Browsers can't set headers on websockets so ?token= is accepted
+    besides `Authorization: Bearer <token>`
+    """
+
+    async def __call__(self, scope, receive, send):
+        scope = dict(scope)
+        raw_token = self.get_raw_token(scope)
+
+        if raw_token:
+            scope['user'] = await get_user(raw_token)
+        else:
+            scope['user'] = AnonymousUser()
+        return await super().__call__(scope, receive, send)
+
+    def get_raw_token(self, scope):
+        query = parse_qs(scope.get('query_string', b'').decode('latin1'))
+        token = query.get('token')
+        if token:
+            return token[0]
+
+        headers = dict(scope.get('headers', []))
+        parts = headers.get(b'authorization', b'').decode('latin1').split()
+        if len(parts) == 2 and parts[0] == 'Bearer':
+            return parts[1]
+        return None
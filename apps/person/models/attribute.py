@@ -11,6 +11,8 @@ from django.core.validators import RegexValidator
 from django.utils.html import strip_tags
 from django.utils.safestring import mark_safe
 
+from ..storage import blob_storage
+
 
 class AbstractAttribute(models.Model):
     class Types(models.TextChoices):
@@ -194,15 +196,19 @@ class AbstractAttributeValue(models.Model):
     )
     value_file = models.FileField(
         upload_to='person/attribute/file',
+        storage=blob_storage,
         max_length=255,
         blank=True,
-        null=True
+        null=True,
+        db_index=True
     )
     value_image = models.ImageField(
         upload_to='person/attribute/image',
+        storage=blob_storage,
         max_length=255,
         blank=True,
-        null=True
+        null=True,
+        db_index=True
     )
 
     def _get_value(self):
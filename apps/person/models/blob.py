@@ -0,0 +1,47 @@
+from django.db import models
+from django.db.models import F
+from django.utils.translation import ugettext_lazy as _
+from django.utils import timezone
+
+
+class BlobQuerySet(models.query.QuerySet):
+    def take(self, hash):
+        """Take a reference on the blob of :hash, return its name or None"""
+        updated = self.filter(hash=hash) \
+            .update(refcount=F('refcount') + 1, update_at=timezone.now())
+
+        if not updated:
+            return None
+        return self.filter(hash=hash).values_list('name', flat=True).get()
+
+    def release(self, names):
+        """Drop a reference on the blobs of :names"""
+        return self.filter(name__in=names, refcount__gt=0) \
+            .update(refcount=F('refcount') - 1, update_at=timezone.now())
+
+
+class AbstractBlob(models.Model):
+    """
+    File content stored once by apps.person.storage, :refcount is
+    the number of file fields pointing to :name
+    """
+    hash = models.CharField(max_length=64, unique=True)
+    name = models.CharField(max_length=255, unique=True)
+    size = models.PositiveBigIntegerField()
+    refcount = models.PositiveIntegerField(default=0)
+    create_at = models.DateTimeField(auto_now_add=True)
+    update_at = models.DateTimeField(auto_now=True)
+
+    objects = BlobQuerySet.as_manager()
+
+    class Meta:
+        abstract = True
+        app_label = 'person'
+        verbose_name = _("Blob")
+        verbose_name_plural = _("Blobs")
+        indexes = [
+            models.Index(fields=['refcount', 'update_at']),
+        ]
+
+    def __str__(self):
+        return self.name
@@ -4,6 +4,7 @@ from ..utils import is_model_registered
 from .user import *
 from .attribute import *
 from .securecode import *
+from .blob import *
 
 __all__ = list()
 
@@ -61,3 +62,12 @@ if not is_model_registered('person', 'SecureCode'):
             pass
 
     __all__.append('SecureCode')
+
+
+# 6
+if not is_model_registered('person', 'Blob'):
+    class Blob(AbstractBlob):
+        class Meta(AbstractBlob.Meta):
+            pass
+
+    __all__.append('Blob')
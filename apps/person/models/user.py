@@ -11,6 +11,7 @@ from django.utils import timezone
 from django.contrib.auth.models import Group
 
 from ..conf import settings
+from ..storage import blob_storage
 from ..validators import validate_msisdn
 
 
@@ -159,9 +160,17 @@ class AbstractProfile(models.Model):
     about = models.TextField(blank=True, null=True)
     picture = models.ImageField(
         upload_to='images/person',
+        storage=blob_storage,
         max_length=500,
         null=True,
-        blank=True
+        blank=True,
+        db_index=True
+    )
+    # see apps.person.thumbnails
+    picture_thumbnails = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False
     )
     address = models.TextField(blank=True, null=True)
     latitude = models.FloatField(default=Decimal(0.0), db_index=True)
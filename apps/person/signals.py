@@ -7,7 +7,13 @@ from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django.conf import settings
 
-from .tasks import send_securecode_email, send_securecode_msisdn
+from . import thumbnails
+from .storage import get_blob_fields
+from .tasks import (
+    make_picture_thumbnails,
+    send_securecode_email,
+    send_securecode_msisdn
+)
 from .utils import get_users
 
 Profile = apps.get_model('person', 'Profile')
@@ -102,3 +108,44 @@ def securecode_save_handler(sender, instance, created, **kwargs):
 
         if oldest.exists():
             oldest.update(valid_until=timezone.now())
+
+
+def blob_release_save_handler(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Release the blobs the file fields stop pointing to"""
+    if raw or instance._state.adding:
+        return
+
+    fields = [
+        field for field in get_blob_fields(sender)
+        if update_fields is None or field.name in update_fields
+    ]
+    if not fields:
+        return
+
+    previous = sender._default_manager \
+        .filter(pk=instance.pk) \
+        .values_list(*[field.attname for field in fields]) \
+        .first()
+    if previous is None:
+        return
+
+    for field, name in zip(fields, previous):
+        if name and name != getattr(instance, field.attname).name:
+            field.storage.delete(name)
+
+
+def blob_release_delete_handler(sender, instance, **kwargs):
+    for field in get_blob_fields(sender):
+        name = getattr(instance, field.attname).name
+        if name:
+            field.storage.delete(name)
+
+
+def blob_thumbnails_delete_handler(sender, instance, **kwargs):
+    thumbnails.remove(instance.hash)
+
+
+def picture_thumbnails_save_handler(sender, instance, **kwargs):
+    picture = instance.picture
+    if picture and instance.picture_thumbnails.get('source') != picture.name:
+        transaction.on_commit(lambda: make_picture_thumbnails.delay(instance.id))
@@ -0,0 +1,209 @@
+"""
+Content-addressed file storage
+
+A file is stored once under the sha256 of its content, saving the same
+content again takes a reference on its Blob and writes nothing. delete()
+drops the reference, the file stays until collect() removes the blobs
+nobody reference anymore. Names from before the storage (upload_to
+paths) are served as is and never deleted
+"""
+import hashlib
+import os
+import uuid
+
+from django.apps import apps
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count
+from django.utils import timezone
+from django.utils.deconstruct import deconstructible
+
+from .conf import settings
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    prefix = 'blobs'
+
+    def get_available_name(self, name, max_length=None):
+        # the final name come from the content, see _save
+        return name
+
+    def get_blob_name(self, hash, name):
+        ext = os.path.splitext(name)[1].lower()[:10]
+        return '%s/%s/%s/%s%s' % (self.prefix, hash[:2], hash[2:4], hash, ext)
+
+    def get_hash(self, name):
+        """sha256 of the content of :name, None for names before the storage"""
+        if name and name.startswith(self.prefix + '/'):
+            return os.path.splitext(os.path.basename(name))[0]
+        return None
+
+    def hash_content(self, content):
+        digest = hashlib.sha256()
+        size = 0
+        for chunk in content.chunks():
+            digest.update(chunk)
+            size += len(chunk)
+        return digest.hexdigest(), size
+
+    def _save(self, name, content):
+        Blob = apps.get_model('person', 'Blob')
+        hash, size = self.hash_content(content)
+
+        blob_name = Blob.objects.take(hash)
+        if blob_name is not None:
+            return blob_name
+
+        blob_name = self.get_blob_name(hash, name)
+        try:
+            # the unique hash let one writer in, the others take a reference
+            with transaction.atomic():
+                Blob.objects.create(
+                    hash=hash,
+                    name=blob_name,
+                    size=size,
+                    refcount=1
+                )
+        except IntegrityError:
+            return Blob.objects.take(hash) or blob_name
+
+        # left by a rolled back save, same content, or cut short
+        # by a crash before the atomic write
+        if not self.exists(blob_name) or self.size(blob_name) != size:
+            content.seek(0)
+            self.write(blob_name, content)
+        return blob_name
+
+    def write(self, name, content):
+        """Write to a temporary name then rename, never a partial :name"""
+        path = self.path(name)
+        directory = os.path.dirname(path)
+        if self.directory_permissions_mode is not None:
+            os.makedirs(directory, self.directory_permissions_mode, exist_ok=True)
+        else:
+            os.makedirs(directory, exist_ok=True)
+
+        temp_path = '%s.%s.tmp' % (path, uuid.uuid4().hex)
+        try:
+            with open(temp_path, 'wb') as file:
+                for chunk in content.chunks():
+                    file.write(chunk)
+
+            if self.file_permissions_mode is not None:
+                os.chmod(temp_path, self.file_permissions_mode)
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def delete(self, name):
+        if name and name.startswith(self.prefix + '/'):
+            Blob = apps.get_model('person', 'Blob')
+            Blob.objects.release([name])
+
+    def remove(self, name):
+        """Delete the file itself, see collect()"""
+        super().delete(name)
+
+
+blob_storage = ContentAddressedStorage()
+
+
+def get_blob_fields(model):
+    return [
+        field for field in model._meta.concrete_fields
+        if isinstance(field, models.FileField)
+        and isinstance(field.storage, ContentAddressedStorage)
+    ]
+
+
+def get_references(names):
+    """
+    Number of file fields pointing to each of :names, the blob
+    fields are indexed
+    """
+    references = dict()
+    for model in apps.get_models():
+        for field in get_blob_fields(model):
+            counts = model._default_manager \
+                .filter(**{'%s__in' % field.attname: names}) \
+                .values(field.attname) \
+                .order_by() \
+                .annotate(count=Count('pk')) \
+                .values_list(field.attname, 'count')
+
+            for name, count in counts:
+                references[name] = references.get(name, 0) + count
+    return references
+
+
+def recount(chunk_size=500):
+    """
+    Set refcount of every blob from the file fields, repair what
+    writes skipping the signals (update(), raw SQL) left behind.
+    Return number of blobs changed
+    """
+    Blob = apps.get_model('person', 'Blob')
+    blob_ids = list(Blob.objects.order_by('id').values_list('id', flat=True))
+    changed = 0
+
+    for i in range(0, len(blob_ids), chunk_size):
+        with transaction.atomic():
+            blobs = Blob.objects \
+                .select_for_update() \
+                .filter(id__in=blob_ids[i:i + chunk_size]) \
+                .values_list('id', 'name', 'refcount')
+            blobs = list(blobs)
+            references = get_references([x[1] for x in blobs])
+
+            for blob_id, name, refcount in blobs:
+                count = references.get(name, 0)
+                if count != refcount:
+                    Blob.objects.filter(id=blob_id).update(refcount=count)
+                    changed += 1
+    return changed
+
+
+def collect(chunk_size=500):
+    """
+    Delete blobs without reference for PERSON_BLOB_GRACE seconds,
+    a chunk per transaction. Blobs still referenced get their
+    refcount repaired. Return number of blobs deleted
+    """
+    Blob = apps.get_model('person', 'Blob')
+    until = timezone.now() - timezone.timedelta(
+        seconds=settings.PERSON_BLOB_GRACE
+    )
+    deleted = 0
+
+    while True:
+        with transaction.atomic():
+            blobs = list(
+                Blob.objects
+                .select_for_update(skip_locked=True)
+                .filter(refcount=0, update_at__lt=until)
+                .order_by('update_at')[:chunk_size]
+            )
+            if not blobs:
+                break
+
+            references = get_references([x.name for x in blobs])
+            orphans = list()
+
+            for blob in blobs:
+                count = references.get(blob.name, 0)
+                if count:
+                    Blob.objects.filter(id=blob.id).update(refcount=count)
+                else:
+                    orphans.append(blob)
+
+            Blob.objects.filter(id__in=[x.id for x in orphans]).delete()
+            for blob in orphans:
+                blob_storage.remove(blob.name)
+            deleted += len(orphans)
+
+        if len(blobs) < chunk_size:
+            break
+    return deleted
@@ -2,12 +2,16 @@ import logging
 import smtplib
 import requests
 
+from django.apps import apps
 from django.utils.translation import ugettext_lazy as _
 from django.core.mail import BadHeaderError, EmailMultiAlternatives
 
 # Celery config
 from celery import shared_task
 
+from . import storage, thumbnails
+from .conf import settings
+
 
 @shared_task
 def send_securecode_email(data):
@@ -95,3 +99,26 @@ def send_securecode_msisdn(data):
 
     r = requests.get(url, params=payload)
     logging.info(str(r.status_code))
+
+
+@shared_task
+def collect_blobs(full=False):
+    if full:
+        changed = storage.recount()
+        if changed:
+            logging.warning('Blob refcounts drifted for %d blobs' % changed)
+
+    deleted = storage.collect()
+    if deleted:
+        logging.info('Collected %d orphan blobs' % deleted)
+
+
+@shared_task
+def make_picture_thumbnails(profile_id):
+    thumbnails.update(
+        apps.get_model('person', 'Profile'),
+        profile_id,
+        'picture',
+        'picture_thumbnails',
+        settings.PERSON_PICTURE_THUMBNAILS
+    )
@@ -1,3 +1,100 @@
-from django.test import TestCase
+import io
+import shutil
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from PIL import Image
+
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
+
+from . import thumbnails
+
+Profile = apps.get_model('person', 'Profile')
+
+SIZES = {'small': (16, 16, True)}
+
+
+def image_data(size, format, mode='RGB', color='red'):
+    data = io.BytesIO()
+    Image.new(mode, size, color).save(data, format)
+    return data.getvalue()
+
+
+class ThumbnailTest(TestCase):
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+
+        override = override_settings(MEDIA_ROOT=media)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        user = get_user_model().objects.create(username='thumbnail', email='thumbnail@example.com')
+        self.profile = user.profile
+
+    def set_picture(self, content, name='picture.png'):
+        self.profile.picture.save(name, ContentFile(content))
+
+    def update(self):
+        return thumbnails.update(Profile, self.profile.pk, 'picture', 'picture_thumbnails', SIZES)
+
+    def test_jpeg_draft(self):
+        source = io.BytesIO(image_data((2000, 1000), 'JPEG'))
+
+        # scaled down by libjpeg, still covering the box
+        image = thumbnails.open_image(source, (64, 64))
+        self.assertLess(image.size[0], 2000)
+        self.assertGreaterEqual(min(image.size), 64)
+
+    @override_settings(PERSON_THUMBNAIL_MAX_PIXELS=100)
+    def test_max_pixels(self):
+        with self.assertRaises(ValueError):
+            thumbnails.open_image(io.BytesIO(image_data((20, 20), 'PNG')), (16, 16))
+
+        # stay on the original
+        self.set_picture(image_data((20, 20), 'PNG'))
+        self.assertTrue(self.update())
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.picture_thumbnails['sizes'], {})
+
+    def test_jpeg_flatten_alpha(self):
+        source = io.BytesIO(image_data((8, 8), 'PNG', mode='RGBA', color=(0, 0, 0, 0)))
+        image = thumbnails.open_image(source, (8, 8))
+        self.assertEqual(image.mode, 'RGBA')
+
+        encoded = Image.open(io.BytesIO(thumbnails.encode(image, 'jpeg')))
+        self.assertEqual(encoded.mode, 'RGB')
+        self.assertGreater(min(encoded.getpixel((4, 4))), 250)
+
+    def test_update(self):
+        self.set_picture(image_data((40, 20), 'PNG'))
+        self.assertTrue(self.update())
+
+        self.profile.refresh_from_db()
+        data = self.profile.picture_thumbnails
+        self.assertEqual(data['source'], self.profile.picture.name)
+        self.assertIn('jpeg', data['sizes']['small'])
+
+        urls = thumbnails.get_urls(data, self.profile.picture, SIZES)
+        self.assertNotEqual(urls['small']['jpeg'], self.profile.picture.url)
+
+        # made already
+        self.assertFalse(self.update())
+
+    def test_replaced_while_resizing(self):
+        self.set_picture(image_data((40, 20), 'PNG'))
+        make = thumbnails.make
+
+        def replacing(file, sizes):
+            data = make(file, sizes)
+            Profile.objects.filter(pk=self.profile.pk).update(picture='other.png')
+            return data
+
+        with mock.patch.object(thumbnails, 'make', replacing):
+            self.assertFalse(self.update())
+
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.picture_thumbnails, {})
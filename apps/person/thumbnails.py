@@ -0,0 +1,215 @@
+"""
+Thumbnails of uploaded images, made by Celery after the upload
+
+Thumbnails are named after the sha256 of the source and their size, so
+the same content is resized once whatever the number of copies. JPEG
+sources are decoded with Image.draft(), libjpeg scales down while
+decoding and the memory stays near the largest thumbnail. Other
+formats decode whole, over PERSON_THUMBNAIL_MAX_PIXELS they are not
+decoded at all and keep the original
+
+A model keeps {'source': name, 'sizes': {size: {format: name}}} in a
+JSONField, get_urls() answer the original until the source is the
+current file. :sizes are {size: (width, height, crop)}
+"""
+import hashlib
+import io
+import logging
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps, features
+
+from .conf import settings
+from .storage import ContentAddressedStorage
+
+FORMATS = {
+    'webp': 'WEBP',
+    'jpeg': 'JPEG',
+}
+
+
+def get_formats():
+    formats = settings.PERSON_THUMBNAIL_FORMATS
+    if not features.check('webp'):
+        formats = [x for x in formats if x != 'webp']
+    return formats
+
+
+def get_hash(file):
+    if isinstance(file.storage, ContentAddressedStorage):
+        hash = file.storage.get_hash(file.name)
+        if hash:
+            return hash
+
+    digest = hashlib.sha256()
+    for chunk in file.chunks():
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_directory(hash):
+    return 'thumbs/%s/%s' % (hash[:2], hash)
+
+
+def get_name(hash, width, height, crop, format):
+    return '%s/%dx%d%s.%s' % (
+        get_directory(hash), width, height, 'c' if crop else '', format
+    )
+
+
+def open_image(file, box):
+    image = Image.open(file)
+    # JPEG only, smallest scale still covering :box
+    image.draft('RGB', box)
+
+    # size known from the header, nothing decoded yet
+    width, height = image.size
+    if width * height > settings.PERSON_THUMBNAIL_MAX_PIXELS:
+        raise ValueError('%dx%d over PERSON_THUMBNAIL_MAX_PIXELS' % (width, height))
+
+    image.load()
+    image = ImageOps.exif_transpose(image)
+
+    transparent = image.mode in ('RGBA', 'LA') \
+        or (image.mode == 'P' and 'transparency' in image.info)
+    mode = 'RGBA' if transparent else 'RGB'
+    if image.mode != mode:
+        image = image.convert(mode)
+    return image
+
+
+def resize(image, width, height, crop):
+    if crop:
+        return ImageOps.fit(image, (width, height), Image.LANCZOS)
+
+    image = image.copy()
+    image.thumbnail((width, height), Image.LANCZOS)
+    return image
+
+
+def encode(image, format):
+    if format == 'jpeg' and image.mode == 'RGBA':
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+
+    buffer = io.BytesIO()
+    image.save(
+        buffer,
+        FORMATS[format],
+        quality=settings.PERSON_THUMBNAIL_QUALITY,
+        optimize=True
+    )
+    return buffer.getvalue()
+
+
+def make(file, sizes):
+    """Thumbnails of :file not made yet, return the data to keep"""
+    hash = get_hash(file)
+    formats = get_formats()
+    made = dict()
+    missing = dict()
+
+    for size, (width, height, crop) in sizes.items():
+        made[size] = dict()
+        for format in formats:
+            name = get_name(hash, width, height, crop, format)
+            if default_storage.exists(name):
+                made[size][format] = name
+            else:
+                missing.setdefault(size, list()).append(format)
+
+    if missing:
+        box = max(max(sizes[x][:2]) for x in missing)
+        file.open('rb')
+        try:
+            image = open_image(file, (box, box))
+        finally:
+            file.close()
+
+        for size, missing_formats in missing.items():
+            width, height, crop = sizes[size]
+            thumbnail = resize(image, width, height, crop)
+
+            for format in missing_formats:
+                name = get_name(hash, width, height, crop, format)
+                content = ContentFile(encode(thumbnail, format))
+                made[size][format] = default_storage.save(name, content)
+
+    return {'source': file.name, 'sizes': made}
+
+
+def update(model, pk, file_field, data_field, sizes):
+    """
+    Make the thumbnails of :file_field and keep them in :data_field
+    of the :model instance :pk. Return True when saved
+    """
+    instance = model._default_manager.filter(pk=pk).first()
+    if instance is None:
+        return False
+
+    file = getattr(instance, file_field)
+    if not file or getattr(instance, data_field).get('source') == file.name:
+        return False
+
+    try:
+        data = make(file, sizes)
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        # not an image Pillow can read, stay on the original
+        logging.warning('Thumbnails of %s failed: %s' % (file.name, e))
+        data = {'source': file.name, 'sizes': {}}
+
+    with transaction.atomic():
+        instance = model._default_manager \
+            .select_for_update() \
+            .filter(pk=pk) \
+            .first()
+
+        # replaced while resizing, the new file has its own task
+        if instance is None or getattr(instance, file_field).name != data['source']:
+            return False
+
+        setattr(instance, data_field, data)
+        instance.save(update_fields=[data_field])
+    return True
+
+
+def remove(hash):
+    """Delete the thumbnails of the content :hash"""
+    directory = get_directory(hash)
+    try:
+        _directories, names = default_storage.listdir(directory)
+    except FileNotFoundError:
+        return
+
+    for name in names:
+        default_storage.delete('%s/%s' % (directory, name))
+
+
+def get_urls(data, file, sizes, request=None):
+    """{size: {format: url}}, the original for the ones not made yet"""
+    if not file:
+        return None
+
+    made = dict()
+    if data.get('source') == file.name:
+        made = data.get('sizes', {})
+
+    def build_url(url):
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
+
+    original = build_url(file.url)
+    urls = dict()
+
+    for size in sizes:
+        names = made.get(size, {})
+        urls[size] = {
+            format: build_url(default_storage.url(names[format]))
+            if format in names else original
+            for format in get_formats()
+        }
+    return urls
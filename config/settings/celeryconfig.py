@@ -4,3 +4,54 @@ broker_url = settings.REDIS_URL
 broker_transport_options = {'visibility_timeout': 3600}
 result_backend = settings.REDIS_URL
 task_serializer = 'json'
+
+# Periodic tasks, run with `celery -A config beat`
+beat_schedule = {
+    'celebot-recompute-trending': {
+        'task': 'apps.celebot.tasks.recompute_trending',
+        'schedule': 60 * 10,
+    },
+    'celebot-check-reaction-stats': {
+        'task': 'apps.celebot.tasks.check_reaction_stats',
+        'schedule': 60 * 15,
+    },
+    'celebot-check-reaction-stats-full': {
+        'task': 'apps.celebot.tasks.check_reaction_stats',
+        'schedule': 60 * 60 * 24,
+        'kwargs': {'full': True},
+    },
+    'celebot-flush-reaction-buffer': {
+        'task': 'apps.celebot.tasks.flush_reaction_buffer',
+        'schedule': 5,
+    },
+    'celebot-rollup-reactions': {
+        'task': 'apps.celebot.tasks.rollup_reactions',
+        'schedule': 60 * 5,
+    },
+    'celebot-update-tag-cooccurrence': {
+        'task': 'apps.celebot.tasks.update_tag_cooccurrence',
+        'schedule': 60 * 5,
+    },
+    'celebot-reconcile-comment-counts': {
+        'task': 'apps.celebot.tasks.reconcile_comment_counts',
+        'schedule': 60 * 15,
+    },
+    'celebot-reconcile-comment-counts-full': {
+        'task': 'apps.celebot.tasks.reconcile_comment_counts',
+        'schedule': 60 * 60 * 24,
+        'kwargs': {'full': True},
+    },
+    'celebot-expire-uploads': {
+        'task': 'apps.celebot.tasks.expire_uploads',
+        'schedule': 60 * 60,
+    },
+    'person-collect-blobs': {
+        'task': 'apps.person.tasks.collect_blobs',
+        'schedule': 60 * 60,
+    },
+    'person-collect-blobs-full': {
+        'task': 'apps.person.tasks.collect_blobs',
+        'schedule': 60 * 60 * 24,
+        'kwargs': {'full': True},
+    },
+}